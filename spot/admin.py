@@ -1,7 +1,6 @@
 # Module imports (haut de fichier)
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.utils import timezone
 from django.http import HttpResponseRedirect
 from django.contrib import messages
 from .models import (
@@ -11,6 +10,7 @@ from .models import (
     AdvisorySession, ContactRequest, AdvisoryArticle, CaseStudy,
     ServiceCategory, ServiceItem, CoverageRequest, CoverageAttachment
 )
+from .services import allocation, moderation
 
 
 @admin.register(User)
@@ -58,19 +58,18 @@ class CampaignAdmin(admin.ModelAdmin):
     )
     
     def approve_campaigns(self, request, queryset):
-        updated = 0
-        for campaign in queryset:
-            if campaign.status == 'pending':
-                campaign.status = 'approved'
-                campaign.approved_by = request.user
-                campaign.approved_at = timezone.now()
-                campaign.save()
-                updated += 1
+        approved, created, refused = moderation.approve_campaigns(queryset, request.user)
         
-        if updated == 0:
+        if not approved:
             self.message_user(request, "Aucune campagne n'a été approuvée. Vérifiez que les campagnes sont en attente.", messages.WARNING)
         else:
-            self.message_user(request, f"{updated} campagne(s) approuvée(s) avec succès.", messages.SUCCESS)
+            self.message_user(request, f"{len(approved)} campagne(s) approuvée(s) avec succès, {len(created)} programmation(s) créée(s).", messages.SUCCESS)
+            if refused:
+                self.message_user(
+                    request,
+                    f"{len(refused)} diffusion(s) non placée(s): {allocation.describe_refusals(refused)}.",
+                    messages.WARNING,
+                )
     approve_campaigns.short_description = "Approuver les campagnes sélectionnées"
     
     def reject_campaigns(self, request, queryset):
@@ -105,14 +104,7 @@ class SpotAdmin(admin.ModelAdmin):
     )
     
     def approve_spots(self, request, queryset):
-        updated = 0
-        for spot in queryset:
-            if spot.status == 'pending':
-                spot.status = 'approved'
-                spot.approved_by = request.user
-                spot.approved_at = timezone.now()
-                spot.save()
-                updated += 1
+        updated = moderation.approve_spots(queryset, request.user)
         
         if updated == 0:
             self.message_user(request, "Aucun spot n'a été approuvé. Vérifiez que les spots sont en attente.", messages.WARNING)
@@ -137,7 +129,7 @@ class SpotScheduleAdmin(admin.ModelAdmin):
 
 @admin.register(TimeSlot)
 class TimeSlotAdmin(admin.ModelAdmin):
-    list_display = ('name', 'start_time', 'end_time', 'price_multiplier', 'is_prime', 'is_active')
+    list_display = ('name', 'start_time', 'end_time', 'price_multiplier', 'ad_capacity_seconds', 'is_prime', 'is_active')
     list_filter = ('is_active',)
     ordering = ('start_time',)
 
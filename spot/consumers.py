@@ -1,9 +1,11 @@
 import json
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from .models import Campaign, Spot, CorrespondenceThread, SpotSchedule
-from django.utils import timezone
+from django.core.exceptions import ValidationError
+from .models import Campaign, Spot, CorrespondenceThread
+from .services import correspondence, planning
 
 
 class AdminPendingCountsConsumer(AsyncWebsocketConsumer):
@@ -40,7 +42,13 @@ class AdminPendingCountsConsumer(AsyncWebsocketConsumer):
 
 
 class PlanningUpdatesConsumer(AsyncWebsocketConsumer):
-    group_name = 'planning_updates'
+    """Planning temps réel, par jour.
+
+    Le client envoie `{"type": "subscribe", "dates": [...], "since": <seq>}`.
+    Avec `since`, il reçoit les changements manqués (`delta`); sinon, ou si
+    l'écart est trop grand, l'instantané partagé des jours (`snapshot`). Les
+    changements suivants arrivent par lots du relais, sous la même forme `delta`.
+    """
 
     async def connect(self):
         user = self.scope.get('user')
@@ -51,41 +59,149 @@ class PlanningUpdatesConsumer(AsyncWebsocketConsumer):
         if not hasattr(user, 'is_diffuser') or not callable(user.is_diffuser) or not user.is_diffuser():
             await self.close(code=4003)
             return
+        self.groups_joined = set()
+        self.recent_seqs = deque(maxlen=1024)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'groups_joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if data.get('type') != 'subscribe':
+            return
+        dates = planning.parse_dates(data.get('dates'))
+        wanted = {planning.group_for(d) for d in dates}
+        for group in self.groups_joined - wanted:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in wanted - self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined = wanted
+
+        since = data.get('since')
+        if isinstance(since, int) and since >= 0:
+            events = await self._events_since(since, dates)
+            if events is not None:
+                self.recent_seqs.extend(e['seq'] for e in events)
+                last = events[-1]['seq'] if events else since
+                await self.send_json({'type': 'delta', 'seq': last, 'events': events})
+                return
+        seq, items = await self._get_snapshot(dates)
+        await self.send_json({'type': 'snapshot', 'seq': seq, 'dates': [d.isoformat() for d in dates], 'items': items})
+
+    async def planning_batch(self, event):
+        # Un déplacement est publié aux deux jours, et le relais peut republier
+        # un lot après une reprise: chaque numéro n'est envoyé qu'une fois
+        fresh = [e for e in event.get('events') or () if e.get('seq') not in self.recent_seqs]
+        if not fresh:
+            return
+        self.recent_seqs.extend(e['seq'] for e in fresh)
+        await self.send_json({'type': 'delta', 'seq': fresh[-1]['seq'], 'events': fresh})
+
+    async def send_json(self, data):
+        await self.send(text_data=json.dumps(data))
+
+    @database_sync_to_async
+    def _get_snapshot(self, dates):
+        return planning.snapshot(dates)
+
+    @database_sync_to_async
+    def _events_since(self, since, dates):
+        return planning.events_since(since, dates)
+
+
+class CorrespondenceConsumer(AsyncWebsocketConsumer):
+    """Discussion de correspondance en temps réel (groupe par discussion).
+
+    Le client envoie `{"type": "message", "content": ...}`, `{"type": "typing"}`
+    ou `{"type": "read", "message_id": ...}`. Les messages passent par
+    `correspondence.post_message` (mêmes règles et notifications que la page)
+    et reviennent à tous les participants sous `{"type": "message", ...}`.
+    Les pièces jointes restent envoyées par le formulaire de la page.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or isinstance(user, AnonymousUser) or not getattr(user, 'is_authenticated', False):
+            await self.close(code=4001)
+            return
+        self.thread = await self._get_thread(self.scope['url_route']['kwargs']['thread_id'])
+        if self.thread is None or not correspondence.can_access(user, self.thread):
+            await self.close(code=4003)
+            return
+        self.user = user
+        self.group_name = correspondence.group_for(self.thread.id)
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
-        snapshot = await self._get_snapshot()
-        await self.send_json({'type': 'snapshot', 'items': snapshot})
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    async def planning_update(self, event):
-        # event: { 'action': 'upsert'|'remove', 'item': {...} }
-        await self.send_json({'type': 'update', 'action': event.get('action'), 'item': event.get('item')})
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        kind = data.get('type')
+        if kind == 'message':
+            content = str(data.get('content') or '').strip()
+            if not content:
+                await self.send_json({'type': 'error', 'error': 'empty_message'})
+                return
+            limit = await self._post(content)
+            if limit:
+                await self.send_json({'type': 'error', 'error': 'reply_delay', 'next_allowed_at': limit.isoformat()})
+        elif kind == 'typing':
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'correspondence_typing',
+                'user_id': self.user.id,
+                'author': self.user.username,
+            })
+        elif kind == 'read':
+            await self._mark_read()
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'correspondence_read',
+                'user_id': self.user.id,
+                'message_id': str(data.get('message_id') or ''),
+            })
+
+    async def correspondence_message(self, event):
+        await self.send_json({'type': 'message', 'status': event.get('status'), 'message': event.get('message')})
+
+    async def correspondence_typing(self, event):
+        if event.get('user_id') != self.user.id:
+            await self.send_json({'type': 'typing', 'author': event.get('author')})
+
+    async def correspondence_read(self, event):
+        if event.get('user_id') != self.user.id:
+            await self.send_json({'type': 'read', 'message_id': event.get('message_id')})
 
     async def send_json(self, data):
         await self.send(text_data=json.dumps(data))
 
     @database_sync_to_async
-    def _get_snapshot(self):
-        # Retourner un snapshot des prochains créneaux (limité)
-        today = timezone.localdate()
-        qs = SpotSchedule.objects.select_related('spot', 'time_slot').filter(
-            broadcast_date__gte=today
-        ).order_by('broadcast_date', 'broadcast_time')[:300]
-
-        def item(s):
-            return {
-                'id': str(s.id),
-                'date_iso': s.broadcast_date.isoformat(),
-                'time_iso': s.broadcast_time.strftime('%H:%M:%S'),
-                'date_str': s.broadcast_date.strftime('%d/%m/%Y'),
-                'time_str': s.broadcast_time.strftime('%H:%M'),
-                'title': getattr(s.spot, 'title', ''),
-                'client': getattr(getattr(s.spot, 'campaign', None), 'client', None) and getattr(s.spot.campaign.client, 'username', '') or '',
-                'media_type': getattr(s.spot, 'media_type', ''),
-                'duration_seconds': getattr(s.spot, 'duration_seconds', None),
-                'is_broadcasted': bool(getattr(s, 'is_broadcasted', False)),
-            }
-
-        return [item(s) for s in qs]
\ No newline at end of file
+    def _get_thread(self, thread_id):
+        try:
+            return CorrespondenceThread.objects.select_related('last_message', 'client', 'related_campaign').filter(id=thread_id).first()
+        except (ValidationError, ValueError):
+            # La route accepte `[0-9a-f-]+`, pas seulement des UUID
+            return None
+
+    @database_sync_to_async
+    def _post(self, content):
+        """Enregistre le message; renvoie l'heure de relance possible si refusé."""
+        thread = CorrespondenceThread.objects.select_related('last_message', 'client', 'related_campaign').get(id=self.thread.id)
+        limit = correspondence.next_reply_at(thread, self.user)
+        if limit:
+            return limit
+        correspondence.post_message(thread, self.user, content)
+        return None
+
+    @database_sync_to_async
+    def _mark_read(self):
+        return correspondence.mark_read(self.thread, self.user)
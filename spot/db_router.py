@@ -0,0 +1,101 @@
+"""
+Routage des lectures vers une réplique (`DATABASES['replica']`).
+
+Seul le travail explicitement marqué en lecture seule va sur la réplique:
+les vues décorées par `read_only` (tableaux de bord, bilans, exports) et
+les blocs `with reading():`. Tout le reste, écritures comprises, reste sur
+`default`; une lecture faite dans une transaction ouverte sur `default`
+(verrous `select_for_update` du planning) y reste aussi.
+
+Lecture de ses propres écritures: après une requête modifiante (POST...),
+`ReplicaStickinessMiddleware` pose un cookie de courte durée
+(`SPOT_REPLICA_STICKY_SECONDS`); tant qu'il est présent, les requêtes de cet
+utilisateur lisent sur `default` malgré le marquage, le temps que la
+réplique rattrape son retard.
+
+Sans alias `replica` configuré, rien ne change.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'spot_rw'
+# Sessions: écrites à chaque requête, toujours lues sur la base principale
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_reading = ContextVar('spot_replica_reading', default=False)
+_pinned = ContextVar('spot_replica_pinned', default=False)
+
+
+def configured():
+    return REPLICA in settings.DATABASES
+
+
+def sticky_seconds():
+    return int(getattr(settings, 'SPOT_REPLICA_STICKY_SECONDS', 15))
+
+
+def alias():
+    """Base où lire maintenant: la réplique dans un contexte de lecture seule, sinon `default`."""
+    if not (_reading.get() and configured()) or _pinned.get():
+        return DEFAULT_DB_ALIAS
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return REPLICA
+
+
+@contextmanager
+def reading():
+    """Lectures du bloc routées vers la réplique."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+@contextmanager
+def pinned(value=True):
+    """Lectures du bloc forcées sur `default` (lecture de ses propres écritures)."""
+    token = _pinned.set(value)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def read_only(view):
+    """Vue en lecture seule: ses requêtes de lecture vont sur la réplique."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def on_replica(queryset):
+    """Queryset explicitement lu sur la réplique (si configurée et pas de collage)."""
+    with reading():
+        return queryset.using(alias())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Même données des deux côtés
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
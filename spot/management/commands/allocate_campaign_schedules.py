@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = "Répartit les campagnes approuvées dans la grille de diffusion (heures dans les créneaux préférés)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Premier jour (YYYY-MM-DD), par défaut aujourd\'hui')
+        parser.add_argument('--days', type=int, default=7, help='Nombre de jours à couvrir (défaut: 7)')
+        parser.add_argument('--campaign', action='append', default=[], help='Identifiant de campagne (répétable)')
+        parser.add_argument('--dry-run', action='store_true', help='Calculer sans rien enregistrer')
+
+    def handle(self, *args, **options):
+        from spot.models import Campaign
+        from spot.services import allocation
+
+        start = parse_date(options['start']) if options.get('start') else timezone.localdate()
+        if not start:
+            raise CommandError('Date invalide (format attendu: YYYY-MM-DD)')
+        if options['days'] < 1:
+            raise CommandError('--days doit être positif')
+        end = start + datetime.timedelta(days=options['days'] - 1)
+
+        qs = Campaign.objects.filter(status='approved', start_date__lte=end, end_date__gte=start)
+        if options['campaign']:
+            qs = qs.filter(id__in=options['campaign'])
+        campaigns = allocation.load_campaigns(qs)
+
+        run = allocation.allocate if options['dry_run'] else allocation.schedule
+        schedules, refused = run(campaigns, start, end)
+        for item in refused:
+            self.stdout.write(f"{item['date']} {item['time_slot']}: {item['campaign_title']} ({item['reason']})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Campaigns={len(campaigns)} Created={len(schedules)} Refused={len(refused)}{' (dry-run)' if options['dry_run'] else ''}"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Archive (JSONL compressé) puis supprime les lignes expirées des tables à forte croissance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', default=None, help='Politique à appliquer (répétable; défaut: toutes)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Lignes par lot (une transaction par lot)')
+        parser.add_argument('--no-archive', action='store_true', help='Supprimer sans archiver')
+        parser.add_argument('--dry-run', action='store_true', help='Compter les lignes expirées sans rien modifier')
+
+    def handle(self, *args, **options):
+        from spot.services import retention
+
+        names = options.get('policy')
+        unknown = sorted(set(names or []) - set(retention.policies()))
+        if unknown:
+            raise CommandError(f"Politique inconnue: {', '.join(unknown)}")
+        report = retention.run(
+            names=names,
+            batch=max(1, int(options.get('batch_size') or 1000)),
+            archive=not options.get('no_archive'),
+            dry_run=options.get('dry_run'),
+        )
+        for entry in report:
+            if options.get('dry_run'):
+                self.stdout.write(f"{entry['policy']}: expired={entry['expired']}")
+            else:
+                self.stdout.write(
+                    f"{entry['policy']}: compacted={entry['compacted']} archived={entry['archived']} "
+                    f"deleted={entry['deleted']} bytes={entry['bytes']} file={entry['file'] or '-'}"
+                )
+        self.stdout.write(self.style.SUCCESS("Retention done"))
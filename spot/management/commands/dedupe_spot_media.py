@@ -0,0 +1,71 @@
+import os
+from collections import Counter
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+
+MEDIA_FIELDS = ('video_file', 'image_file')
+
+
+class Command(BaseCommand):
+    help = "Migre les médias existants vers le stockage adressé par contenu et recalcule les références"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="N'écrit rien, affiche seulement le bilan")
+
+    def handle(self, *args, **options):
+        from spot.models import MediaBlob, Spot
+        from spot.storage import blob_name, content_addressed_storage as storage, digest_from_name, hash_content
+
+        dry_run = bool(options.get('dry_run'))
+        migrated = duplicates = missing = 0
+        reclaimed = 0
+
+        for field in MEDIA_FIELDS:
+            legacy_names = (
+                Spot.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .values_list(field, flat=True).distinct()
+            )
+            for name in list(legacy_names):
+                if digest_from_name(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f"Fichier introuvable: {name}")
+                    continue
+                with storage.open(name, 'rb') as fh:
+                    digest, size = hash_content(File(fh))
+                target = blob_name(digest, os.path.splitext(name)[1])
+                already_stored = storage.exists(target)
+                if already_stored:
+                    duplicates += 1
+                    reclaimed += size
+                migrated += 1
+                if dry_run:
+                    continue
+                if not already_stored:
+                    os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+                    os.replace(storage.path(name), storage.path(target))
+                MediaBlob.objects.get_or_create(sha256=digest, defaults={'name': target, 'size': size})
+                Spot.objects.filter(**{field: name}).update(**{field: target})
+                if already_stored:
+                    storage.delete(name)
+
+        if not dry_run:
+            # Compteurs recalculés depuis les références réelles
+            refs = Counter()
+            for field in MEDIA_FIELDS:
+                for name in Spot.objects.exclude(**{field: ''}).values_list(field, flat=True).iterator():
+                    digest = digest_from_name(name)
+                    if digest:
+                        refs[digest] += 1
+            blobs = list(MediaBlob.objects.all())
+            for blob in blobs:
+                blob.ref_count = refs.get(blob.sha256, 0)
+            MediaBlob.objects.bulk_update(blobs, ['ref_count'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated={migrated} Duplicates={duplicates} Missing={missing} ReclaimedBytes={reclaimed}"
+            + (" (dry-run)" if dry_run else "")
+        ))
@@ -1,4 +1,7 @@
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 from django.utils import timezone
 
 
@@ -7,22 +10,35 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true', help='Ne pas envoyer, juste compter')
-        parser.add_argument('--limit', type=int, default=100, help='Nombre max de campagnes à traiter')
+        parser.add_argument('--limit', type=int, default=100, help='Nombre max de campagnes par lot')
+        parser.add_argument('--workers', type=int, default=None, help='Envois SMS simultanés (défaut: SPOT_SMS_CONCURRENCY)')
+        parser.add_argument('--loop', action='store_true', help='Continuer à traiter les lots dus sans quitter')
+        parser.add_argument('--interval', type=float, default=5.0, help="Attente (s) lorsque rien n'est dû (avec --loop)")
 
     def handle(self, *args, **options):
-        now = timezone.now()
-        limit = int(options.get('limit') or 100)
+        from spot.services import reminders
+
+        limit = max(1, int(options.get('limit') or 100))
         if options.get('dry_run'):
-            from spot.models import AssignmentNotificationCampaign
-            qs = AssignmentNotificationCampaign.objects.filter(
-                status='active',
-                confirmed_at__isnull=True,
-                next_attempt_at__isnull=False,
-                next_attempt_at__lte=now,
-            ).count()
-            self.stdout.write(self.style.SUCCESS(f"Due campaigns={qs}"))
+            due = reminders.due(timezone.now()).count()
+            self.stdout.write(self.style.SUCCESS(f"Due campaigns={due}"))
             return
 
-        from spot.utils import process_due_assignment_notification_campaigns
-        processed = process_due_assignment_notification_campaigns(now=now, limit=limit)
-        self.stdout.write(self.style.SUCCESS(f"Processed={processed}"))
+        # Plusieurs processus peuvent tourner en parallèle: chaque lot est réservé
+        total = 0
+        interval = max(0.1, float(options.get('interval') or 5.0))
+        try:
+            while True:
+                try:
+                    processed = reminders.process_due(limit=limit, workers=options.get('workers'))
+                finally:
+                    close_old_connections()
+                total += processed
+                if processed:
+                    continue
+                if not options.get('loop'):
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Processed={total}"))
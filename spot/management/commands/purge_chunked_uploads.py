@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Supprime les téléversements par morceaux abandonnés et leurs fichiers de transit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Âge minimal (heures) des sessions inactives')
+
+    def handle(self, *args, **options):
+        from spot.services.uploads import purge_stale_uploads
+
+        hours = int(options.get('hours') or 24)
+        purged = purge_stale_uploads(max_age_hours=hours)
+        self.stdout.write(self.style.SUCCESS(f"Purged={purged}"))
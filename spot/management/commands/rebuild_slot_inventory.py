@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = "Recalcule l'inventaire du temps d'antenne (SlotInventory) à partir des programmations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Date de début (YYYY-MM-DD), incluse')
+        parser.add_argument('--end', help='Date de fin (YYYY-MM-DD), incluse')
+
+    def handle(self, *args, **options):
+        from spot.services import inventory
+
+        start = parse_date(options['start']) if options.get('start') else None
+        end = parse_date(options['end']) if options.get('end') else None
+        if (options.get('start') and not start) or (options.get('end') and not end):
+            raise CommandError('Date invalide (format attendu: YYYY-MM-DD)')
+        rows = inventory.rebuild(start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f"Rows={rows}"))
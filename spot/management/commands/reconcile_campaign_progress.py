@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs d'avancement des campagnes (CampaignProgress) à partir des programmations"
+
+    def handle(self, *args, **options):
+        from spot.services import progress
+
+        fixed = progress.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Fixed={fixed}"))
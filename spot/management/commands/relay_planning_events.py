@@ -0,0 +1,48 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+logger = logging.getLogger('spot')
+MAX_BACKOFF = 30.0
+
+
+class Command(BaseCommand):
+    help = "Publie par lots les événements du planning en attente (boîte d'envoi)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Nombre max d'événements par lot")
+        parser.add_argument('--interval', type=float, default=0.25, help="Attente (s) lorsque rien n'est en attente")
+        parser.add_argument('--once', action='store_true', help='Vider la file puis quitter')
+
+    def handle(self, *args, **options):
+        from spot.services import planning
+
+        batch_size = max(1, int(options.get('batch_size') or 200))
+        interval = max(0.05, float(options.get('interval') or 0.25))
+        total = 0
+        backoff = interval
+        try:
+            while True:
+                try:
+                    published = planning.relay(batch_size=batch_size)
+                except Exception:
+                    # Couche de canaux indisponible: le lot reste en attente
+                    logger.exception('Relais planning en échec, nouvel essai dans %.1fs', backoff)
+                    time.sleep(backoff)
+                    backoff = min(MAX_BACKOFF, backoff * 2)
+                    continue
+                finally:
+                    close_old_connections()
+                backoff = interval
+                total += published
+                if published:
+                    continue
+                if options.get('once'):
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Published={total}"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Lance une passerelle SMS/WhatsApp factice locale (tests de charge)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency', type=float, default=0.05, help='Délai de réponse simulé (s)')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Proportion de réponses 503 (0-1)')
+        parser.add_argument('--verbose', action='store_true', help='Journaliser chaque requête')
+
+    def handle(self, *args, **options):
+        from spot.services.gateway_stub import StubGateway
+
+        server = StubGateway(
+            host=options['host'],
+            port=options['port'],
+            latency=max(0.0, options['latency']),
+            failure_rate=min(1.0, max(0.0, options['failure_rate'])),
+            verbose=options['verbose'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Passerelle factice sur {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Requêtes reçues={server.received} octets={server.bytes_received}")
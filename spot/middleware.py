@@ -183,3 +183,31 @@ class DiffusionStatusValidationMiddleware:
                         return JsonResponse({'ok': False, 'error': 'schedule_not_found'}, status=404)
 
         return self.get_response(request)
+
+
+class ReplicaStickinessMiddleware:
+    """Lecture de ses propres écritures malgré la réplique (voir `spot.db_router`).
+
+    - Requête modifiante: cookie `spot_rw` posé pour quelques secondes
+    - Cookie présent: lectures forcées sur la base principale
+    """
+
+    SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS', 'TRACE'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from . import db_router
+
+        if not db_router.configured():
+            return self.get_response(request)
+        with db_router.pinned(db_router.STICKY_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+        if request.method not in self.SAFE_METHODS:
+            response.set_cookie(
+                db_router.STICKY_COOKIE, '1',
+                max_age=db_router.sticky_seconds(), httponly=True, samesite='Lax',
+                secure=request.is_secure(),
+            )
+        return response
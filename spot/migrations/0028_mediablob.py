@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:03
+
+import django.core.validators
+import spot.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0027_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='spot',
+            name='image_file',
+            field=models.ImageField(blank=True, null=True, storage=spot.storage.spot_media_storage, upload_to='spots/images/'),
+        ),
+        migrations.AlterField(
+            model_name='spot',
+            name='video_file',
+            field=models.FileField(blank=True, null=True, storage=spot.storage.spot_media_storage, upload_to='spots/videos/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp4', 'avi', 'mov', 'wmv'])]),
+        ),
+    ]
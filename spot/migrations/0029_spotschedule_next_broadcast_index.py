@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0028_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spotschedule',
+            index=models.Index(fields=['spot', 'broadcast_date', 'broadcast_time'], name='spot_spotsc_spot_id_05109d_idx'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, OperationalError
+from django.db.models.functions import Upper
+
+
+# Doit rester aligné sur spot.services.search.SEARCH_INDEXES
+TEXT_INDEXES = {
+    'Campaign': ('title', 'description'),
+    'Spot': ('title', 'description'),
+    'CoverageRequest': ('event_title', 'address', 'description'),
+    'CorrespondenceThread': ('subject',),
+    'Journalist': ('name', 'email', 'specialties'),
+    'Driver': ('name',),
+}
+
+# Champs recherchés de façon approximative (pg_trgm)
+TRIGRAM_FIELDS = {
+    'User': ('username', 'company'),
+    'Journalist': ('phone',),
+    'Driver': ('phone',),
+}
+
+
+def _postgres_indexes(apps):
+    for model_name, fields in TEXT_INDEXES.items():
+        model = apps.get_model('spot', model_name)
+        yield model, GinIndex(
+            SearchVector(*fields, config='french'),
+            name=f'{model._meta.db_table[:18]}_fts_gin',
+        )
+    for model_name, fields in TRIGRAM_FIELDS.items():
+        model = apps.get_model('spot', model_name)
+        for field in fields:
+            short = f'{model._meta.db_table[5:13]}_{field[:7]}'
+            # `icontains` (UPPER(col) LIKE ...) et `trigram_word_similar`
+            yield model, GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=f'{short}_utrgm')
+            yield model, GinIndex(OpClass(field, name='gin_trgm_ops'), name=f'{short}_trgm')
+
+
+def _sqlite_statements(apps):
+    for model_name, fields in TEXT_INDEXES.items():
+        base = apps.get_model('spot', model_name)._meta.db_table
+        table = f'{base}_fts'
+        cols = ', '.join(fields)
+        new_vals = ', '.join(f'NEW.{f}' for f in fields)
+        yield f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, tokenize='unicode61 remove_diacritics 2')"
+        yield f"INSERT INTO {table}(rowid, {cols}) SELECT rowid, {cols} FROM {base}"
+        yield (
+            f"CREATE TRIGGER {table}_ai AFTER INSERT ON {base} BEGIN "
+            f"INSERT INTO {table}(rowid, {cols}) VALUES (NEW.rowid, {new_vals}); END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_ad AFTER DELETE ON {base} BEGIN "
+            f"DELETE FROM {table} WHERE rowid = OLD.rowid; END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_au AFTER UPDATE ON {base} BEGIN "
+            f"DELETE FROM {table} WHERE rowid = OLD.rowid; "
+            f"INSERT INTO {table}(rowid, {cols}) VALUES (NEW.rowid, {new_vals}); END"
+        )
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for model, index in _postgres_indexes(apps):
+            schema_editor.add_index(model, index)
+    elif vendor == 'sqlite':
+        try:
+            for statement in _sqlite_statements(apps):
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite compilé sans FTS5: la recherche se replie sur icontains
+            pass
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for model, index in _postgres_indexes(apps):
+            schema_editor.remove_index(model, index)
+    elif vendor == 'sqlite':
+        for model_name in TEXT_INDEXES:
+            base = apps.get_model('spot', model_name)._meta.db_table
+            for suffix in ('_ai', '_ad', '_au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {base}_fts{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {base}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0029_spotschedule_next_broadcast_index'),
+    ]
+
+    operations = [
+        # Sans effet hors PostgreSQL
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0030_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('upsert', 'Création / mise à jour'), ('remove', 'Suppression')], max_length=10)),
+                ('schedule_id', models.BigIntegerField()),
+                ('broadcast_date', models.DateField()),
+                ('previous_date', models.DateField(blank=True, null=True)),
+                ('item', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['broadcast_date', 'seq'], name='spot_planni_broadca_51ba84_idx'), models.Index(fields=['previous_date', 'seq'], name='spot_planni_previou_96e5ae_idx')],
+            },
+        ),
+    ]
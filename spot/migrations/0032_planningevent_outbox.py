@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:21
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_published(apps, schema_editor):
+    # Les événements antérieurs ont déjà été diffusés en direct
+    PlanningEvent = apps.get_model('spot', 'PlanningEvent')
+    PlanningEvent.objects.filter(published_at__isnull=True).update(published_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0031_planningevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planningevent',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_published, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='planningevent',
+            index=models.Index(condition=models.Q(('published_at__isnull', True)), fields=['seq'], name='planning_event_pending'),
+        ),
+    ]
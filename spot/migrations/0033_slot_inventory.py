@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def build_inventory(apps, schema_editor):
+    SpotSchedule = apps.get_model('spot', 'SpotSchedule')
+    SlotInventory = apps.get_model('spot', 'SlotInventory')
+    rows = (
+        SpotSchedule.objects.order_by()
+        .values('time_slot_id', 'broadcast_date')
+        .annotate(seconds=Coalesce(Sum('spot__duration_seconds'), 0), spots=Count('id'))
+    )
+    SlotInventory.objects.bulk_create(
+        [
+            SlotInventory(
+                time_slot_id=row['time_slot_id'], broadcast_date=row['broadcast_date'],
+                booked_seconds=row['seconds'], spot_count=row['spots'],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0032_planningevent_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='ad_capacity_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SlotInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('broadcast_date', models.DateField()),
+                ('booked_seconds', models.IntegerField(default=0)),
+                ('spot_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='spot.timeslot')),
+            ],
+            options={
+                'ordering': ['broadcast_date', 'time_slot'],
+                'indexes': [models.Index(fields=['broadcast_date', 'time_slot'], name='spot_slotin_broadca_96d847_idx')],
+                'unique_together': {('time_slot', 'broadcast_date')},
+            },
+        ),
+        migrations.RunPython(build_inventory, migrations.RunPython.noop),
+    ]
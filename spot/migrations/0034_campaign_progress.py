@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:44
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+FIELDS = ('scheduled_count', 'broadcast_count', 'late_count', 'booked_seconds')
+
+
+def build_progress(apps, schema_editor):
+    SpotSchedule = apps.get_model('spot', 'SpotSchedule')
+    CampaignProgress = apps.get_model('spot', 'CampaignProgress')
+    today = datetime.date.today()
+    rows = (
+        SpotSchedule.objects.order_by().values('spot__campaign_id')
+        .annotate(
+            scheduled_count=Count('id', filter=Q(is_broadcasted=False)),
+            broadcast_count=Count('id', filter=Q(is_broadcasted=True)),
+            late_count=Count('id', filter=Q(is_broadcasted=False, broadcast_date__lt=today)),
+            booked_seconds=Coalesce(Sum('spot__duration_seconds'), 0),
+        )
+    )
+    total = dict.fromkeys(FIELDS, 0)
+    progress = []
+    for row in rows.iterator():
+        values = {f: row[f] for f in FIELDS}
+        total = {f: total[f] + values[f] for f in FIELDS}
+        progress.append(CampaignProgress(scope=str(row['spot__campaign_id']), campaign_id=row['spot__campaign_id'], **values))
+    progress.append(CampaignProgress(scope='all', **total))
+    CampaignProgress.objects.bulk_create(progress, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0033_slot_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=40, unique=True)),
+                ('scheduled_count', models.IntegerField(default=0)),
+                ('broadcast_count', models.IntegerField(default=0)),
+                ('late_count', models.IntegerField(default=0)),
+                ('booked_seconds', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('campaign', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='spot.campaign')),
+            ],
+        ),
+        migrations.RunPython(build_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def preview(text, length=160):
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= length else text[:length - 1].rstrip() + '…'
+
+
+def rebuild_thread_search(apps, schema_editor):
+    # L'ajout de la clé étrangère reconstruit la table sous SQLite: triggers
+    # FTS5 supprimés, rowid possiblement renumérotés
+    from spot.services.search import rebuild_search_indexes
+
+    rebuild_search_indexes(schema_editor, ['thread'])
+
+
+def fill_last_message(apps, schema_editor):
+    CorrespondenceThread = apps.get_model('spot', 'CorrespondenceThread')
+    CorrespondenceMessage = apps.get_model('spot', 'CorrespondenceMessage')
+    last = CorrespondenceMessage.objects.filter(thread=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:1]
+    threads = list(
+        CorrespondenceThread.objects.annotate(last_id=Subquery(last), n=Count('messages'))
+        .filter(n__gt=0).only('id')
+    )
+    contents = dict(
+        CorrespondenceMessage.objects.filter(id__in=[t.last_id for t in threads]).values_list('id', 'content')
+    )
+    for thread in threads:
+        thread.last_message_id = thread.last_id
+        thread.last_message_preview = preview(contents.get(thread.last_id))
+        thread.message_count = thread.n
+    CorrespondenceThread.objects.bulk_update(
+        threads, ['last_message', 'last_message_preview', 'message_count'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0034_campaign_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='correspondencethread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='spot.correspondencemessage'),
+        ),
+        migrations.AddField(
+            model_name='correspondencethread',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='correspondencethread',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_thread_search, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='correspondencemessage',
+            index=models.Index(fields=['thread', '-created_at'], name='message_thread_window'),
+        ),
+        migrations.AddIndex(
+            model_name='correspondencethread',
+            index=models.Index(fields=['client', '-last_message_at', '-created_at'], name='thread_inbox_client'),
+        ),
+        migrations.AddIndex(
+            model_name='correspondencethread',
+            index=models.Index(fields=['-last_message_at', '-created_at'], name='thread_inbox'),
+        ),
+        migrations.RunPython(fill_last_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0035_correspondence_last_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentnotificationcampaign',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='assignmentnotificationcampaign',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='assignmentnotificationcampaign',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='notif_campaign_due'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:07
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def fill_phone_tail(apps, schema_editor):
+    Campaign = apps.get_model('spot', 'AssignmentNotificationCampaign')
+    batch = []
+    for campaign in Campaign.objects.exclude(to_phone__isnull=True).exclude(to_phone='').only('id', 'to_phone').iterator():
+        campaign.phone_tail = ''.join(ch for ch in campaign.to_phone if ch.isdigit())[-8:]
+        batch.append(campaign)
+        if len(batch) >= 500:
+            Campaign.objects.bulk_update(batch, ['phone_tail'])
+            batch = []
+    if batch:
+        Campaign.objects.bulk_update(batch, ['phone_tail'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0036_assignment_campaign_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundSms',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('provider_message_id', models.CharField(blank=True, max_length=120, null=True, unique=True)),
+                ('sender', models.CharField(blank=True, max_length=50)),
+                ('body', models.TextField(blank=True)),
+                ('result', models.CharField(choices=[('confirmed', 'Confirmation enregistrée'), ('already_confirmed', 'Déjà confirmée'), ('code_missing', 'Code absent'), ('campaign_not_found', 'Campagne introuvable')], max_length=30)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='assignmentnotificationcampaign',
+            name='phone_tail',
+            field=models.CharField(blank=True, db_index=True, max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='assignmentnotificationcampaign',
+            index=models.Index(fields=['confirm_code', 'status', 'confirmed_at'], name='notif_campaign_code'),
+        ),
+        migrations.RunPython(fill_phone_tail, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='inboundsms',
+            name='campaign',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inbound_messages', to='spot.assignmentnotificationcampaign'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0037_inbound_sms_matching'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignmentlog',
+            index=models.Index(fields=['at'], name='assignment_log_at'),
+        ),
+        migrations.AddIndex(
+            model_name='assignmentnotificationattempt',
+            index=models.Index(fields=['created_at'], name='notif_attempt_created'),
+        ),
+        migrations.AddIndex(
+            model_name='campaignhistory',
+            index=models.Index(fields=['created_at'], name='campaign_history_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inboundsms',
+            index=models.Index(fields=['received_at'], name='inbound_sms_received'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read'], name='notification_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at'], name='notification_created'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def repair(apps, schema_editor):
+    # Bases migrées avant la correction de 0035: index de recherche réaligné
+    from spot.services.search import rebuild_search_indexes
+
+    rebuild_search_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0038_retention_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(repair, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:37
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed(apps, schema_editor):
+    # Le compteur reprend après le dernier événement journalisé
+    PlanningEvent = apps.get_model('spot', 'PlanningEvent')
+    PlanningSequence = apps.get_model('spot', 'PlanningSequence')
+    last = PlanningEvent.objects.aggregate(last=Max('seq'))['last'] or 0
+    PlanningSequence.objects.create(pk=1, last=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0039_repair_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
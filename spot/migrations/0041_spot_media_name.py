@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:43
+
+from django.db import migrations, models
+
+
+def rebuild_spot_search(apps, schema_editor):
+    # L'ajout de colonne reconstruit la table sous SQLite (triggers FTS5 supprimés)
+    from spot.services.search import rebuild_search_indexes
+
+    rebuild_search_indexes(schema_editor, ['spot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spot', '0040_planning_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spot',
+            name='media_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(rebuild_spot_search, migrations.RunPython.noop),
+    ]
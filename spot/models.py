@@ -6,6 +6,8 @@ from django.utils.dateparse import parse_date
 from decimal import Decimal
 import uuid
 
+from .storage import spot_media_storage
+
 
 class User(AbstractUser):
     """Modèle utilisateur étendu pour clients et administrateurs"""
@@ -46,6 +48,8 @@ class TimeSlot(models.Model):
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
     is_prime = models.BooleanField(default=False)
+    # Temps publicitaire vendable par jour; vide = indicatif (non bloquant)
+    ad_capacity_seconds = models.PositiveIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['start_time']
@@ -147,6 +151,7 @@ class Spot(models.Model):
     # Nouveau: fichier image
     image_file = models.ImageField(
         upload_to='spots/images/',
+        storage=spot_media_storage,
         null=True,
         blank=True
     )
@@ -154,11 +159,15 @@ class Spot(models.Model):
     # Fichier vidéo existant
     video_file = models.FileField(
         upload_to='spots/videos/',
+        storage=spot_media_storage,
         validators=[FileExtensionValidator(allowed_extensions=['mp4', 'avi', 'mov', 'wmv'])],
         null=True,
         blank=True
     )
     
+    # Nom du fichier déposé (le stockage le renomme d'après son empreinte)
+    media_name = models.CharField(max_length=255, blank=True)
+
     # Rendre optionnelle (utile uniquement pour vidéo)
     duration_seconds = models.IntegerField(
         validators=[MinValueValidator(5), MaxValueValidator(300)],
@@ -190,9 +199,48 @@ class SpotSchedule(models.Model):
     class Meta:
         ordering = ['broadcast_date', 'broadcast_time']
         unique_together = ['time_slot', 'broadcast_date', 'broadcast_time']
+        indexes = [
+            # Prochaine diffusion d'un spot (sous-requêtes de la liste diffuseur)
+            models.Index(fields=['spot', 'broadcast_date', 'broadcast_time']),
+        ]
     
     def __str__(self):
         return f"{self.spot.title} - {self.broadcast_date} {self.broadcast_time}"
+
+
+class SlotInventory(models.Model):
+    """Temps d'antenne réservé par créneau et par jour (tenu à jour par signaux)"""
+    time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='inventory')
+    broadcast_date = models.DateField()
+    booked_seconds = models.IntegerField(default=0)
+    spot_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['broadcast_date', 'time_slot']
+        unique_together = ['time_slot', 'broadcast_date']
+        indexes = [
+            models.Index(fields=['broadcast_date', 'time_slot']),
+        ]
+
+    def __str__(self):
+        return f"{self.time_slot_id} {self.broadcast_date}: {self.booked_seconds}s / {self.spot_count}"
+
+
+class CampaignProgress(models.Model):
+    """Compteurs d'avancement par campagne, et global (scopes 'all', 'all:n'), tenus à jour par signaux"""
+    GLOBAL_SCOPE = 'all'
+
+    scope = models.CharField(max_length=40, unique=True)  # id de campagne, 'all' ou 'all:n'
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE, null=True, blank=True, related_name='progress')
+    scheduled_count = models.IntegerField(default=0)  # programmations non diffusées
+    broadcast_count = models.IntegerField(default=0)
+    late_count = models.IntegerField(default=0)  # non diffusées, date passée (recalculé chaque nuit)
+    booked_seconds = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope}: {self.scheduled_count} / {self.broadcast_count} / {self.late_count}"
 # Modèles Payment et Invoice supprimés
 class PricingRule(models.Model):
     """Règles de tarification"""
@@ -229,6 +277,9 @@ class CampaignHistory(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='campaign_history_created'),
+        ]
     
     def __str__(self):
         return f"{self.campaign.title} - {self.action}"
@@ -268,6 +319,12 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Compteurs de non lues par utilisateur
+            models.Index(fields=['user', 'is_read'], name='notification_unread'),
+            # Parcours de rétention
+            models.Index(fields=['created_at'], name='notification_created'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -287,9 +344,20 @@ class CorrespondenceThread(models.Model):
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_threads')
     priority = models.CharField(max_length=10, choices=[('normal', 'Normal'), ('urgent', 'Urgent')], default='normal')
     last_message_at = models.DateTimeField(null=True, blank=True)
+    # Dernier message dénormalisé (aperçu de la boîte de réception)
+    last_message = models.ForeignKey('CorrespondenceMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_preview = models.CharField(max_length=200, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Boîte de réception paginée par curseur (client / administration)
+            models.Index(fields=['client', '-last_message_at', '-created_at'], name='thread_inbox_client'),
+            models.Index(fields=['-last_message_at', '-created_at'], name='thread_inbox'),
+        ]
+
     def __str__(self):
         return f"{self.subject} ({self.get_status_display()})"
 
@@ -304,14 +372,19 @@ class CorrespondenceMessage(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['thread', '-created_at'], name='message_thread_window'),
+        ]
 
     def __str__(self):
         return f"Message de {self.author.username} - {self.created_at}"
 
     def save(self, *args, **kwargs):
+        from .services import correspondence
+
+        created = self._state.adding
         super().save(*args, **kwargs)
-        self.thread.last_message_at = self.created_at
-        self.thread.save(update_fields=['last_message_at', 'updated_at'])
+        correspondence.message_saved(self, created)
 
 class AdvisorySession(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -576,6 +649,11 @@ class AssignmentLog(models.Model):
     note = models.TextField(blank=True)
     at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['at'], name='assignment_log_at'),
+        ]
+
     def __str__(self):
         return f"{self.label}"
 
@@ -597,21 +675,41 @@ class AssignmentNotificationCampaign(models.Model):
     recipient_kind = models.CharField(max_length=20, choices=RECIPIENT_CHOICES)
     to_email = models.EmailField(blank=True, null=True)
     to_phone = models.CharField(max_length=50, blank=True, null=True)
+    # 8 derniers chiffres de `to_phone`, comparés à l'expéditeur des SMS entrants
+    phone_tail = models.CharField(max_length=8, blank=True, db_index=True)
     confirm_code = models.CharField(max_length=20)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     reminder_count = models.PositiveSmallIntegerField(default=0)
     next_attempt_at = models.DateTimeField(blank=True, null=True)
     confirmed_at = models.DateTimeField(blank=True, null=True)
     confirmed_via = models.CharField(max_length=20, blank=True)
+    # Réservation par un processus de relance (voir services.reminders)
+    lease_owner = models.CharField(max_length=64, blank=True)
+    lease_until = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Relances dues (file des processus de relance)
+            models.Index(fields=['status', 'next_attempt_at'], name='notif_campaign_due'),
+            # Confirmation par code (SMS entrants)
+            models.Index(fields=['confirm_code', 'status', 'confirmed_at'], name='notif_campaign_code'),
+        ]
 
     def __str__(self):
         return f"Notif {self.recipient_kind} — {self.assignment_id}"
 
+    def save(self, *args, **kwargs):
+        from .utils import phone_tail
+
+        self.phone_tail = phone_tail(self.to_phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'to_phone' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'phone_tail'}
+        super().save(*args, **kwargs)
+
 
 class AssignmentNotificationAttempt(models.Model):
     CHANNEL_CHOICES = [
@@ -647,6 +745,124 @@ class AssignmentNotificationAttempt(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='notif_attempt_created'),
+        ]
 
     def __str__(self):
         return f"{self.channel} — {self.status}"
+
+
+class InboundSms(models.Model):
+    """SMS reçu par le webhook; l'identifiant fournisseur rend la réception idempotente."""
+    RESULT_CHOICES = [
+        ('confirmed', 'Confirmation enregistrée'),
+        ('already_confirmed', 'Déjà confirmée'),
+        ('code_missing', 'Code absent'),
+        ('campaign_not_found', 'Campagne introuvable'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    provider_message_id = models.CharField(max_length=120, blank=True, null=True, unique=True)
+    sender = models.CharField(max_length=50, blank=True)
+    body = models.TextField(blank=True)
+    campaign = models.ForeignKey(AssignmentNotificationCampaign, on_delete=models.SET_NULL, null=True, blank=True, related_name='inbound_messages')
+    result = models.CharField(max_length=30, choices=RESULT_CHOICES)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['received_at'], name='inbound_sms_received'),
+        ]
+
+    def __str__(self):
+        return f"SMS {self.sender} — {self.result}"
+
+
+class ChunkedUpload(models.Model):
+    """Téléversement reprenable (par morceaux) d'un média de spot"""
+    STATUS_CHOICES = [
+        ('open', 'En cours'),
+        ('complete', 'Complet'),
+        ('attached', 'Rattaché'),
+        ('cancelled', 'Annulé'),
+    ]
+    FIELD_CHOICES = [
+        ('video_file', 'Vidéo'),
+        ('image_file', 'Image'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    campaign = models.ForeignKey(Campaign, on_delete=models.SET_NULL, null=True, blank=True, related_name='chunked_uploads')
+    target_field = models.CharField(max_length=20, choices=FIELD_CHOICES, default='video_file')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
+
+
+class MediaBlob(models.Model):
+    """Fichier média stocké une seule fois, adressé par son empreinte SHA-256"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count})"
+
+
+class PlanningEvent(models.Model):
+    """Journal ordonné des changements du planning (reprise par numéro de séquence)"""
+    ACTION_CHOICES = [
+        ('upsert', 'Création / mise à jour'),
+        ('remove', 'Suppression'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    schedule_id = models.BigIntegerField()
+    broadcast_date = models.DateField()
+    previous_date = models.DateField(null=True, blank=True)
+    item = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Renseigné par le relais une fois l'événement diffusé (boîte d'envoi)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            models.Index(fields=['broadcast_date', 'seq']),
+            models.Index(fields=['previous_date', 'seq']),
+            models.Index(fields=['seq'], condition=models.Q(published_at__isnull=True), name='planning_event_pending'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.schedule_id}"
+
+
+class PlanningSequence(models.Model):
+    """Dernier numéro attribué aux `PlanningEvent` (ligne unique, verrouillée jusqu'à la validation)"""
+    last = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"#{self.last}"
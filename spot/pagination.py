@@ -0,0 +1,190 @@
+"""
+Pagination par curseur (keyset) pour les longues listes.
+
+Au lieu de `OFFSET` + `COUNT(*)`, chaque page est lue à partir des valeurs de
+tri de la dernière ligne affichée: le coût d'une page profonde est celui de
+la première. Les curseurs sont opaques et signés; le total n'est qu'estimé.
+"""
+
+import datetime
+import operator
+import uuid
+from decimal import Decimal
+from functools import reduce
+
+from django.core import signing
+from django.db import connections
+from django.db.models import F, Q
+
+
+CURSOR_SALT = 'spot.keyset'
+COUNT_CAP = 1000
+
+
+def _dump_value(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, datetime.date):
+        return ['d', value.isoformat()]
+    if isinstance(value, datetime.time):
+        return ['t', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['n', str(value)]
+    if isinstance(value, uuid.UUID):
+        return ['u', str(value)]
+    return ['v', value]
+
+
+def _load_value(raw):
+    if raw is None:
+        return None
+    tag, value = raw
+    if tag == 'dt':
+        return datetime.datetime.fromisoformat(value)
+    if tag == 'd':
+        return datetime.date.fromisoformat(value)
+    if tag == 't':
+        return datetime.time.fromisoformat(value)
+    if tag == 'n':
+        return Decimal(value)
+    if tag == 'u':
+        return uuid.UUID(value)
+    return value
+
+
+def estimate_count(queryset, cap=COUNT_CAP):
+    """Renvoie (total, estimé). Table non filtrée: `reltuples` PostgreSQL;
+    sinon comptage borné à `cap` lignes (estimé si la borne est atteinte)."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None and row[0] >= 0:
+            return int(row[0]), True
+    total = queryset.order_by()[:cap + 1].count()
+    if total > cap:
+        return cap, True
+    return total, False
+
+
+class KeysetPage:
+    """Page de résultats; itérable comme une page de `Paginator`."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Pagine `queryset` selon `ordering` (ex. ('-broadcast_date', '-broadcast_time')).
+
+    La clé primaire est ajoutée en dernier critère si absente, pour un ordre
+    total. Les champs liés (`campaign__start_date`) sont acceptés; les valeurs
+    NULL sont placées en fin, quel que soit le sens.
+    """
+
+    def __init__(self, queryset, ordering, per_page=10, count_cap=COUNT_CAP):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_cap = count_cap
+        fields = list(ordering)
+        if not any(f.lstrip('-') in ('pk', 'id') for f in fields):
+            fields.append('pk')
+        self.keys = [(f'_ks{i}', f.lstrip('-'), f.startswith('-')) for i, f in enumerate(fields)]
+        self._count = None
+
+    @property
+    def count(self):
+        return self.approximate_count[0]
+
+    @property
+    def approximate_count(self):
+        if self._count is None:
+            self._count = estimate_count(self.queryset, cap=self.count_cap)
+        return self._count
+
+    def _encode(self, obj, direction):
+        values = [_dump_value(getattr(obj, alias)) for alias, _, _ in self.keys]
+        return signing.dumps({'k': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [_load_value(v) for v in data['k']]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None, 'n'
+        if len(values) != len(self.keys):
+            return None, 'n'
+        return values, data.get('d', 'n')
+
+    def _ordered(self, reverse):
+        qs = self.queryset.annotate(**{alias: F(field) for alias, field, _ in self.keys})
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        order = []
+        for alias, _, desc in self.keys:
+            descending = desc != reverse
+            order.append(F(alias).desc(**nulls) if descending else F(alias).asc(**nulls))
+        return qs.order_by(*order)
+
+    def _after(self, values, reverse):
+        """Condition « strictement après `values` » dans l'ordre de lecture."""
+        branches = []
+        equal = Q()
+        for (alias, _, desc), value in zip(self.keys, values):
+            descending = desc != reverse
+            if value is None:
+                # NULL en fin de lecture (en tête en lecture inversée)
+                if reverse:
+                    branches.append(equal & Q(**{f'{alias}__isnull': False}))
+                equal &= Q(**{f'{alias}__isnull': True})
+                continue
+            step = Q(**{f'{alias}__{"lt" if descending else "gt"}': value})
+            if not reverse:
+                step |= Q(**{f'{alias}__isnull': True})
+            branches.append(equal & step)
+            equal &= Q(**{alias: value})
+        return reduce(operator.or_, branches, Q(pk__in=[]))
+
+    def get_page(self, cursor=None):
+        values, direction = self._decode(cursor) if cursor else (None, 'n')
+        reverse = values is not None and direction == 'p'
+        qs = self._ordered(reverse)
+        if values is not None:
+            qs = qs.filter(self._after(values, reverse))
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        next_cursor = self._encode(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self._encode(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor, self)
@@ -1,7 +1,8 @@
 from django.urls import re_path
-from .consumers import AdminPendingCountsConsumer, PlanningUpdatesConsumer
+from .consumers import AdminPendingCountsConsumer, CorrespondenceConsumer, PlanningUpdatesConsumer
 
 websocket_urlpatterns = [
     re_path(r"^ws/admin/pending-counts/$", AdminPendingCountsConsumer.as_asgi()),
     re_path(r"^ws/diffusion/planning/$", PlanningUpdatesConsumer.as_asgi()),
+    re_path(r"^ws/correspondence/(?P<thread_id>[0-9a-f-]+)/$", CorrespondenceConsumer.as_asgi()),
 ]
\ No newline at end of file
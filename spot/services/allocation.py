@@ -0,0 +1,265 @@
+"""
+Répartition automatique des campagnes approuvées dans la grille de diffusion.
+
+Chaque campagne demande, pour chaque jour de sa période et chacun de ses
+créneaux préférés, une diffusion de son spot approuvé. Plutôt que de prendre
+`start_time` du créneau (collision garantie dès la deuxième campagne), on
+tient pour chaque (créneau, jour) une ligne de temps des intervalles occupés
+[début, début + durée[ et on place chaque spot dans le premier intervalle
+libre assez long (premier ajustement): les spots s'enchaînent dans le
+créneau, deux diffusions n'ont jamais la même heure et la contrainte unique
+(créneau, jour, heure) est respectée par construction.
+
+Équilibrage: chaque jour, les campagnes les moins servies jusque-là passent
+en premier (puis les spots les plus longs); quand un créneau sature, la
+pénurie est répartie au lieu de toujours frapper les dernières approuvées.
+La capacité bloquante de l'inventaire (`ad_capacity_seconds`) est respectée,
+et revérifiée sous verrou au moment de l'insertion (`inventory.admit`).
+
+Toutes les lectures sont groupées (campagnes, programmations existantes,
+inventaire, grille tarifaire) et l'insertion est un `bulk_create`.
+Un créneau qui passe minuit est borné à minuit (l'heure de diffusion est
+rattachée au jour de diffusion).
+"""
+
+import datetime
+from bisect import insort
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_date
+
+from . import inventory, planning as planning_events, pricing, progress
+
+
+DAY_SECONDS = 24 * 3600
+INSERT_BATCH = 500
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _window(slot):
+    """[début, fin[ du créneau en secondes depuis minuit."""
+    start, end = _seconds(slot.start_time), _seconds(slot.end_time)
+    if end <= start:
+        end = DAY_SECONDS
+    return start, end
+
+
+class _Timeline:
+    """Intervalles occupés d'un créneau un jour donné, triés par début."""
+
+    __slots__ = ('start', 'end', 'busy', 'free')
+
+    def __init__(self, slot):
+        self.start, self.end = _window(slot)
+        self.busy = []
+        self.free = self.end - self.start
+
+    def reserve(self, begin, length):
+        insort(self.busy, (begin, begin + length))
+        self.free -= max(0, min(begin + length, self.end) - max(begin, self.start))
+
+    def place(self, length):
+        """Début du premier intervalle libre de `length` secondes, ou None."""
+        if length > self.free:
+            return None
+        cursor = self.start
+        for begin, end in self.busy:
+            if begin - cursor >= length:
+                break
+            cursor = max(cursor, end)
+        if cursor + length > self.end:
+            return None
+        self.reserve(cursor, length)
+        return cursor
+
+
+def load_campaigns(queryset):
+    """Campagnes avec créneaux préférés actifs et spots approuvés préchargés."""
+    from ..models import Spot, TimeSlot
+
+    return list(
+        queryset.select_related('approved_by').prefetch_related(
+            Prefetch('preferred_time_slots', queryset=TimeSlot.objects.filter(is_active=True), to_attr='active_slots'),
+            Prefetch('spots', queryset=Spot.objects.filter(status='approved').order_by('-approved_at'), to_attr='approved_spots'),
+        )
+    )
+
+
+def _as_date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def _demand(campaign, start, end):
+    """(spot, créneaux, premier jour, dernier jour) ou None."""
+    spots = getattr(campaign, 'approved_spots', None)
+    if spots is None:
+        spots = list(campaign.spots.filter(status='approved').order_by('-approved_at')[:1])
+    slots = getattr(campaign, 'active_slots', None)
+    if slots is None:
+        slots = list(campaign.preferred_time_slots.filter(is_active=True))
+    first, last = _as_date(campaign.start_date), _as_date(campaign.end_date)
+    if not first or not last:
+        return None
+    first = max(first, start) if start else first
+    last = min(last, end) if end else last
+    if not spots or not slots or first > last:
+        return None
+    return spots[0], slots, first, last
+
+
+def allocate(campaigns, start=None, end=None):
+    """Calcule les programmations des `campaigns` entre `start` et `end` (inclus).
+
+    Renvoie (programmations non enregistrées, refus). Un refus a pour motif
+    `slot_full` (capacité atteinte) ou `no_room` (plus d'intervalle libre
+    assez long dans le créneau). Les diffusions déjà programmées pour un même
+    spot, créneau et jour sont conservées (relance idempotente).
+    """
+    from ..models import SpotSchedule
+
+    demands = [(c, d) for c in campaigns for d in [_demand(c, start, end)] if d]
+    if not demands:
+        return [], []
+    first = min(d[2] for _, d in demands)
+    last = max(d[3] for _, d in demands)
+    slots = {s.id: s for _, d in demands for s in d[1]}
+
+    timelines = {}
+
+    def timeline(slot_id, day):
+        key = (slot_id, day)
+        if key not in timelines:
+            timelines[key] = _Timeline(slots[slot_id])
+        return timelines[key]
+
+    # Occupation actuelle en une requête
+    done = set()
+    existing = SpotSchedule.objects.filter(
+        time_slot_id__in=list(slots), broadcast_date__range=(first, last),
+    ).values_list('time_slot_id', 'broadcast_date', 'broadcast_time', 'spot_id', 'spot__duration_seconds')
+    for slot_id, day, t, spot_id, duration in existing.iterator():
+        timeline(slot_id, day).reserve(_seconds(t), max(duration or 0, 1))
+        done.add((spot_id, slot_id, day))
+
+    limited = {sid for sid, s in slots.items() if inventory.is_enforced(s)}
+    booked = {
+        key: seconds for key, (seconds, _) in inventory.booked(limited, first, last).items()
+    } if limited else {}
+    table = pricing.get_table()
+    prices = {}
+
+    served = Counter()
+    schedules, refused = [], []
+    day = first
+    while day <= last:
+        today = [(c, d) for c, d in demands if d[2] <= day <= d[3]]
+        today.sort(key=lambda cd: (served[cd[0].id], -(cd[1][0].duration_seconds or 0), cd[0].approved_at or cd[0].created_at))
+        for campaign, (spot, campaign_slots, _, _) in today:
+            length = max(spot.duration_seconds or 0, 1)
+            for slot in campaign_slots:
+                if (spot.id, slot.id, day) in done:
+                    continue
+                if slot.id in limited and booked.get((slot.id, day), 0) + length > inventory.capacity(slot):
+                    refused.append(_refusal(campaign, slot, day, 'slot_full'))
+                    continue
+                begin = timeline(slot.id, day).place(length)
+                if begin is None:
+                    refused.append(_refusal(campaign, slot, day, 'no_room'))
+                    continue
+                if slot.id in limited:
+                    booked[(slot.id, day)] = booked.get((slot.id, day), 0) + length
+                if (spot.duration_seconds, slot.id) not in prices:
+                    prices[(spot.duration_seconds, slot.id)] = pricing.unit_price(spot.duration_seconds, slot, table)
+                schedules.append(SpotSchedule(
+                    spot=spot,
+                    time_slot=slot,
+                    broadcast_date=day,
+                    broadcast_time=datetime.time(begin // 3600, begin % 3600 // 60, begin % 60),
+                    price=prices[(spot.duration_seconds, slot.id)],
+                    is_broadcasted=False,
+                ))
+                done.add((spot.id, slot.id, day))
+                served[campaign.id] += 1
+        day += datetime.timedelta(days=1)
+    return schedules, refused
+
+
+REFUSAL_LABELS = {
+    'slot_full': 'capacité du créneau atteinte',
+    'no_room': "plus d'intervalle libre assez long dans le créneau",
+}
+
+
+def describe_refusals(refused):
+    """Résumé par motif: « 2 capacité du créneau atteinte, 1 plus d'intervalle… »."""
+    counts = Counter(r['reason'] for r in refused)
+    return ', '.join(f'{n} {REFUSAL_LABELS.get(reason, reason)}' for reason, n in sorted(counts.items()))
+
+
+def _refusal(campaign, slot, day, reason):
+    return {
+        'campaign': str(campaign.id),
+        'campaign_title': campaign.title,
+        'date': day.isoformat(),
+        'time_slot': slot.name,
+        'reason': reason,
+    }
+
+
+def apply(schedules):
+    """Insère `schedules` en bloc; renvoie les programmations réellement créées.
+
+    Une programmation concurrente sur la même clé est ignorée par la base;
+    l'inventaire et le planning temps réel sont mis à jour (pas de signaux).
+    """
+    from ..models import SpotSchedule
+
+    if not schedules:
+        return []
+    SpotSchedule.objects.bulk_create(schedules, batch_size=INSERT_BATCH, ignore_conflicts=True)
+    keys = {(s.spot_id, s.time_slot_id, s.broadcast_date, s.broadcast_time) for s in schedules}
+    rows = SpotSchedule.objects.select_related('spot__campaign__client', 'time_slot').filter(
+        spot_id__in={k[0] for k in keys},
+        broadcast_date__range=(min(k[2] for k in keys), max(k[2] for k in keys)),
+    ).order_by('broadcast_date', 'broadcast_time')
+    created = [s for s in rows if (s.spot_id, s.time_slot_id, s.broadcast_date, s.broadcast_time) in keys]
+    inventory.add_schedules(created)
+    progress.add_schedules(created)
+    planning_events.record_many(created)
+    return created
+
+
+def schedule(campaigns, start=None, end=None, user=None):
+    """Alloue et enregistre les programmations; historique par campagne.
+
+    Renvoie (programmations créées, refus).
+    """
+    from ..models import CampaignHistory
+
+    with transaction.atomic():
+        schedules, refused = allocate(campaigns, start, end)
+        # `allocate` lit l'inventaire sans verrou: capacité revérifiée sous verrou
+        schedules, full = inventory.admit(schedules)
+        by_id = {campaign.id: campaign for campaign in campaigns}
+        refused += [
+            _refusal(by_id[s.spot.campaign_id], s.time_slot, s.broadcast_date, 'slot_full') for s in full
+        ]
+        created = apply(schedules)
+        per_campaign = defaultdict(int)
+        for sched in created:
+            per_campaign[sched.spot.campaign_id] += 1
+        CampaignHistory.objects.bulk_create([
+            CampaignHistory(
+                campaign=campaign,
+                action='updated',
+                description=f'{per_campaign[campaign.id]} programmation(s) créée(s) automatiquement à l’approbation.',
+                user=user or campaign.approved_by,
+            )
+            for campaign in campaigns if per_campaign[campaign.id]
+        ])
+    return created, refused
@@ -0,0 +1,135 @@
+"""
+Assignation d'une équipe (journalistes, chauffeurs) à une couverture.
+
+Tout se fait dans une transaction, en un nombre fixe de requêtes quel que
+soit le nombre de membres: une lecture `in_bulk` par type de personnel, un
+`bulk_create` pour les assignations, leurs journaux, les campagnes de
+notification et leurs tentatives e-mail, et un UPDATE par type pour passer
+les membres en mission (`workload_score` incrémenté par `F()`, sans
+lecture-écriture concurrente). Les notifications internes sont insérées en
+bloc et leur envoi hors site part après validation.
+"""
+
+import secrets
+import uuid
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import crew
+
+
+def _ids(values):
+    """Identifiants UUID valides et distincts, dans l'ordre reçu."""
+    seen = []
+    for value in values or []:
+        try:
+            value = uuid.UUID(str(value))
+        except (TypeError, ValueError):
+            continue
+        if value not in seen:
+            seen.append(value)
+    return seen
+
+
+def _crews(coverage, journalists, drivers):
+    """Un binôme si un journaliste et un chauffeur, sinon une assignation par membre."""
+    from ..models import CoverageAssignment
+
+    if len(journalists) == 1 and len(drivers) == 1:
+        pairs = [(journalists[0], drivers[0])]
+    else:
+        pairs = [(j, None) for j in journalists] + [(None, d) for d in drivers]
+    return [
+        CoverageAssignment(coverage=coverage, journalist=j, driver=d, status='assigned')
+        for j, d in pairs
+    ]
+
+
+def _notification_campaigns(assignments):
+    """Campagnes de notification des nouvelles assignations (sans contrôle d'existence)."""
+    from ..models import AssignmentLog, AssignmentNotificationAttempt, AssignmentNotificationCampaign
+    from ..utils import normalize_phone, phone_tail
+
+    campaigns, attempts, logs = [], [], []
+    for assignment in assignments:
+        recipients = []
+        if assignment.journalist:
+            recipients.append(('journalist', assignment.journalist.email, assignment.journalist.phone))
+        if assignment.driver:
+            recipients.append(('driver', None, assignment.driver.phone))
+        for kind, email_addr, phone in recipients:
+            campaign = AssignmentNotificationCampaign(
+                assignment=assignment,
+                recipient_kind=kind,
+                to_email=email_addr or None,
+                to_phone=normalize_phone(phone) or None,
+                phone_tail=phone_tail(phone),
+                confirm_code=str(secrets.randbelow(1000000)).zfill(6),
+                status='active',
+                next_attempt_at=None,
+            )
+            campaigns.append(campaign)
+            if campaign.to_email:
+                attempts.append(AssignmentNotificationAttempt(
+                    campaign=campaign,
+                    channel='email',
+                    status='queued',
+                    to=campaign.to_email,
+                    subject='Assignation couverture',
+                    body='PDF',
+                ))
+            logs.append(AssignmentLog(assignment=assignment, label='Notifications prêtes', note=kind))
+    AssignmentNotificationCampaign.objects.bulk_create(campaigns)
+    AssignmentNotificationAttempt.objects.bulk_create(attempts)
+    AssignmentLog.objects.bulk_create(logs)
+    return campaigns
+
+
+def _notify(notifications):
+    from ..signals import create_notifications
+
+    create_notifications(notifications)
+
+
+def assign(coverage, journalist_ids, driver_ids, user=None):
+    """Assigne les membres demandés à `coverage`; renvoie les assignations créées.
+
+    Les identifiants inconnus sont ignorés. Aucune assignation si aucun
+    membre valide.
+    """
+    from ..models import AssignmentLog, CoverageAssignment, Driver, Journalist, Notification, User
+
+    journalist_ids, driver_ids = _ids(journalist_ids), _ids(driver_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        found_j = Journalist.objects.in_bulk(journalist_ids) if journalist_ids else {}
+        found_d = Driver.objects.in_bulk(driver_ids) if driver_ids else {}
+        journalists = [found_j[i] for i in journalist_ids if i in found_j]
+        drivers = [found_d[i] for i in driver_ids if i in found_d]
+        created = _crews(coverage, journalists, drivers)
+        if not created:
+            return []
+        CoverageAssignment.objects.bulk_create(created)
+        AssignmentLog.objects.bulk_create([
+            AssignmentLog(assignment=a, label='Assignation créée') for a in created
+        ])
+        if journalists:
+            Journalist.objects.filter(id__in=[j.id for j in journalists]).update(
+                status='on_mission', workload_score=F('workload_score') + 1, updated_at=now,
+            )
+        if drivers:
+            Driver.objects.filter(id__in=[d.id for d in drivers]).update(status='on_mission', updated_at=now)
+
+        recipients = list(User.objects.filter(role='admin'))
+        if user is not None and user.pk not in {r.pk for r in recipients}:
+            recipients.append(user)
+        _notify([
+            Notification(user=r, title='Assignation couverture', message=f'{coverage.event_title}', type='success', related_coverage=coverage)
+            for r in recipients
+        ])
+        _notification_campaigns(created)
+        # `bulk_create` n'émet pas de signaux: créneaux des équipes à rafraîchir
+        transaction.on_commit(lambda: crew.coverage_changed(coverage.id))
+    return created
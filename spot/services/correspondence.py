@@ -0,0 +1,228 @@
+"""
+Correspondance client / support: boîte de réception et fenêtres de messages.
+
+Chaque discussion porte son dernier message (`last_message`), un aperçu et
+le nombre de messages, tenus à jour à l'enregistrement d'un message par un
+UPDATE (`F()`) de la discussion. La boîte de réception n'a ainsi besoin
+d'aucun message pour afficher ses lignes; elle est paginée par curseur.
+Une discussion s'affiche par fenêtres des messages les plus récents, les
+plus anciens étant chargés à la demande (« messages précédents »).
+
+Tout nouveau message passe par `post_message` (pages et WebSocket): statut,
+notifications, puis publication après validation au groupe de la discussion
+(`correspondence.<id>`), où les participants connectés le reçoivent sans
+recharger la page, avec les indications de saisie et de lecture.
+"""
+
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from ..pagination import KeysetPaginator
+
+try:
+    from channels.layers import get_channel_layer
+    from asgiref.sync import async_to_sync
+except Exception:
+    get_channel_layer = None
+    async_to_sync = None
+
+
+logger = logging.getLogger('spot')
+
+PREVIEW_LENGTH = 160
+INBOX_PAGE = 20
+MESSAGE_WINDOW = 30
+INBOX_ORDERING = ('-last_message_at', '-created_at')
+GROUP_PREFIX = 'correspondence.'
+# Délai entre deux relances client sans réponse du support
+CLIENT_REPLY_DELAY = datetime.timedelta(hours=24)
+
+
+def preview(text):
+    text = ' '.join(str(text or '').split())
+    if len(text) <= PREVIEW_LENGTH:
+        return text
+    return text[:PREVIEW_LENGTH - 1].rstrip() + '…'
+
+
+def message_saved(message, created):
+    """Met à jour la discussion de `message` (un UPDATE, sans relire ses messages)."""
+    from ..models import CorrespondenceThread
+
+    thread = message.thread
+    snippet = preview(message.content)
+    if created:
+        CorrespondenceThread.objects.filter(pk=message.thread_id).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            last_message_preview=snippet,
+            message_count=F('message_count') + 1,
+            updated_at=timezone.now(),
+        )
+        thread.message_count = (thread.message_count or 0) + 1
+    elif thread.last_message_id == message.pk:
+        CorrespondenceThread.objects.filter(pk=message.thread_id, last_message=message).update(
+            last_message_preview=snippet,
+        )
+    else:
+        return
+    thread.last_message = message
+    thread.last_message_at = message.created_at
+    thread.last_message_preview = snippet
+
+
+def refresh_thread(thread_id):
+    """Recalcule dernier message, aperçu et nombre (après suppression de messages)."""
+    from ..models import CorrespondenceMessage, CorrespondenceThread
+
+    last = (
+        CorrespondenceMessage.objects.filter(thread_id=thread_id)
+        .order_by('-created_at', '-id').only('id', 'content', 'created_at').first()
+    )
+    CorrespondenceThread.objects.filter(pk=thread_id).update(
+        last_message=last,
+        last_message_at=last.created_at if last else None,
+        last_message_preview=preview(last.content) if last else '',
+        message_count=CorrespondenceMessage.objects.filter(thread_id=thread_id).count(),
+    )
+
+
+def inbox(user, status=None, search=None):
+    """Discussions visibles par `user`, avec le dernier message (sans son contenu)."""
+    from ..models import CorrespondenceThread
+    from . import search as text_search
+
+    threads = CorrespondenceThread.objects.select_related('related_campaign', 'last_message').defer('last_message__content')
+    if user.is_admin():
+        threads = threads.select_related('client')
+    else:
+        threads = threads.filter(client=user)
+    if status:
+        threads = threads.filter(status=status)
+    if search:
+        threads = threads.filter(text_search.text_match('thread', search))
+    return threads
+
+
+def inbox_page(threads, cursor=None, per_page=INBOX_PAGE):
+    return KeysetPaginator(threads, INBOX_ORDERING, per_page=per_page).get_page(cursor)
+
+
+def status_counts(user):
+    """{statut: nombre} en une requête."""
+    from ..models import CorrespondenceThread
+
+    threads = CorrespondenceThread.objects.all()
+    if not user.is_admin():
+        threads = threads.filter(client=user)
+    return threads.aggregate(
+        open=Count('id', filter=Q(status='open')),
+        pending=Count('id', filter=Q(status='pending')),
+        closed=Count('id', filter=Q(status='closed')),
+    )
+
+
+def message_window(thread, cursor=None, size=MESSAGE_WINDOW):
+    """Fenêtre de `size` messages (les plus récents, ou antérieurs à `cursor`).
+
+    Renvoie (messages dans l'ordre chronologique, curseur des précédents ou None).
+    """
+    paginator = KeysetPaginator(
+        thread.messages.select_related('author'), ('-created_at', '-id'), per_page=size,
+    )
+    page = paginator.get_page(cursor)
+    return list(reversed(page.object_list)), page.next_cursor
+
+
+def group_for(thread_id):
+    return f'{GROUP_PREFIX}{thread_id}'
+
+
+def is_staff(user):
+    return bool(getattr(user, 'is_admin', lambda: False)() or getattr(user, 'is_staff', False))
+
+
+def can_access(user, thread):
+    return is_staff(user) or thread.client_id == user.id
+
+
+def next_reply_at(thread, user):
+    """Heure à partir de laquelle un client peut relancer, ou None s'il le peut."""
+    last = thread.last_message
+    if not user.is_client() or not last or last.author_id != user.id:
+        return None
+    limit = last.created_at + CLIENT_REPLY_DELAY
+    return limit if timezone.now() < limit else None
+
+
+def message_payload(message):
+    return {
+        'id': str(message.id),
+        'author_id': message.author_id,
+        'author': message.author.username,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'attachment': message.attachment.url if message.attachment else '',
+    }
+
+
+def publish(thread_id, event):
+    """Envoie `event` aux participants connectés (sans effet sans couche de canaux)."""
+    if not get_channel_layer or not async_to_sync:
+        return
+    layer = get_channel_layer()
+    if not layer:
+        return
+    try:
+        async_to_sync(layer.group_send)(group_for(thread_id), event)
+    except Exception:
+        logger.warning('Publication correspondance impossible thread=%s type=%s', thread_id, event.get('type'))
+
+
+def post_message(thread, author, content, attachment=None, notify=True):
+    """Enregistre un message, met à jour le statut, notifie, puis publie.
+
+    Un message du client met la discussion en attente et prévient les
+    administrateurs; une réponse du support la rouvre et prévient le client.
+    """
+    from ..models import CorrespondenceMessage, Notification, User
+
+    with transaction.atomic():
+        message = CorrespondenceMessage.objects.create(
+            thread=thread, author=author, content=content, attachment=attachment,
+        )
+        if author.id == thread.client_id:
+            thread.status = 'pending'
+            recipients = list(User.objects.filter(role='admin')) if notify else []
+            title, text = 'Nouveau message', f'{author.username} a écrit sur "{thread.subject}".'
+        else:
+            thread.status = 'open'
+            recipients = [thread.client] if notify else []
+            title, text = 'Réponse du support', f'Nouvelle réponse sur votre demande "{thread.subject}".'
+        for user in recipients:
+            Notification.objects.create(
+                user=user,
+                title=title,
+                message=text,
+                related_campaign=thread.related_campaign,
+                related_thread=thread,
+            )
+        thread.save(update_fields=['status', 'updated_at'])
+        event = {
+            'type': 'correspondence_message',
+            'message': message_payload(message),
+            'status': thread.status,
+        }
+        transaction.on_commit(lambda: publish(thread.id, event))
+    return message
+
+
+def mark_read(thread, user):
+    """Marque lues les notifications de `user` liées à la discussion."""
+    from ..models import Notification
+
+    return Notification.objects.filter(user=user, related_thread=thread, is_read=False).update(is_read=True)
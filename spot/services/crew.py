@@ -0,0 +1,265 @@
+"""
+Recommandation d'équipe (journalistes, chauffeurs) pour une couverture.
+
+Les assignations sont tenues en mémoire par jour et par personne sous forme
+de créneaux triés (minutes depuis minuit, bisection), d'après les heures de
+début et de fin des demandes. Classer l'effectif pour une couverture ne lit
+que ces créneaux: disponibilité sur le créneau (marge de déplacement
+comprise), temps libre avant et après, spécialités du journaliste retrouvées
+dans la demande, charge des `LOAD_DAYS` derniers jours.
+
+Les jours manquants sont chargés en une requête. Après une modification
+d'assignation ou de demande (signaux, après validation), le processus
+concerné corrige ses créneaux sur place et avance la version partagée
+(`crew:version`); un autre processus qui voit une version inconnue vide ses
+jours et les recharge à la demande. Seules les assignations « assignée » et
+« sur le terrain » occupent un créneau; toutes comptent dans la charge.
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import timedelta
+
+from . import versions
+
+
+VERSION_KEY = 'crew:version'
+OPEN_STATUSES = ('assigned', 'in_field')
+UNAVAILABLE_STATUSES = ('resting', 'offline')
+DAY = 24 * 60
+DEFAULT_DURATION = 120  # demandes sans heure de fin (minutes)
+BUFFER = 30  # déplacement avant et après (minutes)
+FREE_CAP = 240  # au-delà, le temps libre autour du créneau ne départage plus
+LOAD_DAYS = 7
+MAX_DAYS = 62
+W_FREE, W_SPECIALTY, W_LOAD = 0.5, 0.3, 0.2
+
+
+def _span(start_time, end_time):
+    """Créneau (début, fin) en minutes; borné à la journée."""
+    start = start_time.hour * 60 + start_time.minute if start_time else 0
+    end = end_time.hour * 60 + end_time.minute if end_time else None
+    if end is None or end <= start:
+        end = start + DEFAULT_DURATION
+    return start, min(end, DAY)
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def specialties(value):
+    raw = _fold(value).replace(';', ',').replace('\n', ',')
+    return [s.strip() for s in raw.split(',') if s.strip()]
+
+
+class _Timeline:
+    """Créneaux d'une personne sur une journée, triés par début."""
+
+    __slots__ = ('starts', 'entries')
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []
+
+    def add(self, start, end, assignment_id):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.entries.insert(i, (start, end, assignment_id))
+
+    def discard(self, assignment_id):
+        for i, entry in enumerate(self.entries):
+            if entry[2] == assignment_id:
+                del self.starts[i]
+                del self.entries[i]
+                return
+
+
+class _Day:
+    def __init__(self):
+        self.people = {}  # (type, id) -> _Timeline
+        self.assignments = {}  # id -> (début, fin, demande, titre, statut, clés)
+
+    def add(self, assignment_id, journalist_id, driver_id, coverage_id, title, status, start_time, end_time):
+        start, end = _span(start_time, end_time)
+        keys = [k for k in (('journalist', journalist_id), ('driver', driver_id)) if k[1]]
+        self.assignments[assignment_id] = (start, end, coverage_id, title, status, keys)
+        for key in keys:
+            self.people.setdefault(key, _Timeline()).add(start, end, assignment_id)
+
+    def discard(self, assignment_id):
+        found = self.assignments.pop(assignment_id, None)
+        if found:
+            for key in found[5]:
+                self.people[key].discard(assignment_id)
+
+    def load(self, key, exclude):
+        timeline = self.people.get(key)
+        if not timeline:
+            return 0
+        return sum(1 for _, _, a in timeline.entries if self.assignments[a][2] != exclude)
+
+
+_lock = threading.Lock()
+_local = {'version': None, 'days': OrderedDict()}
+
+
+def _rows(**filters):
+    from ..models import CoverageAssignment
+
+    return CoverageAssignment.objects.filter(**filters).values_list(
+        'id', 'journalist_id', 'driver_id', 'coverage_id', 'coverage__event_title', 'status',
+        'coverage__start_time', 'coverage__end_time', 'coverage__event_date',
+    )
+
+
+def _current_version():
+    return versions.current(VERSION_KEY)
+
+
+def _days(dates):
+    """Jours demandés, les manquants chargés en une requête (verrou tenu)."""
+    days = _local['days']
+    version = _current_version()
+    if _local['version'] != version:
+        days.clear()
+        _local['version'] = version
+    missing = [d for d in dates if d not in days]
+    if missing:
+        for d in missing:
+            days[d] = _Day()
+        for row in _rows(coverage__event_date__in=missing):
+            days[row[8]].add(*row[:8])
+    for d in dates:
+        days.move_to_end(d)
+    while len(days) > MAX_DAYS:
+        days.popitem(last=False)
+    return [days[d] for d in dates]
+
+
+def _advance():
+    """Nouvelle version partagée; les jours locaux restent valides s'ils étaient à jour."""
+    version = versions.bump(VERSION_KEY)
+    if _local['version'] != version - 1:
+        _local['days'].clear()
+    _local['version'] = version
+
+
+def _apply(discard, rows):
+    days = _local['days']
+    for day in days.values():
+        discard(day)
+    for row in rows:
+        day = days.get(row[8])
+        if day is not None:
+            day.add(*row[:8])
+
+
+def assignment_changed(assignment_id):
+    """Assignation créée, modifiée ou supprimée (après validation)."""
+    with _lock:
+        _apply(lambda day: day.discard(assignment_id), _rows(id=assignment_id) if _local['days'] else [])
+        _advance()
+
+
+def coverage_changed(coverage_id):
+    """Demande modifiée (date, heures, titre) ou supprimée (après validation)."""
+    def discard(day):
+        for assignment_id in [a for a, v in day.assignments.items() if v[2] == coverage_id]:
+            day.discard(assignment_id)
+
+    with _lock:
+        _apply(discard, _rows(coverage_id=coverage_id) if _local['days'] else [])
+        _advance()
+
+
+def reset():
+    with _lock:
+        _local['version'] = None
+        _local['days'].clear()
+
+
+def _score(key, window, today, history, coverage_id):
+    """Disponibilité d'une personne: (conflits, déjà assignée, libre avant, libre après, charge)."""
+    start, end = window
+    conflicts, assigned = [], False
+    free_before, free_after = start, DAY - end
+    timeline = today.people.get(key)
+    for s, e, a in timeline.entries if timeline else ():
+        entry = today.assignments[a]
+        if entry[2] == coverage_id:
+            assigned = assigned or entry[4] in OPEN_STATUSES
+            continue
+        if entry[4] not in OPEN_STATUSES:
+            continue
+        if s < end + BUFFER and e > start - BUFFER:
+            conflicts.append({'coverage_id': str(entry[2]), 'title': entry[3], 'start': s, 'end': e})
+        elif e <= start:
+            free_before = min(free_before, start - e)
+        elif s >= end:
+            free_after = min(free_after, s - end)
+    load = sum(day.load(key, coverage_id) for day in history)
+    return conflicts, assigned, free_before, free_after, load
+
+
+def _clock(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def recommend(coverage):
+    """Effectif classé pour `coverage`: {'journalists': [...], 'drivers': [...]}.
+
+    Les personnes disponibles passent en premier, par score décroissant
+    (0-100); les indisponibles (statut, créneau occupé) suivent.
+    """
+    from ..models import Driver, Journalist
+
+    window = _span(coverage.start_time, coverage.end_time)
+    dates = [coverage.event_date - timedelta(days=n) for n in range(LOAD_DAYS, -1, -1)]
+    with _lock:
+        history = _days(dates)
+        today = history[-1]
+        roster = [
+            ('journalist', pk, name, status, specialties(spec))
+            for pk, name, status, spec in Journalist.objects.values_list('id', 'name', 'status', 'specialties')
+        ] + [
+            ('driver', pk, name, status, None)
+            for pk, name, status in Driver.objects.values_list('id', 'name', 'status')
+        ]
+        measured = [
+            (person, _score(person[:2], window, today, history, coverage.id)) for person in roster
+        ]
+
+    text = _fold(' '.join([
+        coverage.event_title, coverage.description, coverage.coverage_objective, coverage.event_type_other,
+        coverage.get_event_type_display(), coverage.get_coverage_type_display(),
+    ]))
+    max_load = max([m[1][4] for m in measured] + [1])
+    ranked = {'journalist': [], 'driver': []}
+    for (kind, pk, name, status, tags), (conflicts, assigned, before, after, load) in measured:
+        free = min(before, after, FREE_CAP) / FREE_CAP
+        rest = 1 - load / max_load
+        matched = [t for t in tags if t in text] if tags is not None else []
+        if tags is None:
+            score = (W_FREE * free + W_LOAD * rest) / (W_FREE + W_LOAD)
+        else:
+            score = W_FREE * free + W_SPECIALTY * (1 if matched else 0) + W_LOAD * rest
+        ranked[kind].append({
+            'id': str(pk),
+            'name': name,
+            'status': status,
+            'available': status not in UNAVAILABLE_STATUSES and not conflicts,
+            'assigned': assigned,
+            'score': round(100 * score),
+            'free_before': before,
+            'free_after': after,
+            'recent_load': load,
+            'specialties': matched,
+            'conflicts': [dict(c, start=_clock(c['start']), end=_clock(c['end'])) for c in conflicts],
+        })
+    for items in ranked.values():
+        items.sort(key=lambda i: (not i['available'], -i['score'], i['name']))
+    return {'journalists': ranked['journalist'], 'drivers': ranked['driver']}
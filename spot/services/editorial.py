@@ -0,0 +1,95 @@
+"""
+Accès aux données des écrans de la rédaction (planning, couvertures, détail).
+
+Chaque écran s'exécute en un petit nombre fixe de requêtes, quel que soit le
+nombre de lignes: les assignations sont préchargées triées dans des
+attributs (`Prefetch(..., to_attr=...)`) avec journaliste et chauffeur,
+leurs journaux triés de même; « non assignée » est un `NOT EXISTS` corrélé
+au lieu d'un `GROUP BY` sur toute la table. Les compteurs par statut sont
+une requête, mise en cache brièvement et effacée à chaque modification
+d'une demande (signaux).
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Prefetch
+
+
+STATUS_COUNTS_KEY = 'editorial:status_counts'
+STATUS_COUNTS_TTL = 30
+
+
+def _assignments():
+    from ..models import CoverageAssignment
+
+    return CoverageAssignment.objects.select_related('journalist', 'driver').order_by('-assigned_at')
+
+
+def with_assignments(queryset):
+    """Précharge les assignations (plus récentes d'abord) dans `sorted_assignments`."""
+    return queryset.prefetch_related(
+        Prefetch('assignments', queryset=_assignments(), to_attr='sorted_assignments'),
+    )
+
+
+def latest_assignment(coverage):
+    assignments = getattr(coverage, 'sorted_assignments', None)
+    if assignments is None:
+        return coverage.assignments.select_related('journalist', 'driver').order_by('-assigned_at').first()
+    return assignments[0] if assignments else None
+
+
+def unassigned(queryset):
+    """Demandes sans aucune assignation (`NOT EXISTS`)."""
+    from ..models import CoverageAssignment
+
+    return queryset.filter(~Exists(CoverageAssignment.objects.filter(coverage=OuterRef('pk'))))
+
+
+def planning_items(queryset):
+    """Lignes du planning: une requête pour les demandes, une pour les assignations."""
+    from django.urls import reverse
+
+    items = []
+    for cv in with_assignments(queryset.select_related('user')):
+        ass = latest_assignment(cv)
+        items.append({
+            'id': str(cv.id),
+            'title': cv.event_title,
+            'date': cv.event_date,
+            'time': cv.start_time,
+            'type': cv.event_type,
+            'address': cv.address,
+            'journalist': ass.journalist.name if ass and ass.journalist else '',
+            'driver': ass.driver.name if ass and ass.driver else '',
+            'status': cv.status,
+            'detail_url': reverse('editorial_coverage_detail', args=[cv.id]),
+        })
+    return items
+
+
+def coverage_assignments(coverage):
+    """Assignations d'une demande avec journaux (`sorted_logs`) et relances préchargés."""
+    from ..models import AssignmentLog
+
+    return list(
+        _assignments().filter(coverage=coverage).prefetch_related(
+            Prefetch('logs', queryset=AssignmentLog.objects.order_by('at'), to_attr='sorted_logs'),
+            'notification_campaigns',
+        )
+    )
+
+
+def status_counts():
+    """{statut: nombre} des demandes (une requête, cache de quelques secondes)."""
+    from ..models import CoverageRequest
+
+    counts = cache.get(STATUS_COUNTS_KEY)
+    if counts is None:
+        rows = CoverageRequest.objects.order_by().values('status').annotate(count=Count('id'))
+        counts = {row['status']: row['count'] for row in rows}
+        cache.set(STATUS_COUNTS_KEY, counts, STATUS_COUNTS_TTL)
+    return counts
+
+
+def invalidate_counts():
+    cache.delete(STATUS_COUNTS_KEY)
@@ -0,0 +1,346 @@
+"""
+Client HTTP des passerelles d'envoi (SMS, WhatsApp).
+
+Un client par passerelle, partagé par les threads du processus:
+
+- connexions persistantes (keep-alive) réutilisées depuis un pool borné; le
+  pool borne aussi la concurrence: au-delà de `max_connections` envois
+  simultanés, l'appelant attend au plus `pool_timeout` puis échoue. Une
+  connexion inactive depuis plus de `MAX_IDLE` secondes est refermée plutôt
+  que réutilisée (le fournisseur l'a probablement coupée);
+- nouvelles tentatives, avec attente exponentielle aléatoire (« full
+  jitter »), seulement quand le message n'a pas pu partir: échec de
+  connexion ou d'écriture de la requête, réponse 429/503. Une 502/504, une
+  coupure ou une expiration pendant l'attente de la réponse ne sont pas
+  rejouées: le fournisseur a pu envoyer le message;
+- disjoncteur: après `failure_threshold` échecs consécutifs, les envois
+  échouent immédiatement pendant `reset_timeout` secondes, puis un seul
+  envoi d'essai décide de la reprise. Une panne du fournisseur ne bloque
+  plus les threads web et les processus de relance;
+- corps JSON produit au fil de l'envoi pour les pièces jointes (base64 par
+  blocs, longueur calculée d'avance): ni copie encodée du fichier entier ni
+  chaîne JSON complète en mémoire.
+
+Réglages: `SPOT_GATEWAY_TIMEOUT`, `SPOT_GATEWAY_MAX_CONNECTIONS`,
+`SPOT_GATEWAY_POOL_TIMEOUT`, `SPOT_GATEWAY_RETRIES`,
+`SPOT_GATEWAY_BREAKER_THRESHOLD`, `SPOT_GATEWAY_BREAKER_RESET`.
+"""
+
+import base64
+import http.client
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.parse
+
+from django.conf import settings
+
+
+logger = logging.getLogger('spot')
+
+# Refus avant traitement: rejouer ne duplique pas le message
+RETRY_STATUSES = {429, 503}
+MAX_IDLE = 15.0
+CHUNK = 48 * 1024  # multiple de 3: blocs base64 sans remplissage intermédiaire
+
+
+class GatewayError(Exception):
+    def __init__(self, message, status=None, body=''):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class CircuitOpen(GatewayError):
+    pass
+
+
+class _NotSent(Exception):
+    """Connexion ou écriture de la requête en échec: rien n'a été traité."""
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / demi-ouvert, partagé entre threads."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class _Pool:
+    """Connexions inactives d'une origine; le sémaphore borne les envois simultanés."""
+
+    def __init__(self, scheme, host, port, timeout, max_connections):
+        self.scheme, self.host, self.port = scheme, host, port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self, wait):
+        if not self.slots.acquire(timeout=wait):
+            raise GatewayError('Passerelle saturée (pool de connexions)')
+        while True:
+            try:
+                conn, since = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - since < MAX_IDLE:
+                return conn
+            conn.close()
+
+    def release(self, conn, reusable):
+        if reusable:
+            self.idle.put((conn, time.monotonic()))
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+
+class Body:
+    """Corps de requête rejouable: longueur connue et générateur de blocs."""
+
+    def __init__(self, length, factory):
+        self.length = length
+        self.factory = factory
+
+    @classmethod
+    def of(cls, data):
+        return cls(len(data), lambda: iter((data,)))
+
+
+def _size(content):
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return len(content)
+    pos = content.tell()
+    content.seek(0, 2)
+    size = content.tell() - pos
+    content.seek(pos)
+    return size
+
+
+def _b64_chunks(content):
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        view = memoryview(content)
+        for i in range(0, len(view), CHUNK):
+            yield base64.b64encode(view[i:i + CHUNK])
+        return
+    start = content.tell()
+    try:
+        while True:
+            block = content.read(CHUNK)
+            if not block:
+                return
+            yield base64.b64encode(block)
+    finally:
+        content.seek(start)
+
+
+def json_body(payload, attachments=None):
+    """Corps JSON de `payload` plus `attachments` [(nom, contenu, type)] encodées au fil de l'eau.
+
+    `contenu` est un `bytes` ou un fichier ouvert en binaire (relu à chaque tentative).
+    """
+    attachments = [a for a in attachments or [] if a]
+    if not attachments:
+        return Body.of(json.dumps(payload).encode('utf-8'))
+    head = json.dumps(payload).encode('utf-8')[:-1] + (b', ' if payload else b'') + b'"attachments": ['
+    parts = []
+    for i, (filename, content, mimetype) in enumerate(attachments):
+        meta = json.dumps({'filename': filename, 'mimetype': mimetype}).encode('utf-8')
+        prefix = (b', ' if i else b'') + meta[:-1] + b', "content_base64": "'
+        parts.append((prefix, content, b'"}'))
+    tail = b']}'
+    length = len(head) + len(tail) + sum(
+        len(prefix) + 4 * ((_size(content) + 2) // 3) + len(suffix) for prefix, content, suffix in parts
+    )
+
+    def factory():
+        yield head
+        for prefix, content, suffix in parts:
+            yield prefix
+            yield from _b64_chunks(content)
+            yield suffix
+        yield tail
+
+    return Body(length, factory)
+
+
+class GatewayClient:
+    def __init__(self, url, token='', timeout=10.0, max_connections=10, pool_timeout=5.0,
+                 retries=2, backoff=0.2, backoff_cap=2.0, breaker=None):
+        parts = urllib.parse.urlsplit(url)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.pool_timeout = pool_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.pool = _Pool(
+            parts.scheme or 'http', parts.hostname, parts.port, timeout, max_connections,
+        )
+
+    def _headers(self, body):
+        headers = {'Content-Type': 'application/json', 'Content-Length': str(body.length)}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+
+    def _once(self, body):
+        """Une requête; renvoie (statut, corps). Les erreurs réseau remontent,
+        `_NotSent` si la requête n'a pas pu être écrite."""
+        conn = self.pool.acquire(self.pool_timeout)
+        reusable = False
+        try:
+            try:
+                conn.request('POST', self.path, body=body.factory(), headers=self._headers(body))
+            except (ConnectionError, TimeoutError) as exc:
+                raise _NotSent() from exc
+            resp = conn.getresponse()
+            data = resp.read() or b''
+            reusable = not resp.will_close
+            return resp.status, data
+        finally:
+            self.pool.release(conn, reusable)
+
+    def post(self, body):
+        """Envoie `body` (`Body`); renvoie le JSON de la réponse (dict).
+
+        Lève `CircuitOpen` si le disjoncteur est ouvert, `GatewayError` sinon.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen('Passerelle indisponible (disjoncteur ouvert)')
+        # Toute sortie (réponse, refus, exception, pool saturé) renseigne le
+        # disjoncteur et libère l'éventuel envoi d'essai
+        healthy = False
+        try:
+            attempt = 0
+            while True:
+                try:
+                    status, data = self._once(body)
+                except _NotSent as exc:
+                    # Connexion refusée ou coupée avant l'envoi complet
+                    cause = exc.__cause__
+                    error = GatewayError(str(cause) or cause.__class__.__name__)
+                except (OSError, http.client.HTTPException) as exc:
+                    raise GatewayError(str(exc) or exc.__class__.__name__) from exc
+                else:
+                    text = data.decode('utf-8', 'replace')
+                    if status < 400:
+                        healthy = True
+                        try:
+                            parsed = json.loads(text or '{}')
+                        except ValueError:
+                            parsed = {}
+                        return parsed if isinstance(parsed, dict) else {}
+                    error = GatewayError(f'HTTP {status}', status=status, body=text)
+                    if status < 500 and status not in RETRY_STATUSES:
+                        # Refus du fournisseur (requête invalide): pas une panne
+                        healthy = True
+                        raise error
+                    if status not in RETRY_STATUSES:
+                        raise error
+                if attempt >= self.retries:
+                    raise error
+                time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt)))
+                attempt += 1
+        finally:
+            if healthy:
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+
+    def post_json(self, payload, attachments=None):
+        return self.post(json_body(payload, attachments))
+
+    def close(self):
+        self.pool.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(url, token=''):
+    """Client partagé pour `url` (créé au premier appel avec les réglages)."""
+    key = (url, token)
+    with _clients_lock:
+        found = _clients.get(key)
+        if found is None:
+            found = GatewayClient(
+                url,
+                token=token,
+                timeout=float(getattr(settings, 'SPOT_GATEWAY_TIMEOUT', 10)),
+                max_connections=int(getattr(settings, 'SPOT_GATEWAY_MAX_CONNECTIONS', 10)),
+                pool_timeout=float(getattr(settings, 'SPOT_GATEWAY_POOL_TIMEOUT', 5)),
+                retries=int(getattr(settings, 'SPOT_GATEWAY_RETRIES', 2)),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(getattr(settings, 'SPOT_GATEWAY_BREAKER_THRESHOLD', 5)),
+                    reset_timeout=float(getattr(settings, 'SPOT_GATEWAY_BREAKER_RESET', 30)),
+                ),
+            )
+            _clients[key] = found
+        return found
+
+
+def reset():
+    """Ferme et oublie les clients (tests, changement de réglages)."""
+    with _clients_lock:
+        for found in _clients.values():
+            found.close()
+        _clients.clear()
+
+
+def message_id(response):
+    return response.get('id') or response.get('message_id') or response.get('sid')
@@ -0,0 +1,77 @@
+"""
+Passerelle SMS/WhatsApp factice pour les tests de charge et le développement.
+
+Accepte tout POST JSON (keep-alive HTTP/1.1), répond `{"id": ...}` après une
+latence réglable, et peut simuler des pannes (proportion de réponses 503).
+Lancement: `python manage.py run_gateway_stub --port 8025`, puis
+`SPOT_SMS_API_URL=http://127.0.0.1:8025/sms`.
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        remaining = length
+        while remaining > 0:
+            block = self.rfile.read(min(remaining, 64 * 1024))
+            if not block:
+                break
+            remaining -= len(block)
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.received += 1
+            server.bytes_received += length
+        if server.failure_rate and random.random() < server.failure_rate:
+            self._reply(503, {'error': 'unavailable'})
+        else:
+            self._reply(200, {'id': uuid.uuid4().hex})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+        self.received = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        """Démarre le serveur dans un thread; renvoie le serveur."""
+        threading.Thread(target=self.serve_forever, name='gateway-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
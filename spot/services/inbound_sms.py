@@ -0,0 +1,136 @@
+"""
+Confirmations d'assignation reçues par SMS (webhook de la passerelle).
+
+Le webhook accepte un message seul (formulaire ou paramètres d'URL) ou un
+lot JSON: tableau de messages, ou objet `{"messages": [...]}`. Chaque
+message est journalisé dans `InboundSms`; l'identifiant fournisseur y est
+unique, si bien qu'une nouvelle tentative de la passerelle est reconnue
+(une requête pour tout le lot, la contrainte d'unicité tranchant les
+envois simultanés) et reste sans effet.
+
+La campagne est retrouvée en une requête sur l'index (`confirm_code`,
+`status`, `confirmed_at`): parmi les campagnes actives portant le code,
+celle dont `phone_tail` correspond à l'expéditeur passe en premier, à
+défaut la plus récente.
+"""
+
+import json
+import logging
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, IntegerField, Value, When
+
+
+logger = logging.getLogger('spot')
+
+MAX_BATCH = 500
+CODE_RE = re.compile(r'\b(\d{6})\b')
+ID_KEYS = ('id', 'message_id', 'messageId', 'MessageSid', 'SmsSid', 'sid')
+SENDER_KEYS = ('from', 'From', 'sender', 'msisdn')
+BODY_KEYS = ('body', 'Body', 'text', 'message')
+
+
+def _first(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def _message(*sources):
+    def pick(keys):
+        for data in sources:
+            value = _first(data, keys)
+            if value:
+                return value
+        return ''
+    return {'id': pick(ID_KEYS)[:120], 'sender': pick(SENDER_KEYS)[:50], 'body': pick(BODY_KEYS)}
+
+
+def parse(request):
+    """Renvoie (messages, lot). Lève ValueError si le JSON est invalide."""
+    if 'json' in (request.content_type or ''):
+        data = json.loads(request.body or b'null')
+        if isinstance(data, dict) and isinstance(data.get('messages'), list):
+            data = data['messages']
+        if isinstance(data, list):
+            return [_message(item) for item in data if isinstance(item, dict)], True
+        if isinstance(data, dict):
+            return [_message(data)], False
+        raise ValueError('payload')
+    return [_message(request.POST, request.GET)], False
+
+
+def match(code, sender):
+    """Campagne active à confirmer pour `code`, l'expéditeur départageant (une requête)."""
+    from ..models import AssignmentNotificationCampaign
+    from ..utils import normalize_phone, phone_tail
+
+    qs = AssignmentNotificationCampaign.objects.select_related('assignment').filter(
+        confirm_code=code, status='active', confirmed_at__isnull=True,
+    )
+    tail = phone_tail(normalize_phone(sender))
+    if tail:
+        qs = qs.annotate(
+            sender_match=Case(When(phone_tail=tail, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        ).order_by('-sender_match', '-created_at')
+    else:
+        qs = qs.order_by('-created_at')
+    return qs.first()
+
+
+def _receive(message):
+    """Traite un message nouveau; renvoie (résultat, doublon)."""
+    from ..models import InboundSms
+    from ..utils import confirm_assignment_notification_campaign
+
+    found = CODE_RE.search(message['body'])
+    campaign = match(found.group(1), message['sender']) if found else None
+    result = 'confirmed' if campaign else ('campaign_not_found' if found else 'code_missing')
+    try:
+        with transaction.atomic():
+            record = InboundSms.objects.create(
+                provider_message_id=message['id'] or None,
+                sender=message['sender'],
+                body=message['body'],
+                campaign=campaign,
+                result=result,
+            )
+            if campaign and not confirm_assignment_notification_campaign(campaign, via='sms'):
+                record.result = result = 'already_confirmed'
+                record.save(update_fields=['result'])
+    except IntegrityError:
+        # Même identifiant enregistré entre-temps par une requête concurrente
+        previous = InboundSms.objects.filter(provider_message_id=message['id']).values_list('result', flat=True).first()
+        return previous or result, True
+    return result, False
+
+
+def ingest(messages):
+    """Traite un lot; renvoie [{'id', 'result', 'duplicate'}] dans l'ordre reçu.
+
+    `result` vaut 'error' si le traitement a échoué: rien n'est enregistré
+    et une nouvelle tentative reprendra le message.
+    """
+    from ..models import InboundSms
+
+    ids = {m['id'] for m in messages if m['id']}
+    seen = dict(
+        InboundSms.objects.filter(provider_message_id__in=ids).values_list('provider_message_id', 'result')
+    ) if ids else {}
+    results = []
+    for message in messages:
+        if message['id'] and message['id'] in seen:
+            result, duplicate = seen[message['id']], True
+        else:
+            try:
+                result, duplicate = _receive(message)
+            except Exception:
+                logger.error('Erreur confirmation SMS assignation', exc_info=True)
+                result, duplicate = 'error', False
+            if message['id'] and result != 'error':
+                seen[message['id']] = result
+        results.append({'id': message['id'], 'result': result, 'duplicate': duplicate})
+    return results
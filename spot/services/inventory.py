@@ -0,0 +1,251 @@
+"""
+Inventaire du temps d'antenne publicitaire par créneau (`TimeSlot`) et par jour.
+
+`SlotInventory` cumule, pour chaque (créneau, jour), la durée réservée et le
+nombre de spots. Les signaux de `SpotSchedule` et `Spot` l'ajustent par
+incréments (`F()`), dans la transaction de la modification; les insertions
+groupées (`bulk_create`, sans signaux) appellent `add_schedules`. La commande
+`rebuild_slot_inventory` recalcule tout à partir des programmations.
+
+Capacité d'un créneau: `ad_capacity_seconds` si renseigné (bloquant), sinon
+une valeur indicative proportionnelle à sa durée (`SLOT_AD_SECONDS_PER_HOUR`).
+"""
+
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+
+DEFAULT_AD_SECONDS_PER_HOUR = 12 * 60
+MAX_RANGE_DAYS = 92
+
+
+def capacity(slot):
+    """Secondes vendables par jour pour `slot`."""
+    if slot.ad_capacity_seconds is not None:
+        return slot.ad_capacity_seconds
+    start = datetime.datetime.combine(datetime.date.min, slot.start_time)
+    end = datetime.datetime.combine(datetime.date.min, slot.end_time)
+    if end <= start:
+        end += datetime.timedelta(days=1)
+    per_hour = getattr(settings, 'SLOT_AD_SECONDS_PER_HOUR', DEFAULT_AD_SECONDS_PER_HOUR)
+    return int((end - start).total_seconds() / 3600 * per_hour)
+
+
+def is_enforced(slot):
+    return slot.ad_capacity_seconds is not None
+
+
+def adjust(slot_id, day, seconds, count):
+    """Ajoute `seconds` et `count` (éventuellement négatifs) au compteur du jour."""
+    from ..models import SlotInventory
+
+    if not seconds and not count:
+        return
+    updated = SlotInventory.objects.filter(time_slot_id=slot_id, broadcast_date=day).update(
+        booked_seconds=F('booked_seconds') + seconds,
+        spot_count=F('spot_count') + count,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            SlotInventory.objects.create(
+                time_slot_id=slot_id, broadcast_date=day, booked_seconds=seconds, spot_count=count,
+            )
+    except IntegrityError:
+        # Créée entre-temps par une autre transaction
+        SlotInventory.objects.filter(time_slot_id=slot_id, broadcast_date=day).update(
+            booked_seconds=F('booked_seconds') + seconds,
+            spot_count=F('spot_count') + count,
+        )
+
+
+def add_schedules(schedules, sign=1):
+    """Ajoute (ou retire, `sign=-1`) des programmations, regroupées par (créneau, jour)."""
+    seconds, counts = Counter(), Counter()
+    for sched in schedules:
+        key = (sched.time_slot_id, sched.broadcast_date)
+        seconds[key] += sign * (sched.spot.duration_seconds or 0)
+        counts[key] += sign
+    for (slot_id, day), count in counts.items():
+        adjust(slot_id, day, seconds[(slot_id, day)], count)
+
+
+def _booked_rows(schedules):
+    return (
+        schedules.order_by()
+        .values('time_slot_id', 'broadcast_date')
+        .annotate(seconds=Coalesce(Sum('spot__duration_seconds'), 0), spots=Count('id'))
+    )
+
+
+def _spot_days(spot):
+    from ..models import SpotSchedule
+
+    return (
+        SpotSchedule.objects.filter(spot=spot).order_by()
+        .values_list('time_slot_id', 'broadcast_date').annotate(spots=Count('id'))
+    )
+
+
+def remove_spot(spot):
+    """Retire toutes les programmations de `spot` (requête groupée, avant suppression)."""
+    seconds = spot.duration_seconds or 0
+    for slot_id, day, spots in _spot_days(spot):
+        adjust(slot_id, day, -seconds * spots, -spots)
+
+
+def change_spot_duration(spot, delta):
+    """Répercute un changement de durée de `delta` secondes sur les jours du spot."""
+    if not delta:
+        return
+    for slot_id, day, spots in _spot_days(spot):
+        adjust(slot_id, day, delta * spots, 0)
+
+
+def rebuild(start=None, end=None):
+    """Recalcule l'inventaire (sur la plage de dates si donnée); renvoie le nombre de lignes."""
+    from ..models import SlotInventory, SpotSchedule
+
+    schedules = SpotSchedule.objects.all()
+    existing = SlotInventory.objects.all()
+    if start:
+        schedules = schedules.filter(broadcast_date__gte=start)
+        existing = existing.filter(broadcast_date__gte=start)
+    if end:
+        schedules = schedules.filter(broadcast_date__lte=end)
+        existing = existing.filter(broadcast_date__lte=end)
+    rows = [
+        SlotInventory(
+            time_slot_id=row['time_slot_id'], broadcast_date=row['broadcast_date'],
+            booked_seconds=row['seconds'], spot_count=row['spots'],
+        )
+        for row in _booked_rows(schedules).iterator()
+    ]
+    with transaction.atomic():
+        existing.delete()
+        SlotInventory.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def booked(slot_ids, start, end):
+    """{(créneau, jour): (secondes, spots)} lus en une requête."""
+    from ..models import SlotInventory
+
+    rows = SlotInventory.objects.filter(
+        time_slot_id__in=list(slot_ids), broadcast_date__range=(start, end),
+    ).values_list('time_slot_id', 'broadcast_date', 'booked_seconds', 'spot_count')
+    return {(slot_id, day): (seconds, spots) for slot_id, day, seconds, spots in rows}
+
+
+def availability(start, end, slots=None):
+    """Disponibilités par jour et par créneau actif entre `start` et `end` (inclus)."""
+    from ..models import TimeSlot
+
+    if end < start:
+        start, end = end, start
+    end = min(end, start + datetime.timedelta(days=MAX_RANGE_DAYS - 1))
+    slots = list(slots if slots is not None else TimeSlot.objects.filter(is_active=True))
+    taken = booked([s.id for s in slots], start, end)
+    result = []
+    day = start
+    while day <= end:
+        for slot in slots:
+            seconds, spots = taken.get((slot.id, day), (0, 0))
+            total = capacity(slot)
+            result.append({
+                'date': day.isoformat(),
+                'time_slot_id': slot.id,
+                'time_slot': slot.name,
+                'capacity_seconds': total,
+                'booked_seconds': seconds,
+                'remaining_seconds': total - seconds,
+                'spot_count': spots,
+                'enforced': is_enforced(slot),
+            })
+        day += datetime.timedelta(days=1)
+    return result
+
+
+def remaining(slot, day):
+    """Secondes restantes dans `slot` le jour `day` (une lecture indexée)."""
+    seconds, _ = booked([slot.id], day, day).get((slot.id, day), (0, 0))
+    return capacity(slot) - seconds
+
+
+def _lock(slot_id, day):
+    """Verrouille la ligne du jour (créée à vide au besoin); renvoie les secondes réservées."""
+    from ..models import SlotInventory
+
+    row = SlotInventory.objects.select_for_update().filter(time_slot_id=slot_id, broadcast_date=day)
+    found = row.values_list('booked_seconds', flat=True).first()
+    if found is None:
+        try:
+            with transaction.atomic():
+                SlotInventory.objects.create(time_slot_id=slot_id, broadcast_date=day)
+        except IntegrityError:
+            # Créée entre-temps par une autre transaction
+            pass
+        found = row.values_list('booked_seconds', flat=True).first()
+    return found or 0
+
+
+def admit(schedules):
+    """Sépare `schedules` (non enregistrées) en (admises, refusées) sous verrou.
+
+    À appeler dans la transaction de l'insertion groupée, qui n'a pas de
+    `fits()` par ligne: les lignes (créneau, jour) des créneaux à capacité
+    bloquante sont créées à vide au besoin puis verrouillées dans un ordre
+    fixe jusqu'à la validation, et la capacité est revérifiée sur ces
+    valeurs. Les programmations admises s'additionnent dans l'ordre donné.
+    """
+    from ..models import SlotInventory
+
+    limited = {s.time_slot_id: s.time_slot for s in schedules if is_enforced(s.time_slot)}
+    if not limited:
+        return list(schedules), []
+    keys = {(s.time_slot_id, s.broadcast_date) for s in schedules if s.time_slot_id in limited}
+    SlotInventory.objects.bulk_create(
+        [SlotInventory(time_slot_id=slot_id, broadcast_date=day) for slot_id, day in sorted(keys)],
+        ignore_conflicts=True,
+    )
+    rows = (
+        SlotInventory.objects.select_for_update()
+        .filter(time_slot_id__in=list(limited), broadcast_date__range=(min(k[1] for k in keys), max(k[1] for k in keys)))
+        .order_by('time_slot_id', 'broadcast_date')
+        .values_list('time_slot_id', 'broadcast_date', 'booked_seconds')
+    )
+    booked = {(slot_id, day): seconds for slot_id, day, seconds in rows}
+    admitted, refused = [], []
+    for sched in schedules:
+        slot = limited.get(sched.time_slot_id)
+        if slot is not None:
+            key = (sched.time_slot_id, sched.broadcast_date)
+            seconds = sched.spot.duration_seconds or 0
+            if booked.get(key, 0) + seconds > capacity(slot):
+                refused.append(sched)
+                continue
+            booked[key] = booked.get(key, 0) + seconds
+        admitted.append(sched)
+    return admitted, refused
+
+
+def fits(slot, day, seconds):
+    """`seconds` d'antenne supplémentaires tiennent-elles dans le créneau ce jour-là?
+
+    Toujours vrai pour une capacité indicative (`ad_capacity_seconds` vide).
+    Dans une transaction, la ligne du jour reste verrouillée jusqu'à la
+    validation: la réservation qui suit (signaux de `SpotSchedule`) ne peut
+    pas être devancée par une autre, et deux réservations simultanées ne
+    dépassent pas la capacité ensemble.
+    """
+    if not is_enforced(slot):
+        return True
+    if transaction.get_connection().in_atomic_block:
+        return capacity(slot) - _lock(slot.id, day) >= (seconds or 0)
+    return remaining(slot, day) >= (seconds or 0)
@@ -0,0 +1,191 @@
+"""
+Envoi groupé des e-mails.
+
+Les messages sont envoyés par lots sur une même session SMTP
+(`get_connection()`), rouverte tous les `SPOT_EMAIL_BATCH_SIZE` messages
+ou après une coupure, au lieu d'une connexion (et d'une négociation TLS)
+par message. Le débit est borné par `SPOT_EMAIL_RATE` (messages par
+seconde, 0 = sans limite). Les gabarits sont compilés une fois par
+processus. Chaque message a son propre résultat: un échec n'interrompt
+pas le lot.
+
+`deliver_notifications` applique la configuration `OFFSITE_NOTIFICATIONS`
+à une série de notifications (anti-doublon en une requête), envoie le lot
+et réécrit les statuts d'envoi en un `bulk_update`.
+"""
+
+import logging
+import smtplib
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+
+logger = logging.getLogger('spot')
+
+NOTIFICATION_HTML = 'emails/notification.html'
+NOTIFICATION_TXT = 'emails/notification.txt'
+
+
+@lru_cache(maxsize=None)
+def template(name):
+    return get_template(name)
+
+
+def _from_email():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@bf1tv.bf')
+
+
+def notification_message(user, subject, message, campaign=None, attachments=None):
+    """Message de notification (gabarits HTML et texte), non envoyé."""
+    context = {
+        'user': user,
+        'message': message,
+        'campaign': campaign,
+        'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+    }
+    email = EmailMultiAlternatives(
+        subject=f'[BF1 TV] {subject}',
+        body=template(NOTIFICATION_TXT).render(context),
+        from_email=_from_email(),
+        to=[user.email],
+    )
+    email.attach_alternative(template(NOTIFICATION_HTML).render(context), 'text/html')
+    for att in attachments or []:
+        try:
+            filename, content, mimetype = att
+            email.attach(filename, content, mimetype)
+        except Exception:
+            pass
+    return email
+
+
+def _batch_size():
+    return max(1, int(getattr(settings, 'SPOT_EMAIL_BATCH_SIZE', 100) or 1))
+
+
+def _rate():
+    return max(0.0, float(getattr(settings, 'SPOT_EMAIL_RATE', 0) or 0))
+
+
+def send_batch(messages):
+    """Envoie `messages` sur des sessions SMTP réutilisées; renvoie [bool] par message."""
+    results = []
+    if not messages:
+        return results
+    batch, rate = _batch_size(), _rate()
+    interval = 1.0 / rate if rate else 0.0
+    connection = None
+    sent_in_session = 0
+    next_at = time.monotonic()
+    try:
+        for message in messages:
+            if interval:
+                wait = next_at - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                next_at = max(next_at, time.monotonic()) + interval
+            if connection is None or sent_in_session >= batch:
+                if connection is not None:
+                    connection.close()
+                connection = get_connection(fail_silently=False)
+                connection.open()
+                sent_in_session = 0
+            try:
+                ok = bool(connection.send_messages([message]))
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                logger.error('Connexion SMTP perdue, réouverture', exc_info=True)
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                connection = None
+                ok = False
+            except Exception:
+                logger.error('Erreur envoi email', exc_info=True)
+                ok = False
+            sent_in_session += 1
+            results.append(ok)
+    except Exception:
+        # Ouverture de session impossible: le reste du lot est en échec
+        logger.error('Session SMTP indisponible', exc_info=True)
+        results.extend([False] * (len(messages) - len(results)))
+    finally:
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+    return results
+
+
+def send_one(message):
+    return send_batch([message])[0]
+
+
+def _duplicates(notifications, minutes):
+    """Ids des notifications déjà envoyées à l'identique dans la fenêtre (une requête)."""
+    from ..models import Notification
+
+    since = timezone.now() - timedelta(minutes=minutes)
+    ids = {n.id for n in notifications}
+    recent = Notification.objects.filter(
+        user_id__in={n.user_id for n in notifications},
+        title__in={n.title for n in notifications},
+        created_at__gte=since,
+    ).values_list('id', 'user_id', 'title', 'message')
+    by_key = {}
+    for nid, user_id, title, message in recent:
+        by_key.setdefault((user_id, title, message), set()).add(nid)
+    duplicates, earlier = set(), set()
+    for n in notifications:
+        others = by_key.get((n.user_id, n.title, n.message), set()) - {n.id}
+        # Une notification du même lot ne masque que les suivantes
+        if others - ids or others & earlier:
+            duplicates.add(n.id)
+        earlier.add(n.id)
+    return duplicates
+
+
+def deliver_notifications(notifications):
+    """Envoi hors site (e-mail) d'une série de notifications; statuts réécrits en bloc."""
+    from ..models import Notification
+
+    cfg = getattr(settings, 'OFFSITE_NOTIFICATIONS', None) or {}
+    if not cfg.get('enabled', False) or not notifications:
+        return 0
+    roles = cfg.get('roles') or {}
+    candidates = []
+    for n in notifications:
+        user = getattr(n, 'user', None)
+        if not user or not getattr(user, 'is_active', True) or not getattr(user, 'email', ''):
+            continue
+        if not (roles.get((getattr(user, 'role', '') or '').strip()) or {}).get('email'):
+            continue
+        if (n.email_status or '').strip():
+            continue
+        candidates.append(n)
+    dedupe_minutes = int(cfg.get('dedupe_minutes') or 0)
+    if candidates and dedupe_minutes > 0:
+        skipped = _duplicates(candidates, dedupe_minutes)
+        candidates = [n for n in candidates if n.id not in skipped]
+    if not candidates:
+        return 0
+
+    messages = [
+        notification_message(n.user, n.title, n.message, getattr(n, 'related_campaign', None))
+        for n in candidates
+    ]
+    results = send_batch(messages)
+    now = timezone.now()
+    for n, ok in zip(candidates, results):
+        n.email_status = 'sent' if ok else 'failed'
+        n.email_sent_at = now if ok else None
+        n.email_error = '' if ok else 'send_failed'
+    Notification.objects.bulk_update(candidates, ['email_status', 'email_sent_at', 'email_error'])
+    return sum(results)
@@ -0,0 +1,182 @@
+"""
+Validation groupée des campagnes et des spots (actions d'administration).
+
+Un `save()` par objet déclenche, à chaque ligne, les signaux d'historique,
+de notifications (avec requêtes anti-doublon), de programmation automatique
+et de diffusion des compteurs. Ici le changement de statut est un seul
+`UPDATE ... WHERE status = <en attente>` et les effets de bord sont appliqués
+en lots: historique et notifications en `bulk_create` (doublons écartés par
+une requête), une passe d'allocation pour les campagnes approuvées, une
+diffusion des compteurs après validation. Les vues unitaires conservent le
+chemin par signaux.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+
+CAMPAIGN_PENDING = 'pending'
+SPOT_PENDING = 'pending_review'
+
+
+def _claim(queryset, pending, **values):
+    """Passe les objets en attente de `queryset` au nouvel état; renvoie leurs ids.
+
+    Les lignes sont verrouillées le temps de la transaction: une action
+    concurrente sur les mêmes objets n'en reprend aucun.
+    """
+    ids = list(
+        queryset.model.objects.select_for_update()
+        .filter(pk__in=queryset.values('pk'), status=pending)
+        .values_list('id', flat=True)
+    )
+    if ids:
+        queryset.model.objects.filter(id__in=ids, status=pending).update(**values)
+    return ids
+
+
+def _notify(notifications):
+    from ..signals import create_notifications
+
+    create_notifications(notifications)
+
+
+def _existing(title, related, **filters):
+    """Couples (destinataire, objet lié) déjà notifiés sous `title`."""
+    from ..models import Notification
+
+    return set(Notification.objects.filter(title=title, **filters).values_list('user_id', related))
+
+
+def _broadcast_counts():
+    from ..signals import broadcast_pending_counts
+
+    transaction.on_commit(broadcast_pending_counts)
+
+
+def approve_campaigns(queryset, user):
+    """Approuve les campagnes en attente de `queryset`.
+
+    Renvoie (campagnes approuvées, programmations créées, refus d'allocation).
+    """
+    from ..models import Campaign, CampaignHistory, Notification
+    from . import allocation
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = _claim(queryset, CAMPAIGN_PENDING, status='approved', approved_by=user, approved_at=now, updated_at=now)
+        if not ids:
+            return [], [], []
+        campaigns = allocation.load_campaigns(Campaign.objects.filter(id__in=ids).select_related('client'))
+        CampaignHistory.objects.bulk_create([
+            CampaignHistory(campaign=c, action='approved', description=f'Campagne "{c.title}" approuvée', user=user)
+            for c in campaigns
+        ])
+        seen = _existing('Campagne approuvée', 'related_campaign_id', related_campaign_id__in=ids)
+        _notify([
+            Notification(
+                user=c.client,
+                title='Campagne approuvée',
+                message=f'Votre campagne "{c.title}" a été approuvée.',
+                type='success',
+                related_campaign=c,
+            )
+            for c in campaigns if (c.client_id, c.id) not in seen
+        ])
+        created, refused = allocation.schedule(campaigns, user=user)
+        _broadcast_counts()
+    return campaigns, created, refused
+
+
+def reject_campaigns(queryset, user, reason):
+    """Rejette les campagnes en attente de `queryset`; renvoie leur nombre."""
+    from ..models import Campaign, CampaignHistory, Notification
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = _claim(
+            queryset, CAMPAIGN_PENDING,
+            status='rejected', approved_by=user, approved_at=now, rejection_reason=reason, updated_at=now,
+        )
+        if not ids:
+            return 0
+        campaigns = list(Campaign.objects.filter(id__in=ids).select_related('client'))
+        CampaignHistory.objects.bulk_create([
+            CampaignHistory(campaign=c, action='rejected', description=f'Campagne "{c.title}" rejetée: {reason}', user=user)
+            for c in campaigns
+        ])
+        seen = _existing('Campagne rejetée', 'related_campaign_id', related_campaign_id__in=ids)
+        _notify([
+            Notification(
+                user=c.client,
+                title='Campagne rejetée',
+                message=f'Votre campagne "{c.title}" a été rejetée. Raison: {reason}',
+                type='error',
+                related_campaign=c,
+            )
+            for c in campaigns if (c.client_id, c.id) not in seen
+        ])
+        _broadcast_counts()
+    return len(ids)
+
+
+def approve_spots(queryset, user):
+    """Approuve les spots en attente de validation de `queryset`; renvoie leur nombre."""
+    from ..models import CampaignHistory, Notification, Spot, User
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = _claim(queryset, SPOT_PENDING, status='approved', approved_by=user, approved_at=now, updated_at=now)
+        if not ids:
+            return 0
+        spots = list(Spot.objects.filter(id__in=ids).select_related('campaign__client'))
+        CampaignHistory.objects.bulk_create([
+            CampaignHistory(campaign=s.campaign, action='spot_approved', description=f'Spot "{s.title}" approuvé', user=user)
+            for s in spots
+        ])
+        # Client: une notification par campagne; diffuseurs: une par spot
+        campaign_ids = {s.campaign_id for s in spots}
+        client_seen = _existing('Spot approuvé', 'related_campaign_id', related_campaign_id__in=campaign_ids)
+        diffuser_seen = _existing('Spot approuvé (Diffusion)', 'related_spot_id', related_spot_id__in=ids)
+        diffusers = list(User.objects.filter(role='diffuser'))
+        notifications = []
+        for spot in spots:
+            client = spot.campaign.client
+            if (client.id, spot.campaign_id) not in client_seen:
+                client_seen.add((client.id, spot.campaign_id))
+                notifications.append(Notification(
+                    user=client,
+                    title='Spot approuvé',
+                    message=f'Votre spot "{spot.title}" a été approuvé.',
+                    type='success',
+                    related_campaign=spot.campaign,
+                    related_spot=spot,
+                ))
+            notifications.extend(
+                Notification(
+                    user=diffuser,
+                    title='Spot approuvé (Diffusion)',
+                    message=f'Le spot "{spot.title}" a été approuvé et est prêt à la programmation.',
+                    type='success',
+                    related_campaign=spot.campaign,
+                    related_spot=spot,
+                )
+                for diffuser in diffusers
+                if (diffuser.id, spot.id) not in diffuser_seen
+            )
+        _notify(notifications)
+        _broadcast_counts()
+    return len(ids)
+
+
+def reject_spots(queryset, user, reason):
+    """Rejette les spots en attente de validation de `queryset`; renvoie leur nombre."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = _claim(
+            queryset, SPOT_PENDING,
+            status='rejected', approved_by=user, approved_at=now, rejection_reason=reason, updated_at=now,
+        )
+        if ids:
+            _broadcast_counts()
+    return len(ids)
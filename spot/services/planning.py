@@ -0,0 +1,341 @@
+"""
+Diffusion temps réel du planning.
+
+Chaque changement d'une programmation est journalisé (`PlanningEvent`) avec un
+numéro de séquence croissant, dans la transaction qui modifie le planning
+(boîte d'envoi): un retour arrière n'émet rien. Les numéros sont tirés d'un
+compteur verrouillé jusqu'à la validation: les événements sont validés dans
+l'ordre de leurs numéros, sans trou, et une reprise ne peut pas sauter un
+événement encore en cours d'écriture. Un relais (commande
+`relay_planning_events`, ou fil d'arrière-plan en développement) publie les
+événements en attente par lots, un message par jour concerné
+(`planning.AAAA-MM-JJ`), puis les marque publiés.
+
+Un client s'abonne aux jours affichés; à la reconnexion il reprend depuis son
+dernier numéro (delta) au lieu de retélécharger l'instantané. Les
+instantanés sont mis en cache par jour et partagés entre toutes les
+connexions; chaque jour a une version (`cache.incr` après validation) et un
+instantané construit avant la dernière version est reconstruit. La livraison est « au moins une fois »; le consommateur écarte
+les numéros déjà envoyés.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+try:
+    from channels.layers import get_channel_layer
+    from asgiref.sync import async_to_sync
+except Exception:
+    get_channel_layer = None
+    async_to_sync = None
+
+
+logger = logging.getLogger('spot')
+
+GROUP_PREFIX = 'planning.'
+DAY_KEY = 'planning:day:{date}'
+DAY_VERSION_KEY = 'planning:dayver:{date}'
+DAY_VERSION_TTL = 24 * 60 * 60
+BUILD_LOCK_KEY = 'planning:build:{dates}'
+SNAPSHOT_TTL = 10 * 60
+MAX_DAYS = 42
+MAX_REPLAY = 500
+RELAY_BATCH = 200
+VISIBLE_STATUSES = ('scheduled', 'approved', 'broadcasted')
+
+
+def group_for(day):
+    return f'{GROUP_PREFIX}{day.isoformat()}'
+
+
+def parse_dates(values):
+    """Dates ISO valides, dédoublonnées et triées (au plus MAX_DAYS)."""
+    dates = set()
+    for value in values or []:
+        try:
+            dates.add(datetime.date.fromisoformat(str(value)))
+        except ValueError:
+            continue
+    return sorted(dates)[:MAX_DAYS]
+
+
+def item_payload(sched):
+    try:
+        spot = sched.spot
+        campaign = getattr(spot, 'campaign', None)
+        client = getattr(campaign, 'client', None) if campaign else None
+        return {
+            'id': str(sched.id),
+            'date_iso': sched.broadcast_date.isoformat(),
+            'time_iso': sched.broadcast_time.strftime('%H:%M:%S'),
+            'date_str': sched.broadcast_date.strftime('%d/%m/%Y'),
+            'time_str': sched.broadcast_time.strftime('%H:%M'),
+            'title': getattr(spot, 'title', ''),
+            'client': getattr(client, 'username', '') or '',
+            'media_type': getattr(spot, 'media_type', ''),
+            'duration_seconds': getattr(spot, 'duration_seconds', None),
+            'spot_id': str(getattr(spot, 'id', '')),
+            'has_media': bool(getattr(spot, 'video_file', None) or getattr(spot, 'image_file', None)),
+            'is_broadcasted': bool(getattr(sched, 'is_broadcasted', False)),
+        }
+    except Exception:
+        return {'id': str(getattr(sched, 'id', '')), 'date_iso': '', 'time_iso': '', 'title': getattr(getattr(sched, 'spot', None), 'title', '')}
+
+
+def _event_message(event):
+    return {'seq': event.seq, 'action': event.action, 'item': event.item}
+
+
+def _event_days(event):
+    return [d for d in (event.broadcast_date, event.previous_date) if d]
+
+
+def _new_event(sched, action, previous_date):
+    from ..models import PlanningEvent
+
+    if previous_date == sched.broadcast_date:
+        previous_date = None
+    item = item_payload(sched) if action == 'upsert' else {'id': str(sched.id), 'date_iso': sched.broadcast_date.isoformat()}
+    return PlanningEvent(
+        action=action,
+        schedule_id=sched.id,
+        broadcast_date=sched.broadcast_date,
+        previous_date=previous_date,
+        item=item,
+    )
+
+
+def _allocate(count):
+    """Réserve `count` numéros consécutifs.
+
+    La ligne du compteur reste verrouillée jusqu'à la fin de la transaction:
+    une autre écriture du planning attend, et un retour arrière rend ses
+    numéros. À appeler en fin de transaction pour tenir le verrou peu de temps.
+    """
+    from ..models import PlanningEvent, PlanningSequence
+
+    counter = PlanningSequence.objects.select_for_update().filter(pk=1).first()
+    if counter is None:
+        # Compteur absent (table vidée): il reprend après le dernier événement
+        last = PlanningEvent.objects.aggregate(last=Max('seq'))['last'] or 0
+        counter, _ = PlanningSequence.objects.select_for_update().get_or_create(pk=1, defaults={'last': last})
+    PlanningSequence.objects.filter(pk=1).update(last=counter.last + count)
+    return range(counter.last + 1, counter.last + count + 1)
+
+
+def record(sched, action='upsert', previous_date=None):
+    """Journalise le changement de `sched` dans la transaction courante.
+
+    La publication est faite par le relais, après validation.
+    """
+    event = _new_event(sched, action, previous_date)
+    with transaction.atomic():
+        event.seq = _allocate(1)[0]
+        event.save(force_insert=True)
+    _on_commit([event])
+    return event
+
+
+def record_many(schedules, action='upsert'):
+    """Variante groupée de `record` (un seul INSERT)."""
+    from ..models import PlanningEvent
+
+    events = [_new_event(s, action, None) for s in schedules]
+    if not events:
+        return events
+    with transaction.atomic():
+        for event, seq in zip(events, _allocate(len(events))):
+            event.seq = seq
+        PlanningEvent.objects.bulk_create(events)
+    _on_commit(events)
+    return events
+
+
+def _on_commit(events):
+    # Invalide les instantanés en cache des jours touchés, une fois validé
+    days = {day for event in events for day in _event_days(event)}
+    transaction.on_commit(lambda: _touch_days(days))
+    transaction.on_commit(wake_relay)
+
+
+def _touch_days(days):
+    """Avance la version des jours `days` (incrément atomique, jamais en arrière)."""
+    for day in days:
+        key = DAY_VERSION_KEY.format(date=day.isoformat())
+        # Version absente: amorce horodatée, distincte de toute version passée
+        if not cache.add(key, time.time_ns(), DAY_VERSION_TTL):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), DAY_VERSION_TTL)
+
+
+def _day_versions(dates):
+    found = cache.get_many([DAY_VERSION_KEY.format(date=d.isoformat()) for d in dates])
+    return {d: found.get(DAY_VERSION_KEY.format(date=d.isoformat()), 0) for d in dates}
+
+
+def publish(by_day):
+    """Un message `planning_batch` par jour: {date: [événements]}.
+
+    Une erreur de la couche de canaux remonte: le relais laisse alors le lot
+    en attente et le republie en entier (les jours déjà envoyés sont
+    rejoués, sans effet côté client).
+    """
+    if not get_channel_layer or not async_to_sync:
+        return
+    layer = get_channel_layer()
+    if not layer:
+        return
+    for day, events in by_day.items():
+        async_to_sync(layer.group_send)(group_for(day), {'type': 'planning_batch', 'events': events})
+
+
+def relay(batch_size=RELAY_BATCH):
+    """Publie un lot d'événements en attente, dans l'ordre des séquences.
+
+    Les lignes sont verrouillées (`SKIP LOCKED` sous PostgreSQL) le temps de
+    la publication: plusieurs relais peuvent tourner sans doublon. Si la
+    publication échoue, rien n'est marqué publié et l'erreur remonte. Renvoie
+    le nombre d'événements publiés.
+    """
+    from ..models import PlanningEvent
+
+    with transaction.atomic():
+        pending = PlanningEvent.objects.filter(published_at__isnull=True).order_by('seq')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        events = list(pending[:batch_size])
+        if not events:
+            return 0
+        by_day = defaultdict(list)
+        for event in events:
+            for day in _event_days(event):
+                by_day[day].append(_event_message(event))
+        publish(by_day)
+        PlanningEvent.objects.filter(seq__in=[e.seq for e in events]).update(published_at=timezone.now())
+    return len(events)
+
+
+_wakeup = threading.Event()
+_worker_lock = threading.Lock()
+_worker = {'thread': None}
+
+
+def wake_relay():
+    """Réveille le relais en arrière-plan (`PLANNING_RELAY_IN_PROCESS`)."""
+    if not getattr(settings, 'PLANNING_RELAY_IN_PROCESS', False):
+        return
+    with _worker_lock:
+        thread = _worker['thread']
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_relay_worker, name='planning-relay', daemon=True)
+            _worker['thread'] = thread
+            thread.start()
+    _wakeup.set()
+
+
+def _relay_worker():
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        try:
+            while relay():
+                pass
+        except Exception:
+            logger.exception('Relais planning en échec')
+        finally:
+            close_old_connections()
+
+
+def _build_days(dates):
+    """Instantanés des jours `dates` en une requête; renvoie {date: entrée}."""
+    from ..models import PlanningEvent, SpotSchedule
+
+    # Version et séquence lues avant les programmations: tout changement
+    # validé ensuite les dépasse
+    versions = _day_versions(dates)
+    seq = PlanningEvent.objects.aggregate(last=Max('seq'))['last'] or 0
+    qs = (
+        SpotSchedule.objects.select_related('spot__campaign__client', 'time_slot')
+        .filter(broadcast_date__in=dates, spot__status__in=VISIBLE_STATUSES)
+        .order_by('broadcast_date', 'broadcast_time')
+    )
+    built = {d: {'seq': seq, 'version': versions[d], 'items': []} for d in dates}
+    for sched in qs:
+        built[sched.broadcast_date]['items'].append(item_payload(sched))
+    cache.set_many({DAY_KEY.format(date=d.isoformat()): entry for d, entry in built.items()}, SNAPSHOT_TTL)
+    return built
+
+
+def _cached_days(dates):
+    keys = []
+    for d in dates:
+        keys += [DAY_KEY.format(date=d.isoformat()), DAY_VERSION_KEY.format(date=d.isoformat())]
+    found = cache.get_many(keys)
+    fresh = {}
+    for d in dates:
+        entry = found.get(DAY_KEY.format(date=d.isoformat()))
+        version = found.get(DAY_VERSION_KEY.format(date=d.isoformat()), 0)
+        if entry is not None and entry.get('version') == version:
+            fresh[d] = entry
+    return fresh
+
+
+def snapshot(dates, wait=2.0):
+    """Renvoie (seq, items) pour `dates`, depuis le cache partagé si possible.
+
+    En cas de rafale de connexions, un seul processus reconstruit les jours
+    manquants; les autres attendent brièvement son résultat.
+    """
+    days = _cached_days(dates)
+    missing = [d for d in dates if d not in days]
+    if missing:
+        lock = BUILD_LOCK_KEY.format(dates=','.join(d.isoformat() for d in missing))
+        if cache.add(lock, 1, 10):
+            try:
+                days.update(_build_days(missing))
+            finally:
+                cache.delete(lock)
+        else:
+            deadline = time.monotonic() + wait
+            while missing and time.monotonic() < deadline:
+                time.sleep(0.05)
+                days.update(_cached_days(missing))
+                missing = [d for d in dates if d not in days]
+            if missing:
+                days.update(_build_days(missing))
+    seq = min((days[d]['seq'] for d in dates), default=0)
+    items = [item for d in dates for item in days[d]['items']]
+    return seq, items
+
+
+def events_since(seq, dates):
+    """Événements postérieurs à `seq` pour `dates`, ou None si la reprise
+    n'est pas possible (trop d'écart, ou événements déjà purgés par la
+    rétention): le client recharge alors l'instantané."""
+    from ..models import PlanningEvent, PlanningSequence
+
+    oldest = PlanningEvent.objects.order_by('seq').values_list('seq', flat=True).first()
+    if oldest is None:
+        # Journal vide: rien n'est perdu seulement si aucun numéro n'a suivi
+        oldest = (PlanningSequence.objects.filter(pk=1).values_list('last', flat=True).first() or 0) + 1
+    if seq < oldest - 1:
+        return None
+    events = list(
+        PlanningEvent.objects.filter(seq__gt=seq)
+        .filter(Q(broadcast_date__in=dates) | Q(previous_date__in=dates))
+        .order_by('seq')[:MAX_REPLAY + 1]
+    )
+    if len(events) > MAX_REPLAY:
+        return None
+    return [_event_message(e) for e in events]
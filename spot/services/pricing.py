@@ -0,0 +1,197 @@
+"""
+Moteur de tarification des spots.
+
+Les règles actives (`PricingRule`) sont compilées en une table d'intervalles
+de durée disjoints et triés: la règle applicable à une durée est trouvée par
+bisection. À durées chevauchantes, la règle de plus petite `duration_min`
+l'emporte (comportement historique du simulateur). La table et les
+multiplicateurs des créneaux sont mis en cache et reconstruits après toute
+modification de `PricingRule` ou `TimeSlot` (signaux).
+
+Formule: prix/seconde x durée x multiplicateur du créneau x diffusions, puis
+TVA. Les montants restent des `Decimal`.
+"""
+
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from . import versions
+
+
+TAX_RATE = Decimal('0.18')
+DEFAULT_BASE_PRICE = Decimal('1000')
+CENT = Decimal('0.01')
+
+VERSION_KEY = 'pricing:version'
+TABLE_KEY = 'pricing:table:{version}'
+TABLE_TTL = 24 * 3600
+MAX_BATCH = 500
+
+# Copie locale de la table désérialisée: (version, table)
+_local = {'version': None, 'table': None}
+
+
+class UnknownTimeSlot(ValueError):
+    """Créneau(x) inexistant(s); `ids` liste les identifiants refusés."""
+
+    def __init__(self, ids):
+        super().__init__('unknown_time_slot')
+        self.code = 'unknown_time_slot'
+        self.ids = sorted(ids)
+
+
+def current_version():
+    return versions.current(VERSION_KEY)
+
+
+def invalidate():
+    """Appelé par les signaux: nouvelle version, l'ancienne table expire seule."""
+    versions.bump(VERSION_KEY)
+
+
+def compile_table():
+    """Renvoie {'starts': [...], 'intervals': [(min, max, prix)], 'slots': {id: multiplicateur}}."""
+    from ..models import PricingRule, TimeSlot
+
+    rules = list(
+        PricingRule.objects.filter(is_active=True)
+        .order_by('duration_min', 'id')
+        .values_list('duration_min', 'duration_max', 'base_price')
+    )
+    # Bornes élémentaires; chaque segment reçoit la première règle qui le couvre
+    bounds = sorted({lo for lo, _, _ in rules} | {hi + 1 for _, hi, _ in rules})
+    intervals = []
+    for lo, nxt in zip(bounds, bounds[1:]):
+        price = next((p for rmin, rmax, p in rules if rmin <= lo and nxt - 1 <= rmax), None)
+        if price is None:
+            continue
+        if intervals and intervals[-1][1] == lo - 1 and intervals[-1][2] == price:
+            intervals[-1] = (intervals[-1][0], nxt - 1, price)
+        else:
+            intervals.append((lo, nxt - 1, price))
+    slots = dict(TimeSlot.objects.values_list('id', 'price_multiplier'))
+    return {'starts': [lo for lo, _, _ in intervals], 'intervals': intervals, 'slots': slots}
+
+
+def get_table(version=None):
+    version = version or current_version()
+    if _local['version'] == version:
+        return _local['table']
+    key = TABLE_KEY.format(version=version)
+    table = cache.get(key)
+    if table is None:
+        table = compile_table()
+        cache.set(key, table, TABLE_TTL)
+    _local.update(version=version, table=table)
+    return table
+
+
+def rules_for_display(table=None):
+    """Intervalles compilés, sérialisables (script du simulateur)."""
+    table = table or get_table()
+    return [
+        {'duration_min': lo, 'duration_max': hi, 'base_price': str(price)}
+        for lo, hi, price in table['intervals']
+    ]
+
+
+def base_price(duration, table=None):
+    """Prix par seconde applicable à `duration` (bisection)."""
+    table = table or get_table()
+    i = bisect_right(table['starts'], duration) - 1
+    if i >= 0:
+        lo, hi, price = table['intervals'][i]
+        if duration <= hi:
+            return price
+    return DEFAULT_BASE_PRICE
+
+
+def multiplier(slot, table=None):
+    """Multiplicateur d'un créneau (`TimeSlot` ou identifiant)."""
+    table = table or get_table()
+    slot_id = getattr(slot, 'id', slot)
+    value = table['slots'].get(slot_id)
+    if value is None:
+        value = getattr(slot, 'price_multiplier', None) or Decimal('1')
+    return Decimal(value)
+
+
+def breakdown(duration, slot, broadcast_count=1, table=None, price=None, factor=None):
+    """Détail d'un devis (montants HT, TVA et TTC).
+
+    `price` et `factor` remplacent le prix par seconde de la grille et le
+    multiplicateur du créneau (`slot` peut alors valoir None).
+    """
+    table = table or get_table()
+    price = base_price(duration, table) if price is None else Decimal(str(price))
+    factor = multiplier(slot, table) if factor is None else Decimal(str(factor))
+    subtotal = price * Decimal(duration) * factor * Decimal(broadcast_count)
+    tax = subtotal * TAX_RATE
+    return {
+        'duration': duration,
+        'base_price': price,
+        'time_multiplier': factor,
+        'broadcast_count': broadcast_count,
+        'subtotal': subtotal,
+        'tax': tax,
+        'total': subtotal + tax,
+    }
+
+
+def quote_many(scenarios):
+    """Devis d'une série de scénarios (durée, créneau, diffusions) en un appel.
+
+    La table est lue une fois; les prix unitaires (durée, créneau) sont
+    calculés une seule fois par combinaison distincte. Montants au centime.
+    Un identifiant de créneau inconnu lève `UnknownTimeSlot` plutôt que
+    d'être tarifé au multiplicateur 1.
+    """
+    from ..models import TimeSlot
+
+    table = get_table()
+    missing = {
+        slot for _, slot, _ in scenarios
+        if not hasattr(slot, 'id') and slot not in table['slots']
+    }
+    if missing:
+        # Table éventuellement en retard d'une invalidation: la base tranche
+        found = dict(TimeSlot.objects.filter(id__in=missing).values_list('id', 'price_multiplier'))
+        if len(found) != len(missing):
+            raise UnknownTimeSlot(missing - set(found))
+        table = dict(table, slots={**table['slots'], **found})
+    units = {}
+    quotes = []
+    for duration, slot, count in scenarios:
+        slot_id = getattr(slot, 'id', slot)
+        key = (duration, slot_id)
+        if key not in units:
+            price = base_price(duration, table)
+            factor = multiplier(slot, table)
+            units[key] = (price, factor, price * Decimal(duration) * factor)
+        price, factor, unit = units[key]
+        subtotal = unit * Decimal(count)
+        tax = subtotal * TAX_RATE
+        quotes.append({
+            'duration': duration,
+            'time_slot': slot_id,
+            'broadcast_count': count,
+            'base_price': price,
+            'time_multiplier': factor,
+            'unit_price': unit.quantize(CENT, rounding=ROUND_HALF_UP),
+            'subtotal': subtotal.quantize(CENT, rounding=ROUND_HALF_UP),
+            'tax': tax.quantize(CENT, rounding=ROUND_HALF_UP),
+            'total': (subtotal + tax).quantize(CENT, rounding=ROUND_HALF_UP),
+        })
+    return quotes
+
+
+def unit_price(duration, slot, table=None):
+    """Prix HT d'une diffusion, arrondi au centime (`SpotSchedule.price`)."""
+    if not duration:
+        return Decimal('0')
+    table = table or get_table()
+    value = base_price(duration, table) * Decimal(duration) * multiplier(slot, table)
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
@@ -0,0 +1,264 @@
+"""
+Compteurs d'avancement des campagnes (`CampaignProgress`).
+
+Une ligne par campagne et un global: programmations non diffusées,
+diffusées, en retard (non diffusées, date passée) et durée réservée. Les
+signaux de `SpotSchedule` et `Spot` les ajustent par incréments (`F()`) dans
+la transaction de la modification, en un seul UPDATE pour la campagne et le
+global; les chemins groupés (`bulk_create`, `QuerySet.update`) appellent
+`add_schedules` ou `apply`. Le global est réparti en `SHARDS` lignes (`all`,
+`all:1`...) selon la campagne, sommées à la lecture: des transactions sur
+des campagnes différentes ne se disputent pas une seule ligne.
+
+Le retard dépend de la date du jour: la commande
+`reconcile_campaign_progress` (chaque nuit) y ajoute les programmations
+devenues en retard et corrige toute dérive. L'état retiré par une
+modification est évalué à la date de ce dernier recalcul, celle à laquelle
+il a été compté; le compteur ne descend jamais sous zéro.
+Les tableaux de bord lisent quelques lignes au lieu de compter `SpotSchedule`.
+"""
+
+import zlib
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+GLOBAL = 'all'
+SHARDS = 8
+GLOBAL_SCOPES = [GLOBAL] + [f'{GLOBAL}:{n}' for n in range(1, SHARDS)]
+RECONCILED_KEY = 'progress:reconciled'
+FIELDS = ('scheduled_count', 'broadcast_count', 'late_count', 'booked_seconds')
+EMPTY = dict.fromkeys(FIELDS, 0)
+
+
+def state(sched, spot=None):
+    """(campagne, jour, diffusée, secondes) d'une programmation."""
+    spot = spot or sched.spot
+    return spot.campaign_id, sched.broadcast_date, bool(sched.is_broadcasted), spot.duration_seconds or 0
+
+
+def global_scope(campaign_id):
+    """Ligne du global où compte `campaign_id` (hachage stable)."""
+    return GLOBAL_SCOPES[zlib.crc32(str(campaign_id).encode()) % SHARDS]
+
+
+def _reconciled_on(today):
+    """Date du dernier recalcul (référence du retard déjà compté), sinon `today`."""
+    value = cache.get(RECONCILED_KEY)
+    return min(value, today) if value else today
+
+
+def _vector(st, today):
+    _, day, broadcasted, seconds = st
+    return (
+        0 if broadcasted else 1,
+        1 if broadcasted else 0,
+        1 if not broadcasted and day < today else 0,
+        seconds,
+    )
+
+
+def _bump(scopes, deltas):
+    """Ajoute `deltas` (dict champ -> valeur) aux lignes `scopes`, créées au besoin."""
+    from ..models import CampaignProgress
+
+    deltas = {f: v for f, v in deltas.items() if v}
+    if not deltas:
+        return
+    values = {f: F(f) + v for f, v in deltas.items()}
+    if 'late_count' in values:
+        values['late_count'] = Greatest(values['late_count'], 0)
+    updated = CampaignProgress.objects.filter(scope__in=scopes).update(**values)
+    if updated == len(scopes):
+        return
+    present = set(CampaignProgress.objects.filter(scope__in=scopes).values_list('scope', flat=True))
+    for scope in scopes:
+        if scope in present:
+            continue
+        try:
+            with transaction.atomic():
+                CampaignProgress.objects.create(
+                    scope=scope, campaign_id=None if scope in GLOBAL_SCOPES else scope,
+                    **dict(deltas, late_count=max(deltas.get('late_count', 0), 0)),
+                )
+        except IntegrityError:
+            # Créée entre-temps par une autre transaction
+            CampaignProgress.objects.filter(scope=scope).update(**values)
+
+
+def apply(changes):
+    """Répercute des changements [(ancien état, nouvel état)], `None` = absent.
+
+    Un UPDATE par campagne touchée, plus un par ligne du global touchée.
+    """
+    today = timezone.localdate()
+    counted_on = _reconciled_on(today)
+    per_campaign = defaultdict(lambda: [0, 0, 0, 0])
+    for old, new in changes:
+        for st, sign, as_of in ((old, -1, counted_on), (new, 1, today)):
+            if st is None:
+                continue
+            acc = per_campaign[st[0]]
+            for i, value in enumerate(_vector(st, as_of)):
+                acc[i] += sign * value
+    if len(per_campaign) == 1:
+        (campaign_id, acc), = per_campaign.items()
+        _bump([str(campaign_id), global_scope(campaign_id)], dict(zip(FIELDS, acc)))
+        return
+    shards = defaultdict(lambda: [0, 0, 0, 0])
+    for campaign_id, acc in per_campaign.items():
+        _bump([str(campaign_id)], dict(zip(FIELDS, acc)))
+        shard = shards[global_scope(campaign_id)]
+        for i, value in enumerate(acc):
+            shard[i] += value
+    for scope, acc in shards.items():
+        _bump([scope], dict(zip(FIELDS, acc)))
+
+
+def add_schedules(schedules, sign=1):
+    """Ajoute (ou retire, `sign=-1`) des programmations enregistrées en bloc."""
+    states = [state(s) for s in schedules]
+    apply([(None, st) if sign > 0 else (st, None) for st in states])
+
+
+def _counts(today):
+    return {
+        'scheduled_count': Count('id', filter=Q(is_broadcasted=False)),
+        'broadcast_count': Count('id', filter=Q(is_broadcasted=True)),
+        'late_count': Count('id', filter=Q(is_broadcasted=False, broadcast_date__lt=today)),
+    }
+
+
+def _aggregate(schedules, today):
+    return schedules.aggregate(**_counts(today), spots=Count('id'))
+
+
+def remove_spot(spot):
+    """Retire toutes les programmations de `spot` (une agrégation, avant suppression)."""
+    from ..models import SpotSchedule
+
+    row = _aggregate(SpotSchedule.objects.filter(spot=spot), timezone.localdate())
+    if not row['spots']:
+        return
+    deltas = {f: -row[f] for f in FIELDS if f != 'booked_seconds'}
+    deltas['booked_seconds'] = -(spot.duration_seconds or 0) * row['spots']
+    _bump([str(spot.campaign_id), global_scope(spot.campaign_id)], deltas)
+
+
+def remove_time_slot(slot):
+    """Retire les programmations du créneau `slot` (une agrégation par campagne, avant suppression)."""
+    from ..models import SpotSchedule
+
+    rows = (
+        SpotSchedule.objects.filter(time_slot=slot).order_by().values('spot__campaign_id')
+        .annotate(**_counts(timezone.localdate()), booked_seconds=Coalesce(Sum('spot__duration_seconds'), 0))
+    )
+    shards = defaultdict(lambda: dict(EMPTY))
+    for row in rows:
+        deltas = {f: -row[f] for f in FIELDS}
+        _bump([str(row['spot__campaign_id'])], deltas)
+        shard = shards[global_scope(row['spot__campaign_id'])]
+        for f in FIELDS:
+            shard[f] += deltas[f]
+    for scope, deltas in shards.items():
+        _bump([scope], deltas)
+
+
+def remove_campaign(campaign):
+    """Retire la ligne de `campaign` du global (la ligne suit la campagne en cascade)."""
+    from ..models import CampaignProgress
+
+    row = CampaignProgress.objects.filter(scope=str(campaign.pk)).values(*FIELDS).first()
+    if row:
+        _bump([global_scope(campaign.pk)], {f: -v for f, v in row.items()})
+
+
+def change_spot_duration(spot, delta):
+    from ..models import SpotSchedule
+
+    if not delta:
+        return
+    spots = SpotSchedule.objects.filter(spot=spot).count()
+    _bump([str(spot.campaign_id), global_scope(spot.campaign_id)], {'booked_seconds': delta * spots})
+
+
+def reconcile():
+    """Recalcule toutes les lignes; renvoie le nombre de lignes corrigées."""
+    from ..models import CampaignProgress, SpotSchedule
+
+    today = timezone.localdate()
+    rows = (
+        SpotSchedule.objects.order_by().values('spot__campaign_id')
+        .annotate(
+            scheduled_count=Count('id', filter=Q(is_broadcasted=False)),
+            broadcast_count=Count('id', filter=Q(is_broadcasted=True)),
+            late_count=Count('id', filter=Q(is_broadcasted=False, broadcast_date__lt=today)),
+            booked_seconds=Coalesce(Sum('spot__duration_seconds'), 0),
+        )
+    )
+    expected = {scope: (None, dict(EMPTY)) for scope in GLOBAL_SCOPES}
+    for row in rows.iterator():
+        values = {f: row[f] for f in FIELDS}
+        expected[str(row['spot__campaign_id'])] = (row['spot__campaign_id'], values)
+        shard = expected[global_scope(row['spot__campaign_id'])][1]
+        for f in FIELDS:
+            shard[f] += values[f]
+
+    with transaction.atomic():
+        current = {p.scope: p for p in CampaignProgress.objects.select_for_update()}
+        stale, missing = [], []
+        for scope, progress in current.items():
+            if scope not in expected:
+                expected[scope] = (progress.campaign_id, dict(EMPTY))
+        for scope, (campaign_id, values) in expected.items():
+            progress = current.get(scope)
+            if progress is None:
+                if any(values.values()):
+                    missing.append(CampaignProgress(scope=scope, campaign_id=campaign_id, **values))
+            elif any(getattr(progress, f) != v for f, v in values.items()):
+                for f, v in values.items():
+                    setattr(progress, f, v)
+                stale.append(progress)
+        CampaignProgress.objects.bulk_create(missing, batch_size=1000)
+        CampaignProgress.objects.bulk_update(stale, FIELDS, batch_size=1000)
+        transaction.on_commit(lambda: cache.set(RECONCILED_KEY, today, None))
+    return len(missing) + len(stale)
+
+
+def _as_dict(row):
+    values = dict(EMPTY)
+    if row:
+        values.update(row)
+    return {
+        'scheduled': values['scheduled_count'],
+        'broadcast': values['broadcast_count'],
+        'late': values['late_count'],
+        'booked_seconds': values['booked_seconds'],
+        'total': values['scheduled_count'] + values['broadcast_count'],
+    }
+
+
+def totals():
+    """Compteurs globaux (somme des lignes du global, une requête)."""
+    from ..models import CampaignProgress
+
+    rows = CampaignProgress.objects.filter(scope__in=GLOBAL_SCOPES)
+    return _as_dict(rows.aggregate(**{f: Coalesce(Sum(f), 0) for f in FIELDS}))
+
+
+def for_campaigns(campaign_ids):
+    """{id de campagne: compteurs} en une requête."""
+    from ..models import CampaignProgress
+
+    rows = CampaignProgress.objects.filter(scope__in=[str(i) for i in campaign_ids]).values('scope', *FIELDS)
+    found = {row.pop('scope'): _as_dict(row) for row in rows}
+    return {i: found.get(str(i), _as_dict(None)) for i in campaign_ids}
+
+
+def for_campaign(campaign):
+    return for_campaigns([campaign.pk])[campaign.pk]
@@ -0,0 +1,256 @@
+"""
+Programmation récurrente des spots (sous-ensemble de RRULE, RFC 5545).
+
+Trois temps, sans aller-retour par occurrence:
+
+1. `expand`: les occurrences (date, heure) sont calculées en mémoire
+   (fréquence, intervalle, masque de jours, exclusions, fin par date ou par
+   nombre);
+2. `plan`: une seule requête par plage détecte les conflits avec les
+   programmations existantes (`time_slot`, `broadcast_date`, `broadcast_time`),
+   une autre lit l'inventaire des créneaux à capacité bloquante;
+3. `apply`: insertion groupée `bulk_create(ignore_conflicts=True)`, sans
+   exception d'intégrité au milieu de la transaction (PostgreSQL l'aborterait).
+"""
+
+import datetime
+
+from . import inventory, pricing
+
+
+MAX_OCCURRENCES = 2000
+MAX_SPAN_DAYS = 400
+INSERT_BATCH = 500
+
+WEEKDAYS = {
+    'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6,
+    'mo': 0, 'tu': 1, 'we': 2, 'th': 3, 'fr': 4, 'sa': 5, 'su': 6,
+}
+FREQUENCIES = ('DAILY', 'WEEKLY')
+
+
+class RecurrenceError(ValueError):
+    """Règle invalide; `code` est renvoyé tel quel au client."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        parts = value
+    else:
+        parts = str(value or '').replace(';', ',').split(',')
+    return [p.strip() for p in parts if p and p.strip()]
+
+
+def parse_time(value):
+    try:
+        return datetime.time.fromisoformat(value.strip() if len(value.strip()) > 5 else f'{value.strip()}:00')
+    except ValueError:
+        raise RecurrenceError('invalid_time')
+
+
+def parse_times(value):
+    """'08:00,12:30' -> [time(8, 0), time(12, 30)] (triées, sans doublon)."""
+    return sorted({parse_time(v) for v in _split(value)})
+
+
+def parse_weekdays(value):
+    """'mon,wed' ou 'MO,WE' -> {0, 2}; vide -> tous les jours."""
+    days = {WEEKDAYS[v.lower()] for v in _split(value) if v.lower() in WEEKDAYS}
+    return days or set(range(7))
+
+
+def parse_exclusions(value):
+    """Dates exclues ('2030-01-05') ou occurrences exclues ('2030-01-05T19:00').
+
+    Renvoie (jours, occurrences).
+    """
+    days, slots = set(), set()
+    for raw in _split(value):
+        try:
+            if 'T' in raw:
+                d, t = raw.split('T', 1)
+                slots.add((datetime.date.fromisoformat(d), parse_time(t)))
+            else:
+                days.add(datetime.date.fromisoformat(raw))
+        except ValueError:
+            raise RecurrenceError('invalid_exclusion')
+    return days, slots
+
+
+def parse_rrule(text):
+    """'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=12' -> dict d'options de `expand`."""
+    options = {}
+    for part in str(text or '').strip().removeprefix('RRULE:').split(';'):
+        if not part.strip():
+            continue
+        key, _, value = part.partition('=')
+        key, value = key.strip().upper(), value.strip()
+        try:
+            if key == 'FREQ':
+                if value.upper() not in FREQUENCIES:
+                    raise RecurrenceError('unsupported_rrule')
+                options['freq'] = value.upper()
+            elif key == 'INTERVAL':
+                options['interval'] = int(value)
+            elif key == 'COUNT':
+                options['count'] = int(value)
+            elif key == 'UNTIL':
+                options['until'] = datetime.date.fromisoformat(value[:8] if value[:8].isdigit() else value[:10])
+            elif key == 'BYDAY':
+                options['weekdays'] = parse_weekdays(value)
+            else:
+                raise RecurrenceError('unsupported_rrule')
+        except ValueError as exc:
+            if isinstance(exc, RecurrenceError):
+                raise
+            raise RecurrenceError('invalid_rrule')
+    return options
+
+
+def expand(start, times, until=None, count=None, weekdays=None, freq='DAILY', interval=1,
+           excluded_days=(), excluded_slots=()):
+    """Occurrences (date, heure) triées à partir de `start`.
+
+    La fin est donnée par `until` (inclus) et/ou `count` (nombre de
+    diffusions); au moins l'un des deux est requis. Les jours exclus ne
+    consomment pas le compteur, comme EXDATE.
+    """
+    if not times:
+        raise RecurrenceError('missing_time')
+    if until is None and not count:
+        raise RecurrenceError('missing_end')
+    if until is not None and until < start:
+        raise RecurrenceError('end_before_start')
+    if interval < 1 or (count is not None and count < 1):
+        raise RecurrenceError('invalid_rrule')
+    weekdays = weekdays if weekdays is not None else set(range(7))
+    last = start + datetime.timedelta(days=MAX_SPAN_DAYS)
+    if until is not None:
+        last = min(last, until)
+    week0 = start - datetime.timedelta(days=start.weekday())
+
+    occurrences = []
+    day = start
+    while day <= last:
+        if freq == 'WEEKLY':
+            in_period = ((day - week0).days // 7) % interval == 0
+        else:
+            in_period = (day - start).days % interval == 0
+        if in_period and day.weekday() in weekdays and day not in excluded_days:
+            for t in times:
+                if (day, t) in excluded_slots:
+                    continue
+                occurrences.append((day, t))
+                if count and len(occurrences) >= count:
+                    return occurrences
+                if len(occurrences) > MAX_OCCURRENCES:
+                    raise RecurrenceError('too_many_occurrences')
+        day += datetime.timedelta(days=1)
+    return occurrences
+
+
+def plan(spot, occurrences, slot_for):
+    """Sépare les occurrences en programmations à créer et conflits.
+
+    `slot_for(heure)` renvoie le créneau (`TimeSlot`) de chaque heure. Les
+    programmations existantes sont lues en une requête sur la plage de dates;
+    un conflit a pour motif `schedule_conflict` (même créneau, jour et heure)
+    ou `slot_full` (capacité publicitaire du créneau atteinte ce jour-là).
+    Le prix de chaque diffusion vient de la grille tarifaire compilée.
+    """
+    from ..models import SpotSchedule
+
+    if not occurrences:
+        return [], []
+    slots = {t: slot_for(t) for t in {t for _, t in occurrences}}
+    existing = (
+        SpotSchedule.objects.filter(
+            broadcast_date__range=(occurrences[0][0], occurrences[-1][0]),
+            broadcast_time__in=list(slots),
+            time_slot_id__in={s.id for s in slots.values()},
+        )
+        .values_list('time_slot_id', 'broadcast_date', 'broadcast_time', 'spot_id', 'spot__title')
+    )
+    taken = {(slot_id, d, t): (spot_id, title) for slot_id, d, t, spot_id, title in existing}
+    limited = {s.id: s for s in slots.values() if inventory.is_enforced(s)}
+    booked = {
+        key: seconds
+        for key, (seconds, _) in inventory.booked(limited, occurrences[0][0], occurrences[-1][0]).items()
+    } if limited else {}
+    seconds = spot.duration_seconds or 0
+    prices = {s.id: pricing.unit_price(seconds, s) for s in slots.values()}
+
+    candidates, conflicts = [], []
+    for d, t in occurrences:
+        slot = slots[t]
+        holder = taken.get((slot.id, d, t))
+        full = slot.id in limited and booked.get((slot.id, d), 0) + seconds > inventory.capacity(slot)
+        if holder is not None or full:
+            conflicts.append(_conflict(spot, slot, d, t, holder))
+            continue
+        if slot.id in limited:
+            booked[(slot.id, d)] = booked.get((slot.id, d), 0) + seconds
+        candidates.append(SpotSchedule(
+            spot=spot,
+            time_slot=slot,
+            broadcast_date=d,
+            broadcast_time=t,
+            price=prices[slot.id],
+            is_broadcasted=False,
+        ))
+    return candidates, conflicts
+
+
+def _conflict(spot, slot, d, t, holder=None):
+    return {
+        'date': d.isoformat(),
+        'time': t.strftime('%H:%M'),
+        'time_slot': slot.name,
+        'reason': 'schedule_conflict' if holder is not None else 'slot_full',
+        'conflict_with': holder[1] if holder is not None else '',
+        'same_spot': holder is not None and holder[0] == spot.id,
+    }
+
+
+def admit(spot, candidates):
+    """Revérifie la capacité des `candidates` sous verrou, avant `apply`.
+
+    `plan` lit l'inventaire sans verrou (aperçu); dans la transaction de
+    l'insertion, les jours concernés sont verrouillés et les candidats qui
+    ne tiennent plus deviennent des conflits `slot_full`.
+    """
+    admitted, refused = inventory.admit(candidates)
+    return admitted, [_conflict(spot, c.time_slot, c.broadcast_date, c.broadcast_time) for c in refused]
+
+
+def apply(spot, candidates):
+    """Insère `candidates` en bloc; renvoie les programmations réellement créées.
+
+    Une programmation concurrente sur la même clé est ignorée par la base;
+    les lignes créées sont relues pour obtenir leurs identifiants. Les lignes
+    déjà présentes sur ces clés avant l'insertion (relevées juste avant) ne
+    sont jamais comptées comme créées.
+    """
+    from ..models import SpotSchedule
+
+    if not candidates:
+        return []
+    keys = {(c.time_slot_id, c.broadcast_date, c.broadcast_time) for c in candidates}
+    window = SpotSchedule.objects.filter(
+        spot=spot,
+        broadcast_date__range=(min(k[1] for k in keys), max(k[1] for k in keys)),
+        broadcast_time__in={k[2] for k in keys},
+        time_slot_id__in={k[0] for k in keys},
+    )
+    before = set(window.values_list('id', flat=True))
+    SpotSchedule.objects.bulk_create(candidates, batch_size=INSERT_BATCH, ignore_conflicts=True)
+    created = (
+        window.exclude(id__in=before)
+        .select_related('spot__campaign__client', 'time_slot')
+        .order_by('broadcast_date', 'broadcast_time')
+    )
+    return [s for s in created if (s.time_slot_id, s.broadcast_date, s.broadcast_time) in keys]
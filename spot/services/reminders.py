@@ -0,0 +1,176 @@
+"""
+Relances SMS des assignations (campagnes de notification dues).
+
+Un lot de campagnes dues est d'abord réservé: sélection `FOR UPDATE SKIP
+LOCKED` quand la base le permet, puis un UPDATE conditionnel qui pose un
+bail (`lease_owner`, `lease_until`) uniquement sur les lignes libres ou dont
+le bail a expiré. Sous SQLite, sans verrou de ligne, c'est ce UPDATE
+conditionnel qui arbitre entre processus. Plusieurs exécutions peuvent donc
+se chevaucher sans double envoi; un processus arrêté en cours de route
+libère ses campagnes à l'expiration du bail.
+
+Les SMS du lot partent hors transaction, en parallèle dans un pool de
+threads borné (`SPOT_SMS_CONCURRENCY`): le débit suit la concurrence
+acceptée par la passerelle au lieu d'additionner les délais. Tentatives et
+journaux sont ensuite écrits en `bulk_create`, les campagnes en
+`bulk_update`, bail libéré.
+"""
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+logger = logging.getLogger('spot')
+
+BATCH = 100
+LEASE = timedelta(minutes=5)
+FIRST_REMINDER_DELAY = timedelta(minutes=30)
+MAX_REMINDERS = 2
+
+
+def concurrency():
+    return max(1, int(getattr(settings, 'SPOT_SMS_CONCURRENCY', 8) or 1))
+
+
+def due(now):
+    """Campagnes actives, non confirmées, dont la relance est échue."""
+    from ..models import AssignmentNotificationCampaign
+
+    return AssignmentNotificationCampaign.objects.filter(
+        status='active',
+        confirmed_at__isnull=True,
+        next_attempt_at__isnull=False,
+        next_attempt_at__lte=now,
+    )
+
+
+def _free(now):
+    return Q(lease_until__isnull=True) | Q(lease_until__lt=now)
+
+
+def claim(now=None, limit=BATCH, owner=None, lease=LEASE):
+    """Réserve jusqu'à `limit` campagnes dues; renvoie (propriétaire, campagnes)."""
+    from ..models import AssignmentNotificationCampaign
+
+    now = now or timezone.now()
+    owner = owner or uuid.uuid4().hex
+    with transaction.atomic():
+        candidates = due(now).filter(_free(now)).order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:limit])
+        if ids:
+            AssignmentNotificationCampaign.objects.filter(_free(now), id__in=ids).update(
+                lease_owner=owner, lease_until=now + lease,
+            )
+    if not ids:
+        return owner, []
+    campaigns = list(
+        AssignmentNotificationCampaign.objects.select_related('assignment__coverage')
+        .filter(id__in=ids, lease_owner=owner)
+        .order_by('next_attempt_at')
+    )
+    return owner, campaigns
+
+
+def _text(campaign):
+    coverage = campaign.assignment.coverage
+    site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
+    confirm_url = f'{site_url}/assignments/confirm/{campaign.id}/{campaign.confirm_code}/'
+    base = (
+        f'Assignation BF1 TV: {coverage.event_title} le {coverage.event_date} '
+        f'à {coverage.start_time.strftime("%H:%M")} — {coverage.address}. '
+        f'Code {campaign.confirm_code}. Lien {confirm_url}'
+    )
+    return base if campaign.reminder_count == 0 else f'RAPPEL — {base}'
+
+
+def _send(job):
+    from .. import utils
+
+    campaign, text = job
+    try:
+        return utils.send_sms(campaign.to_phone, text)
+    except Exception as exc:
+        logger.error('Erreur envoi relance SMS campagne=%s', campaign.id, exc_info=True)
+        return False, None, str(exc)
+    finally:
+        # Le thread du pool ne garde pas de connexion ouverte
+        close_old_connections()
+
+
+def process(campaigns, owner, now=None, workers=None):
+    """Envoie les relances des campagnes réservées et enregistre le résultat."""
+    from ..models import AssignmentLog, AssignmentNotificationAttempt, AssignmentNotificationCampaign
+
+    now = now or timezone.now()
+    provider = getattr(settings, 'SPOT_SMS_PROVIDER', '')
+    without_phone = [c for c in campaigns if not c.to_phone]
+    jobs = [(c, _text(c)) for c in campaigns if c.to_phone]
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(workers or concurrency(), len(jobs))) as pool:
+            results = list(pool.map(_send, jobs))
+    else:
+        results = []
+
+    sent_at = timezone.now()
+    attempts, logs = [], []
+    for (campaign, text), (ok, msg_id, err) in zip(jobs, results):
+        attempts.append(AssignmentNotificationAttempt(
+            campaign=campaign,
+            channel='sms',
+            status='sent' if ok else 'failed',
+            to=campaign.to_phone,
+            body=text,
+            provider=provider,
+            provider_message_id=msg_id or '',
+            error='' if ok else err,
+            sent_at=sent_at if ok else None,
+        ))
+        logs.append(AssignmentLog(
+            assignment=campaign.assignment,
+            label='Relance SMS',
+            note=f'{campaign.recipient_kind} — {"ok" if ok else "failed"}',
+        ))
+        next_at = now + FIRST_REMINDER_DELAY if campaign.reminder_count == 0 else None
+        campaign.reminder_count = min(campaign.reminder_count + 1, MAX_REMINDERS)
+        campaign.next_attempt_at = next_at
+        if not next_at and campaign.reminder_count >= MAX_REMINDERS:
+            campaign.status = 'expired'
+    for campaign in without_phone:
+        campaign.next_attempt_at = None
+    for campaign in campaigns:
+        campaign.lease_owner = ''
+        campaign.lease_until = None
+        campaign.updated_at = sent_at
+
+    with transaction.atomic():
+        # Un bail expiré et repris ailleurs n'est pas écrasé, ni une
+        # confirmation arrivée pendant l'envoi (son bail est seulement libéré)
+        held = AssignmentNotificationCampaign.objects.select_for_update().filter(
+            id__in=[c.id for c in campaigns], lease_owner=owner,
+        )
+        owned = set(held.filter(status='active', confirmed_at__isnull=True).values_list('id', flat=True))
+        AssignmentNotificationAttempt.objects.bulk_create(attempts)
+        AssignmentLog.objects.bulk_create(logs)
+        AssignmentNotificationCampaign.objects.bulk_update(
+            [c for c in campaigns if c.id in owned],
+            ['reminder_count', 'next_attempt_at', 'status', 'lease_owner', 'lease_until', 'updated_at'],
+        )
+        held.exclude(id__in=owned).update(lease_owner='', lease_until=None)
+    return len(campaigns)
+
+
+def process_due(now=None, limit=BATCH, workers=None):
+    """Réserve puis traite un lot; renvoie le nombre de campagnes traitées."""
+    owner, campaigns = claim(now=now, limit=limit)
+    if not campaigns:
+        return 0
+    return process(campaigns, owner, now=now, workers=workers)
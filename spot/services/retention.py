@@ -0,0 +1,194 @@
+"""
+Rétention des tables à forte croissance (notifications, historiques,
+journaux et tentatives d'envoi des assignations, événements du planning).
+
+Chaque politique fixe un âge au-delà duquel les lignes expirent; pour les
+notifications, les non lues sont gardées plus longtemps. Une
+politique peut se passer d'archive (`archive: False`). Les réglages par
+défaut (`POLICIES`) se surchargent par `SPOT_RETENTION`
+(`{'notifications': {'days': 30}}`; `days` à 0 désactive une politique).
+
+Les lignes expirées sont parcourues par clé primaire, par lots: chaque lot
+est écrit dans une archive JSONL compressée (`SPOT_ARCHIVE_DIR`), vidée sur
+disque, puis supprimé dans sa propre transaction: pas de verrou long, et
+une interruption ne perd rien (un lot peut au pire être archivé deux fois).
+Avant expiration, les tentatives d'envoi anciennes sont compactées (corps
+du SMS et `meta` vidés), elles aussi par lots.
+
+Chaque exécution produit un rapport par politique (lignes compactées,
+archivées, supprimées, octets écrits, durée), journalisé et conservé dans
+le cache (`retention:report`).
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+logger = logging.getLogger('spot')
+
+BATCH = 1000
+REPORT_KEY = 'retention:report'
+
+POLICIES = {
+    'notifications': {'model': 'Notification', 'field': 'created_at', 'days': 90, 'unread_days': 365},
+    'campaign_history': {'model': 'CampaignHistory', 'field': 'created_at', 'days': 730},
+    'assignment_logs': {'model': 'AssignmentLog', 'field': 'at', 'days': 365},
+    'assignment_attempts': {
+        'model': 'AssignmentNotificationAttempt', 'field': 'created_at', 'days': 180,
+        'compact_days': 30, 'compact': {'body': '', 'meta': {}},
+    },
+    'inbound_sms': {'model': 'InboundSms', 'field': 'received_at', 'days': 180},
+    # Au-delà, un client qui se reconnecte recharge l'instantané du planning;
+    # relayés ou non (déploiement sans WebSockets, donc sans relais)
+    'planning_events': {'model': 'PlanningEvent', 'field': 'created_at', 'days': 2, 'archive': False},
+}
+
+
+def policies():
+    """Politiques effectives: défauts fusionnés avec `SPOT_RETENTION`."""
+    overrides = getattr(settings, 'SPOT_RETENTION', None) or {}
+    merged = {}
+    for name, policy in POLICIES.items():
+        merged[name] = dict(policy, **(overrides.get(name) or {}))
+    return merged
+
+
+def archive_dir():
+    return getattr(settings, 'SPOT_ARCHIVE_DIR', None) or os.path.join(settings.BASE_DIR, 'archives')
+
+
+def expired(policy, now=None):
+    """Lignes expirées selon `policy` (None si la politique est désactivée)."""
+    days = int(policy.get('days') or 0)
+    if days <= 0:
+        return None
+    now = now or timezone.now()
+    model = apps.get_model('spot', policy['model'])
+    field = policy['field']
+    condition = Q(**{f'{field}__lt': now - timedelta(days=days)})
+    unread_days = int(policy.get('unread_days') or 0)
+    if unread_days:
+        # Les non lues restent jusqu'à `unread_days`
+        condition &= Q(is_read=True) | Q(**{f'{field}__lt': now - timedelta(days=unread_days)})
+    return model.objects.filter(condition)
+
+
+def _chunks(queryset, batch):
+    """Clés primaires de `queryset` par lots croissants (pagination par clé)."""
+    last = None
+    while True:
+        qs = queryset.order_by('pk')
+        if last is not None:
+            qs = qs.filter(pk__gt=last)
+        ids = list(qs.values_list('pk', flat=True)[:batch])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def compact(policy, now=None, batch=BATCH):
+    """Vide les champs volumineux des lignes plus vieilles que `compact_days`."""
+    days = int(policy.get('compact_days') or 0)
+    values = policy.get('compact')
+    if days <= 0 or not values:
+        return 0
+    now = now or timezone.now()
+    model = apps.get_model('spot', policy['model'])
+    stale = model.objects.filter(**{f"{policy['field']}__lt": now - timedelta(days=days)}).exclude(**values)
+    total = 0
+    for ids in _chunks(stale, batch):
+        with transaction.atomic():
+            total += model.objects.filter(pk__in=ids).update(**values)
+    return total
+
+
+class _Archive:
+    """Archive JSONL compressée, vidée sur disque à chaque lot."""
+
+    def __init__(self, name, now):
+        folder = os.path.join(archive_dir(), name)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{name}-{now.strftime('%Y%m%dT%H%M%S')}.jsonl.gz")
+        self.raw = open(self.path, 'ab')
+        self.gz = gzip.GzipFile(fileobj=self.raw, mode='ab')
+
+    def write(self, row):
+        self.gz.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def sync(self):
+        self.gz.flush()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        self.gz.close()
+        self.raw.close()
+
+
+def purge(name, policy, now=None, batch=BATCH, archive=True):
+    """Archive puis supprime les lignes expirées; renvoie (archivées, supprimées, fichier)."""
+    queryset = expired(policy, now)
+    if queryset is None:
+        return 0, 0, None
+    model = queryset.model
+    fields = [f.attname for f in model._meta.concrete_fields]
+    archived = deleted = 0
+    out = None
+    try:
+        for ids in _chunks(queryset, batch):
+            if archive:
+                if out is None:
+                    out = _Archive(name, now or timezone.now())
+                for row in model.objects.filter(pk__in=ids).order_by('pk').values(*fields).iterator():
+                    out.write(row)
+                    archived += 1
+                # Lot écrit sur disque avant sa suppression
+                out.sync()
+            with transaction.atomic():
+                deleted += model.objects.filter(pk__in=ids).delete()[1].get(model._meta.label, 0)
+    finally:
+        if out is not None:
+            out.close()
+    return archived, deleted, out.path if out else None
+
+
+def run(names=None, now=None, batch=BATCH, archive=True, dry_run=False):
+    """Applique les politiques (toutes, ou `names`); renvoie le rapport par politique."""
+    now = now or timezone.now()
+    report = []
+    for name, policy in policies().items():
+        if names and name not in names:
+            continue
+        started = time.monotonic()
+        entry = {'policy': name, 'compacted': 0, 'archived': 0, 'deleted': 0, 'file': None, 'bytes': 0}
+        if dry_run:
+            queryset = expired(policy, now)
+            entry['expired'] = queryset.count() if queryset is not None else 0
+        else:
+            entry['compacted'] = compact(policy, now, batch)
+            keep = archive and policy.get('archive', True)
+            entry['archived'], entry['deleted'], entry['file'] = purge(name, policy, now, batch, keep)
+            if entry['file']:
+                entry['bytes'] = os.path.getsize(entry['file'])
+        entry['seconds'] = round(time.monotonic() - started, 3)
+        logger.info(
+            'retention policy=%s compacted=%d archived=%d deleted=%d bytes=%d seconds=%.3f',
+            name, entry['compacted'], entry['archived'], entry['deleted'], entry['bytes'], entry['seconds'],
+        )
+        report.append(entry)
+    if not dry_run:
+        cache.set(REPORT_KEY, {'at': now.isoformat(), 'policies': report}, None)
+    return report
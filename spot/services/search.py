@@ -0,0 +1,197 @@
+"""
+Recherche plein texte partagée par les listes (campagnes, spots, couvertures,
+correspondances, personnel de la rédaction).
+
+- PostgreSQL: `to_tsvector('french', ...)` indexé en GIN (index d'expression,
+  requête préfixe `mot:*`) et `pg_trgm` pour les noms approximatifs.
+- SQLite (local/dev): tables virtuelles FTS5 `<table>_fts` tenues à jour par
+  triggers, jointes par `rowid`.
+- Autre cas (index absents): repli sur `icontains`.
+
+La recherche indexée est par préfixe de mots (« lanc » trouve « lancement »,
+pas « élancé »), là où `icontains` trouvait toute sous-chaîne.
+
+Les index sont créés par la migration 0030_search_indexes; les champs listés
+ci-dessous doivent rester identiques à ceux de la migration. Sous SQLite,
+une migration qui reconstruit une table indexée (ajout de clé étrangère,
+changement de colonne) supprime ses triggers et peut renuméroter ses
+`rowid`: elle doit appeler `rebuild_search_indexes`. En filet de sécurité,
+`ensure_search_indexes` (après chaque `migrate`) reconstruit toute table
+dont les triggers ont disparu.
+"""
+
+import re
+
+from django.apps import apps
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+TS_CONFIG = 'french'
+MAX_TOKENS = 8
+TRIGRAM_MIN_LENGTH = 3
+
+# Clé -> (modèle, champs texte indexés)
+SEARCH_INDEXES = {
+    'campaign': ('spot.Campaign', ('title', 'description')),
+    'spot': ('spot.Spot', ('title', 'description')),
+    'coverage': ('spot.CoverageRequest', ('event_title', 'address', 'description')),
+    'thread': ('spot.CorrespondenceThread', ('subject',)),
+    'journalist': ('spot.Journalist', ('name', 'email', 'specialties')),
+    'driver': ('spot.Driver', ('name',)),
+}
+
+TRIGGER_SUFFIXES = ('_ai', '_ad', '_au')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_fts_tables = set()
+
+
+def tokens(q):
+    return _TOKEN_RE.findall((q or '').lower())[:MAX_TOKENS]
+
+
+def search_vector(fields):
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector(*fields, config=TS_CONFIG)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def _has_fts_table(table):
+    if table in _fts_tables:
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+        found = cursor.fetchone() is not None
+    if found:
+        _fts_tables.add(table)
+    return found
+
+
+def _sqlite_statements(base, fields):
+    table = f'{base}_fts'
+    cols = ', '.join(fields)
+    new_vals = ', '.join(f'NEW.{f}' for f in fields)
+    for suffix in TRIGGER_SUFFIXES:
+        yield f'DROP TRIGGER IF EXISTS {table}{suffix}'
+    yield f'DROP TABLE IF EXISTS {table}'
+    yield f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, tokenize='unicode61 remove_diacritics 2')"
+    yield f"INSERT INTO {table}(rowid, {cols}) SELECT rowid, {cols} FROM {base}"
+    yield (
+        f"CREATE TRIGGER {table}_ai AFTER INSERT ON {base} BEGIN "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES (NEW.rowid, {new_vals}); END"
+    )
+    yield (
+        f"CREATE TRIGGER {table}_ad AFTER DELETE ON {base} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = OLD.rowid; END"
+    )
+    yield (
+        f"CREATE TRIGGER {table}_au AFTER UPDATE ON {base} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = OLD.rowid; "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES (NEW.rowid, {new_vals}); END"
+    )
+
+
+def rebuild_search_indexes(schema_editor, indexes=None):
+    """Recrée (SQLite) la table FTS5 et les triggers des index `indexes`
+    (clés de SEARCH_INDEXES, tous par défaut), réindexés d'après les
+    `rowid` actuels. Sans effet hors SQLite ou sans FTS5.
+
+    `schema_editor`: celui d'une migration (`RunPython`), ou une connexion.
+    """
+    conn = schema_editor if hasattr(schema_editor, 'vendor') else schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    for key in indexes or SEARCH_INDEXES:
+        label, fields = SEARCH_INDEXES[key]
+        base = apps.get_model(label)._meta.db_table
+        try:
+            with conn.cursor() as cursor:
+                for statement in _sqlite_statements(base, fields):
+                    cursor.execute(statement)
+        except OperationalError:
+            # SQLite compilé sans FTS5: la recherche se replie sur icontains
+            return
+    _fts_tables.clear()
+
+
+def ensure_search_indexes(conn=None):
+    """Reconstruit les index SQLite dont les triggers manquent (table reconstruite)."""
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        present = {row[0] for row in cursor.fetchall()}
+    broken = []
+    for key, (label, _) in SEARCH_INDEXES.items():
+        table = fts_table(apps.get_model(label))
+        if table in present and any(f'{table}{s}' not in present for s in TRIGGER_SUFFIXES):
+            broken.append(key)
+    if broken:
+        rebuild_search_indexes(conn, broken)
+    return broken
+
+
+def _fallback(fields, q, path):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{path}{field}__icontains': q})
+    return condition
+
+
+def text_match(index, q, path=''):
+    """Condition « correspond à `q` » sur l'index `index`, appliquée au
+    chemin de relation `path` (ex. 'spot__campaign__'). Chaque mot est
+    recherché en préfixe; tous doivent être présents."""
+    label, fields = SEARCH_INDEXES[index]
+    model = apps.get_model(label)
+    words = tokens(q)
+    if not words:
+        return Q()
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery
+
+        query = SearchQuery(' & '.join(f'{w}:*' for w in words), search_type='raw', config=TS_CONFIG)
+        matching = model._default_manager.annotate(_search=search_vector(fields)).filter(_search=query)
+        return Q(**{f'{path}pk__in': matching.values('pk')})
+
+    if connection.vendor == 'sqlite':
+        table = fts_table(model)
+        if _has_fts_table(table):
+            expression = ' '.join(f'"{w}"*' for w in words)
+            base = model._meta.db_table
+            pk = model._meta.pk.column
+            matching = RawSQL(
+                f'SELECT "{pk}" FROM "{base}" WHERE rowid IN '
+                f'(SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s)',
+                [expression],
+            )
+            return Q(**{f'{path}pk__in': matching})
+
+    return _fallback(fields, q, path)
+
+
+def fuzzy_match(field_path, q):
+    """Correspondance approximative sur un nom (client, société, téléphone).
+
+    Sous PostgreSQL, `icontains` et la similarité de mots `pg_trgm` sont
+    servis par des index GIN trigrammes; ailleurs, `icontains` seul.
+    """
+    q = (q or '').strip()
+    if not q:
+        return Q()
+    condition = Q(**{f'{field_path}__icontains': q})
+    if (
+        connection.vendor == 'postgresql'
+        and len(q) >= TRIGRAM_MIN_LENGTH
+        and apps.is_installed('django.contrib.postgres')
+    ):
+        condition |= Q(**{f'{field_path}__trigram_word_similar': q})
+    return condition
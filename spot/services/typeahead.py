@@ -0,0 +1,152 @@
+"""
+Saisie prédictive des clients (diffuseurs: filtre « client » des spots).
+
+L'index (identifiant, société, téléphone) est construit une fois puis placé
+dans le cache partagé sous forme de liste triée de termes: une recherche par
+préfixe est une bisection suivie d'un parcours borné. Les signaux User/Campaign
+incrémentent la version, ce qui invalide l'index et les résultats mis en
+cache par préfixe; la reconstruction est paresseuse.
+"""
+
+import hashlib
+import unicodedata
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import versions
+
+
+VERSION_KEY = 'typeahead:clients:version'
+INDEX_KEY = 'typeahead:clients:index:{version}'
+RESULT_KEY = 'typeahead:clients:q:{digest}'
+INDEX_TTL = 24 * 3600
+RESULT_TTL = 10 * 60
+MAX_SCAN = 400
+DEFAULT_LIMIT = 8
+
+# Rang du champ ayant produit la correspondance (plus petit = meilleur)
+RANK_EXACT, RANK_USERNAME, RANK_COMPANY, RANK_PHONE, RANK_WORD = range(5)
+
+# Copie locale de l'index désérialisé: (version, index)
+_local = {'version': None, 'index': None}
+
+
+def normalize(value):
+    """Minuscules sans accents, espaces réduits."""
+    text = unicodedata.normalize('NFKD', str(value or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def _digits(value):
+    return ''.join(c for c in str(value or '') if c.isdigit())
+
+
+def current_version():
+    return versions.current(VERSION_KEY)
+
+
+def invalidate():
+    """Appelé par les signaux: nouvelle version, l'ancien index expire seul."""
+    versions.bump(VERSION_KEY)
+
+
+def build_index():
+    """Renvoie {'entries': [...], 'terms': [(terme, rang, n°), ...] trié}."""
+    from ..models import User
+
+    clients = (
+        User.objects.filter(role='client', is_active=True)
+        .annotate(campaign_count=Count('campaigns'))
+        .filter(campaign_count__gt=0)
+        .values('id', 'username', 'company', 'phone', 'campaign_count')
+    )
+    entries, terms = [], []
+    for row in clients.iterator():
+        n = len(entries)
+        entries.append({
+            'id': row['id'],
+            'username': row['username'],
+            'company': row['company'] or '',
+            'phone': row['phone'] or '',
+            'campaigns': row['campaign_count'],
+        })
+        username = normalize(row['username'])
+        terms.append((username, RANK_USERNAME, n))
+        company = normalize(row['company'])
+        if company:
+            terms.append((company, RANK_COMPANY, n))
+        for word in set(username.split()[1:] + company.split()[1:]):
+            terms.append((word, RANK_WORD, n))
+        phone = _digits(row['phone'])
+        if phone:
+            terms.append((phone, RANK_PHONE, n))
+            # Numéro local sans indicatif (+226 ...)
+            if len(phone) > 8:
+                terms.append((phone[-8:], RANK_PHONE, n))
+    terms.sort()
+    return {'entries': entries, 'terms': terms}
+
+
+def get_index(version=None):
+    version = version or current_version()
+    if _local['version'] == version:
+        return _local['index']
+    key = INDEX_KEY.format(version=version)
+    index = cache.get(key)
+    if index is None:
+        index = build_index()
+        cache.set(key, index, INDEX_TTL)
+    _local.update(version=version, index=index)
+    return index
+
+
+def _lookup(index, prefix, limit):
+    terms = index['terms']
+    best = {}
+    i = bisect_left(terms, (prefix,))
+    scanned = 0
+    while i < len(terms) and scanned < MAX_SCAN:
+        term, rank, n = terms[i]
+        if not term.startswith(prefix):
+            break
+        if term == prefix and rank == RANK_USERNAME:
+            rank = RANK_EXACT
+        if rank < best.get(n, RANK_WORD + 1):
+            best[n] = rank
+        i += 1
+        scanned += 1
+    entries = index['entries']
+    ranked = sorted(best.items(), key=lambda item: (item[1], -entries[item[0]]['campaigns'], entries[item[0]]['username']))
+    return [
+        {'username': entries[n]['username'], 'company': entries[n]['company']}
+        for n, _ in ranked[:limit]
+    ]
+
+
+def query_prefix(q):
+    """Préfixe normalisé; un numéro de téléphone est réduit à ses chiffres."""
+    prefix = normalize(q)
+    compact = prefix.replace(' ', '').lstrip('+')
+    return compact if compact.isdigit() else prefix
+
+
+def etag(q, version, limit=DEFAULT_LIMIT):
+    digest = hashlib.sha1(f'{query_prefix(q)}|{limit}'.encode('utf-8')).hexdigest()[:16]
+    return f'"clients-{version}-{digest}"'
+
+
+def search(q, limit=DEFAULT_LIMIT, version=None):
+    """Clients dont l'identifiant, la société ou le téléphone commence par `q`."""
+    prefix = query_prefix(q)
+    if not prefix:
+        return []
+    version = version or current_version()
+    key = RESULT_KEY.format(version=version, digest=etag(q, version, limit).strip('"'))
+    results = cache.get(key)
+    if results is None:
+        results = _lookup(get_index(version), prefix, limit)
+        cache.set(key, results, RESULT_TTL)
+    return results
@@ -0,0 +1,240 @@
+"""
+Téléversements reprenables (par morceaux) pour les médias des spots.
+
+Le client ouvre une session, envoie des morceaux successifs avec leur offset et
+leur empreinte SHA-256, puis soumet le formulaire habituel avec l'identifiant
+de session. Le fichier assemblé est alors remis au stockage, qui le copie en
+une passe en calculant son empreinte (stockage dédupliqué).
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger('spot')
+
+CHUNK_SIZE = int(getattr(settings, 'SPOT_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(getattr(settings, 'SPOT_UPLOAD_MAX_SIZE', 100 * 1024 * 1024))
+STAGING_DIR = getattr(settings, 'SPOT_UPLOAD_STAGING_DIR', os.path.join(settings.BASE_DIR, 'tmp', 'uploads'))
+READ_BLOCK = 64 * 1024
+
+ALLOWED_EXTENSIONS = {
+    'video_file': {'mp4', 'avi', 'mov', 'wmv'},
+    'image_file': {'jpg', 'jpeg', 'png', 'gif', 'webp'},
+}
+
+CONTENT_TYPES = {
+    'mp4': 'video/mp4',
+    'avi': 'video/x-msvideo',
+    'mov': 'video/quicktime',
+    'wmv': 'video/x-ms-wmv',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+
+class UploadError(Exception):
+    """Erreur de protocole; `code` est renvoyé tel quel au client."""
+
+    def __init__(self, code, status=400, offset=None):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+        self.offset = offset
+
+
+class StagedUploadedFile(UploadedFile):
+    """Fichier déjà présent sur disque, lu directement par le stockage."""
+
+    def __init__(self, path, name, size, content_type=None):
+        super().__init__(open(path, 'rb'), name=name, content_type=content_type, size=size)
+        self._staged_path = path
+
+    def temporary_file_path(self):
+        return self._staged_path
+
+
+def staging_path(upload):
+    return os.path.join(STAGING_DIR, f'{upload.id}.part')
+
+
+def _extension(filename):
+    return os.path.splitext(filename or '')[1].lstrip('.').lower()
+
+
+def parse_checksum(header):
+    """Accepte `sha256 <base64>` (convention tus) ou une empreinte hexadécimale."""
+    value = (header or '').strip()
+    if not value:
+        return None
+    if ' ' in value:
+        algo, _, encoded = value.partition(' ')
+        if algo.lower() != 'sha256':
+            raise UploadError('unsupported_checksum')
+        try:
+            return base64.b64decode(encoded.strip(), validate=True).hex()
+        except (binascii.Error, ValueError):
+            raise UploadError('invalid_checksum')
+    value = value.lower()
+    if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+        raise UploadError('invalid_checksum')
+    return value
+
+
+def open_upload(user, filename, total_size, target_field='video_file', campaign=None):
+    from ..models import ChunkedUpload
+
+    if target_field not in ALLOWED_EXTENSIONS:
+        raise UploadError('invalid_field')
+    if _extension(filename) not in ALLOWED_EXTENSIONS[target_field]:
+        raise UploadError('unsupported_format')
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise UploadError('invalid_size')
+    if total_size <= 0:
+        raise UploadError('invalid_size')
+    if total_size > MAX_UPLOAD_SIZE:
+        raise UploadError('too_large', status=413)
+
+    upload = ChunkedUpload.objects.create(
+        user=user,
+        campaign=campaign,
+        target_field=target_field,
+        filename=os.path.basename(filename)[:255],
+        total_size=total_size,
+    )
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    open(staging_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, user, offset, stream, checksum=None):
+    """Ajoute un morceau à la session `upload_id` et renvoie la session à jour.
+
+    L'offset doit correspondre exactement aux octets déjà reçus et chaque
+    morceau porte son empreinte: le fichier assemblé est ainsi vérifié de bout
+    en bout. En cas d'empreinte invalide le fichier est tronqué pour que le
+    client réessaie depuis le même offset.
+    """
+    from ..models import ChunkedUpload
+
+    expected_digest = parse_checksum(checksum)
+    if not expected_digest:
+        raise UploadError('missing_checksum', offset=offset)
+    with transaction.atomic():
+        try:
+            upload = ChunkedUpload.objects.select_for_update().get(id=upload_id, user=user)
+        except ChunkedUpload.DoesNotExist:
+            raise UploadError('not_found', status=404)
+        if upload.status != 'open':
+            raise UploadError('not_open', status=409, offset=upload.received_bytes)
+        if offset != upload.received_bytes:
+            raise UploadError('offset_mismatch', status=409, offset=upload.received_bytes)
+
+        path = staging_path(upload)
+        limit = min(CHUNK_SIZE, upload.total_size - offset)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(path, 'r+b') as fh:
+                # Écarte d'éventuels octets d'une tentative interrompue
+                fh.truncate(offset)
+                fh.seek(offset)
+                while True:
+                    block = stream.read(READ_BLOCK)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > limit:
+                        fh.truncate(offset)
+                        raise UploadError('chunk_too_large', status=413, offset=offset)
+                    digest.update(block)
+                    fh.write(block)
+                if digest.hexdigest() != expected_digest:
+                    fh.truncate(offset)
+                    raise UploadError('checksum_mismatch', status=460, offset=offset)
+        except FileNotFoundError:
+            raise UploadError('staging_missing', status=410)
+
+        if written == 0:
+            raise UploadError('empty_chunk', offset=offset)
+
+        upload.received_bytes = offset + written
+        upload.chunk_count += 1
+        if upload.received_bytes >= upload.total_size:
+            upload.status = 'complete'
+        upload.save(update_fields=['received_bytes', 'chunk_count', 'status', 'updated_at'])
+    return upload
+
+
+def cancel_upload(upload_id, user):
+    from ..models import ChunkedUpload
+
+    updated = ChunkedUpload.objects.filter(id=upload_id, user=user, status__in=['open', 'complete']).update(
+        status='cancelled', updated_at=timezone.now()
+    )
+    if updated:
+        _remove_staging(upload_id)
+    return bool(updated)
+
+
+def staged_file(upload_id, user, target_field, campaign=None):
+    """Renvoie (session, fichier) pour une session complète, prête à être rattachée.
+
+    La session doit avoir été ouverte pour la même cible que le formulaire:
+    la campagne `campaign`, ou aucune campagne (création en Mode Facile).
+    """
+    from ..models import ChunkedUpload
+
+    upload = ChunkedUpload.objects.filter(
+        id=upload_id, user=user, target_field=target_field, campaign=campaign, status='complete'
+    ).first()
+    if not upload:
+        return None, None
+    path = staging_path(upload)
+    if not os.path.exists(path) or os.path.getsize(path) != upload.total_size:
+        return None, None
+    content_type = CONTENT_TYPES.get(_extension(upload.filename))
+    return upload, StagedUploadedFile(path, upload.filename, upload.total_size, content_type)
+
+
+def mark_attached(upload):
+    upload.status = 'attached'
+    upload.save(update_fields=['status', 'updated_at'])
+    _remove_staging(upload.id)
+
+
+def _remove_staging(upload_id):
+    try:
+        os.remove(os.path.join(STAGING_DIR, f'{upload_id}.part'))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning('Suppression impossible du fichier de transit %s', upload_id)
+
+
+def purge_stale_uploads(max_age_hours=24):
+    """Supprime les sessions abandonnées et leurs fichiers de transit."""
+    from ..models import ChunkedUpload
+
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    stale = ChunkedUpload.objects.filter(status__in=['open', 'complete', 'cancelled'], updated_at__lt=cutoff)
+    purged = 0
+    for upload_id in stale.values_list('id', flat=True).iterator():
+        _remove_staging(upload_id)
+        purged += 1
+    stale.delete()
+    return purged
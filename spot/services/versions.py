@@ -0,0 +1,35 @@
+"""
+Versions partagées (cache) des tables et index copiés en mémoire par processus.
+
+Une version est un entier sous une clé sans expiration; `bump` l'avance par
+`cache.incr` (atomique). Absente (cache vidé, clé évincée), elle repart d'un
+horodatage en microsecondes, toujours au-delà des versions déjà distribuées:
+une copie locale d'avant la perte n'est jamais reprise par erreur.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _seed():
+    return time.time_ns() // 1000
+
+
+def current(key):
+    """Version courante de `key` (amorcée au besoin)."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), None)
+        version = cache.get(key) or 1
+    return version
+
+
+def bump(key):
+    """Avance la version de `key`; renvoie la nouvelle version."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _seed()
+        cache.set(key, version, None)
+        return version
@@ -1,14 +1,23 @@
-from django.db.models.signals import post_save, post_delete
+import os
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from django.conf import settings
-from django.db import transaction
-from .models import Campaign, CampaignHistory, Notification, Spot, CorrespondenceThread
-from django.utils import timezone
-from decimal import Decimal
-from .models import SpotSchedule, TimeSlot  # Ajouté
-from datetime import timedelta              # Ajouté
-from .utils import send_notification_email
+from django.db import connection, transaction
+from .models import Campaign, CampaignHistory, Notification, Spot, CorrespondenceThread, CorrespondenceMessage
+from .models import PricingRule, SpotSchedule, TimeSlot  # Ajouté
+from .models import CoverageAssignment, CoverageRequest
+from .services import allocation
+from .services import correspondence
+from .services import crew
+from .services import editorial
+from .services import inventory
+from .services import mail
+from .services import pricing
+from .services import progress
+from .services import search
+from .services import typeahead
 try:
     from channels.layers import get_channel_layer
     from asgiref.sync import async_to_sync
@@ -18,6 +27,8 @@ except Exception:
 
 User = get_user_model()
 
+SPOT_MEDIA_FIELDS = ('video_file', 'image_file')
+
 
 def _pending_counts():
     return {
@@ -42,55 +53,73 @@ def broadcast_pending_counts():
     )
 
 
-@receiver(post_save, sender=Notification)
-def deliver_notification_offsite(sender, instance, created, **kwargs):
-    if not created:
+def deliver_offsite(instance):
+    """Envoi hors site (e-mail) d'une notification, selon `OFFSITE_NOTIFICATIONS`.
+
+    Appelé après validation; aussi pour les notifications créées en bloc
+    (`bulk_create` n'émet pas `post_save`), via `deliver_offsite_many`.
+    """
+    deliver_offsite_many([instance])
+
+
+def deliver_offsite_many(instances):
+    """Envoi hors site d'une série de notifications sur une même session SMTP."""
+    mail.deliver_notifications(list(instances))
+
+
+def create_notifications(notifications):
+    """Insère les notifications en bloc puis, après validation, l'envoi hors site."""
+    if not notifications:
         return
+    if connection.features.can_return_rows_from_bulk_insert:
+        Notification.objects.bulk_create(notifications)
+        transaction.on_commit(lambda: deliver_offsite_many(notifications))
+    else:
+        # Sans identifiants renvoyés: enregistrement unitaire (signal d'envoi)
+        for notification in notifications:
+            notification.save()
 
-    def _deliver():
-        cfg = getattr(settings, 'OFFSITE_NOTIFICATIONS', None) or {}
-        if not cfg.get('enabled', False):
-            return
 
-        user = getattr(instance, 'user', None)
-        if not user or not getattr(user, 'is_active', True):
+class _OffsiteBatch:
+    """Notifications créées dans les transactions de la connexion, envoyées en un lot.
+
+    Chaque notification ajoute `flush` aux rappels après validation: le
+    premier rappel exécuté envoie tout le lot, les suivants le trouvent vide.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def flush(self):
+        items, self.items = self.items, []
+        if not items:
             return
+        # Point de sauvegarde ou transaction annulés: la ligne n'existe plus
+        # (ou son identifiant a été réattribué, d'où la date de création)
+        kept = set(Notification.objects.filter(id__in=[n.id for n in items]).values_list('id', 'created_at'))
+        items = [n for n in items if (n.id, n.created_at) in kept]
+        if items:
+            deliver_offsite_many(items)
 
-        role = (getattr(user, 'role', '') or '').strip()
-        role_cfg = (cfg.get('roles') or {}).get(role) or {}
-
-        dedupe_minutes = int(cfg.get('dedupe_minutes') or 0)
-        if dedupe_minutes > 0:
-            since = timezone.now() - timedelta(minutes=dedupe_minutes)
-            if Notification.objects.filter(
-                user=user,
-                title=instance.title,
-                message=instance.message,
-                created_at__gte=since,
-            ).exclude(id=instance.id).exists():
-                return
-
-        updates = []
-
-        if role_cfg.get('email') and getattr(user, 'email', '') and not (instance.email_status or '').strip():
-            ok = send_notification_email(
-                user=user,
-                subject=instance.title,
-                message=instance.message,
-                campaign=getattr(instance, 'related_campaign', None),
-            )
-            instance.email_status = 'sent' if ok else 'failed'
-            instance.email_sent_at = timezone.now() if ok else None
-            instance.email_error = '' if ok else 'send_failed'
-            updates.extend(['email_status', 'email_sent_at', 'email_error'])
 
-        if updates:
-            instance.save(update_fields=sorted(set(updates)))
+def _offsite_batch():
+    conn = transaction.get_connection()
+    batch = getattr(conn, '_spot_offsite_batch', None)
+    if batch is None:
+        batch = conn._spot_offsite_batch = _OffsiteBatch()
+    return batch
+
 
-    try:
-        transaction.on_commit(_deliver)
-    except Exception:
-        _deliver()
+@receiver(post_save, sender=Notification)
+def deliver_notification_offsite(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if not transaction.get_connection().in_atomic_block:
+        deliver_offsite(instance)
+        return
+    batch = _offsite_batch()
+    batch.items.append(instance)
+    transaction.on_commit(batch.flush, robust=True)
 
 
 @receiver(post_save, sender=Campaign)
@@ -126,40 +155,10 @@ def create_campaign_history(sender, instance, created, **kwargs):
                     related_campaign=instance
                 )
             # === Programmations automatiques dans la grille de diffusion ===
-            # Spot approuvé (priorité au plus récemment approuvé)
-            approved_spot = instance.spots.filter(status='approved').order_by('-approved_at').first()
-            if approved_spot:
-                # Créneaux préférés actifs
-                preferred_slots = list(instance.preferred_time_slots.filter(is_active=True))
-                created_count = 0
-                if preferred_slots:
-                    current_date = instance.start_date
-                    while current_date <= instance.end_date:
-                        for ts in preferred_slots:
-                            base_time = ts.start_time
-                            # Éviter les conflits (contrainte unique: time_slot/date/heure)
-                            already_exists = SpotSchedule.objects.filter(
-                                time_slot=ts,
-                                broadcast_date=current_date,
-                                broadcast_time=base_time
-                            ).exists()
-                            if not already_exists:
-                                SpotSchedule.objects.create(
-                                    spot=approved_spot,
-                                    time_slot=ts,
-                                    broadcast_date=current_date,
-                                    broadcast_time=base_time,
-                                    price=Decimal('0')
-                                )
-                                created_count += 1
-                        current_date += timedelta(days=1)
-                    if created_count > 0:
-                        CampaignHistory.objects.create(
-                            campaign=instance,
-                            action='updated',
-                            description=f'{created_count} programmation(s) créée(s) automatiquement à l’approbation.',
-                            user=instance.approved_by
-                        )
+            # Heures réparties dans les créneaux préférés (services.allocation);
+            # une approbation groupée alloue le lot entier d'un coup
+            if not getattr(instance, '_defer_auto_schedule', False):
+                allocation.schedule([instance], user=instance.approved_by)
             # === Fin programmation auto ===
         elif instance.status == 'rejected':
             CampaignHistory.objects.create(
@@ -262,6 +261,14 @@ def broadcast_on_spot_delete(sender, instance, **kwargs):
     broadcast_pending_counts()
 
 
+@receiver(post_delete, sender=Spot)
+def release_spot_media(sender, instance, **kwargs):
+    """Libère les références de médias; le blob n'est supprimé qu'à la dernière."""
+    for field_file in (getattr(instance, f) for f in SPOT_MEDIA_FIELDS):
+        if field_file and hasattr(field_file.storage, 'etag'):
+            transaction.on_commit(lambda ff=field_file: ff.storage.delete(ff.name))
+
+
 @receiver(post_save, sender=CorrespondenceThread)
 def broadcast_on_thread_save(sender, instance, created, **kwargs):
     broadcast_pending_counts()
@@ -270,3 +277,217 @@ def broadcast_on_thread_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=CorrespondenceThread)
 def broadcast_on_thread_delete(sender, instance, **kwargs):
     broadcast_pending_counts()
+
+
+@receiver(post_delete, sender=CorrespondenceMessage)
+def refresh_thread_on_message_delete(sender, instance, origin=None, **kwargs):
+    # Suppression de la discussion elle-même: rien à recalculer
+    if isinstance(origin, CorrespondenceThread):
+        return
+    if isinstance(origin, QuerySet) and origin.model is CorrespondenceThread:
+        return
+    correspondence.refresh_thread(instance.thread_id)
+
+
+_TYPEAHEAD_USER_FIELDS = {'username', 'company', 'phone', 'role', 'is_active'}
+
+
+@receiver(post_save, sender=User)
+def refresh_client_typeahead_on_user(sender, instance, created, update_fields=None, **kwargs):
+    # Les connexions (last_login) ne touchent pas l'index
+    if update_fields is not None and not (set(update_fields) & _TYPEAHEAD_USER_FIELDS):
+        return
+    if created and getattr(instance, 'role', '') != 'client':
+        return
+    transaction.on_commit(typeahead.invalidate)
+
+
+@receiver(post_delete, sender=User)
+def refresh_client_typeahead_on_user_delete(sender, instance, **kwargs):
+    transaction.on_commit(typeahead.invalidate)
+
+
+@receiver(post_save, sender=Campaign)
+def refresh_client_typeahead_on_campaign(sender, instance, created, **kwargs):
+    # Seuls l'ajout et la suppression changent l'ensemble des clients et leur rang
+    if created:
+        transaction.on_commit(typeahead.invalidate)
+
+
+@receiver(post_delete, sender=Campaign)
+def refresh_client_typeahead_on_campaign_delete(sender, instance, **kwargs):
+    transaction.on_commit(typeahead.invalidate)
+
+
+# === Inventaire du temps d'antenne (SlotInventory) et avancement des campagnes ===
+_TRACKED_SCHEDULE_FIELDS = {'time_slot', 'time_slot_id', 'broadcast_date', 'is_broadcasted', 'spot', 'spot_id'}
+
+
+@receiver(pre_save, sender=SpotSchedule)
+def remember_schedule_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance.__dict__.pop('_previous_state', None)
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not (set(update_fields) & _TRACKED_SCHEDULE_FIELDS):
+        return
+    instance._previous_state = (
+        SpotSchedule.objects.filter(pk=instance.pk)
+        .values_list('time_slot_id', 'broadcast_date', 'is_broadcasted', 'spot__campaign_id', 'spot__duration_seconds')
+        .first()
+    )
+
+
+@receiver(post_save, sender=SpotSchedule)
+def update_counters_on_schedule_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else instance.__dict__.pop('_previous_state', None)
+    if not created and previous is None:
+        return
+    current = progress.state(instance)
+    seconds = current[3]
+    key = (instance.time_slot_id, instance.broadcast_date)
+    if previous is None:
+        inventory.adjust(*key, seconds, 1)
+        progress.apply([(None, current)])
+        return
+    slot_id, day, broadcasted, campaign_id, previous_seconds = previous
+    previous_seconds = previous_seconds or 0
+    # L'ancienne case perd la durée de l'ancien spot (créneau, jour ou spot changé)
+    if (slot_id, day) != key:
+        inventory.adjust(slot_id, day, -previous_seconds, -1)
+        inventory.adjust(*key, seconds, 1)
+    elif previous_seconds != seconds:
+        inventory.adjust(*key, seconds - previous_seconds, 0)
+    progress.apply([((campaign_id, day, broadcasted, previous_seconds), current)])
+
+
+@receiver(pre_delete, sender=SpotSchedule)
+def remember_deleted_schedule_spot(sender, instance, origin=None, **kwargs):
+    # Suppression par QuerySet: campagne et durée lues en une requête pour le lot
+    if not isinstance(origin, QuerySet) or origin.model is not SpotSchedule:
+        return
+    spots = origin.__dict__.get('_schedule_spots')
+    if spots is None:
+        spots = {
+            pk: (campaign_id, seconds)
+            for pk, campaign_id, seconds in origin.values_list('id', 'spot__campaign_id', 'spot__duration_seconds')
+        }
+        origin.__dict__['_schedule_spots'] = spots
+    instance._deleted_spot = spots.get(instance.pk)
+
+
+@receiver(post_delete, sender=SpotSchedule)
+def update_counters_on_schedule_delete(sender, instance, origin=None, **kwargs):
+    # Suppression en cascade d'un spot ou d'une campagne: déjà retirée en bloc
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not SpotSchedule:
+        return
+    spot = instance.__dict__.pop('_deleted_spot', None)
+    if spot is None:
+        spot = (instance.spot.campaign_id, instance.spot.duration_seconds)
+    campaign_id, seconds = spot[0], spot[1] or 0
+    inventory.adjust(instance.time_slot_id, instance.broadcast_date, -seconds, -1)
+    progress.apply([((campaign_id, instance.broadcast_date, bool(instance.is_broadcasted), seconds), None)])
+
+
+@receiver(pre_delete, sender=Spot)
+def release_spot_inventory(sender, instance, origin=None, **kwargs):
+    inventory.remove_spot(instance)
+    # La ligne d'une campagne supprimée part avec elle (voir plus bas)
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is None or origin_model is not Campaign:
+        progress.remove_spot(instance)
+
+
+@receiver(pre_delete, sender=Campaign)
+def release_campaign_progress(sender, instance, **kwargs):
+    progress.remove_campaign(instance)
+
+
+@receiver(pre_delete, sender=TimeSlot)
+def release_time_slot_progress(sender, instance, **kwargs):
+    # Ses programmations partent en cascade (l'inventaire du créneau aussi)
+    progress.remove_time_slot(instance)
+
+
+@receiver(pre_save, sender=Spot)
+def remember_spot_duration(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and 'duration_seconds' not in update_fields:
+        return
+    instance._inventory_duration = (
+        Spot.objects.filter(pk=instance.pk).values_list('duration_seconds', flat=True).first()
+    )
+
+
+@receiver(pre_save, sender=Spot)
+def track_spot_media(sender, instance, raw=False, update_fields=None, using=None, **kwargs):
+    """Nom d'origine du média déposé; libère le blob remplacé ou retiré (après validation)."""
+    if raw:
+        return
+    fields = [f for f in SPOT_MEDIA_FIELDS if update_fields is None or f in update_fields]
+    for field in fields:
+        field_file = getattr(instance, field)
+        if field_file and not field_file._committed and (update_fields is None or 'media_name' in update_fields):
+            instance.media_name = os.path.basename(field_file.name)[:255]
+    if not fields or instance._state.adding:
+        return
+    previous = Spot._default_manager.using(using).filter(pk=instance.pk).values(*fields).first() or {}
+    for field in fields:
+        field_file = getattr(instance, field)
+        old = previous.get(field)
+        # Seuls les blobs comptés sont libérés (fichiers hérités laissés en place)
+        if old and old != field_file.name and hasattr(field_file.storage, 'etag') and field_file.storage.etag(old):
+            transaction.on_commit(lambda storage=field_file.storage, name=old: storage.delete(name))
+
+
+@receiver(post_save, sender=Spot)
+def update_inventory_on_spot_duration(sender, instance, created, raw=False, **kwargs):
+    if raw or created or not hasattr(instance, '_inventory_duration'):
+        return
+    previous = instance.__dict__.pop('_inventory_duration') or 0
+    inventory.change_spot_duration(instance, (instance.duration_seconds or 0) - previous)
+    progress.change_spot_duration(instance, (instance.duration_seconds or 0) - previous)
+
+
+# === Grille tarifaire compilée ===
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+def refresh_pricing_table(sender, **kwargs):
+    transaction.on_commit(pricing.invalidate)
+
+
+# === Compteurs de la rédaction ===
+@receiver(post_save, sender=CoverageRequest)
+@receiver(post_delete, sender=CoverageRequest)
+def refresh_editorial_counts(sender, **kwargs):
+    transaction.on_commit(editorial.invalidate_counts)
+
+
+# === Créneaux des équipes (recommandation) ===
+@receiver(post_save, sender=CoverageRequest)
+@receiver(post_delete, sender=CoverageRequest)
+def refresh_crew_coverage(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: crew.coverage_changed(pk))
+
+
+@receiver(post_save, sender=CoverageAssignment)
+@receiver(post_delete, sender=CoverageAssignment)
+def refresh_crew_assignment(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: crew.assignment_changed(pk))
+
+
+# === Index de recherche SQLite ===
+@receiver(post_migrate)
+def repair_search_indexes(sender, using='default', **kwargs):
+    # Une migration qui reconstruit une table indexée supprime ses triggers FTS5
+    if getattr(sender, 'name', '') == 'spot':
+        from django.db import connections
+
+        search.ensure_search_indexes(connections[using])
@@ -0,0 +1,148 @@
+(() => {
+  // Téléversement reprenable: le formulaire est soumis sans le fichier,
+  // celui-ci étant envoyé au préalable par morceaux (offset + SHA-256).
+  const form = document.querySelector("form[data-chunked-upload]");
+  if (!form || !window.fetch || !window.crypto || !window.crypto.subtle) return;
+
+  const endpoint = form.dataset.chunkedUpload;
+  const campaignId = form.dataset.campaignId || "";
+  const fields = ["video_file", "image_file"];
+  const maxRetries = 8;
+
+  const csrf = () => {
+    const input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+    return input ? input.value : "";
+  };
+
+  const progressEl = document.getElementById("chunkedUploadProgress");
+  const progressBar = progressEl ? progressEl.querySelector('[data-role="bar"]') : null;
+  const progressText = progressEl ? progressEl.querySelector('[data-role="text"]') : null;
+
+  const showProgress = (sent, total, label) => {
+    if (!progressEl) return;
+    progressEl.classList.remove("hidden");
+    const pct = total ? Math.floor((sent / total) * 100) : 0;
+    if (progressBar) progressBar.style.width = pct + "%";
+    if (progressText) progressText.textContent = label || pct + " %";
+  };
+
+  const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+  const toBase64 = (buffer) => {
+    let binary = "";
+    const bytes = new Uint8Array(buffer);
+    for (let i = 0; i < bytes.length; i += 1) binary += String.fromCharCode(bytes[i]);
+    return window.btoa(binary);
+  };
+
+  const storageKey = (file, field) => `bf1-upload:${field}:${file.name}:${file.size}:${file.lastModified}`;
+
+  const openSession = async (file, field) => {
+    const key = storageKey(file, field);
+    const known = window.localStorage.getItem(key);
+    if (known) {
+      const resp = await fetch(`${endpoint}${known}/`, { credentials: "same-origin" });
+      if (resp.ok) {
+        const data = await resp.json();
+        if (data.status === "open" || data.status === "complete") {
+          return { id: known, offset: data.offset || 0, chunkSize: data.chunk_size };
+        }
+      }
+      window.localStorage.removeItem(key);
+    }
+    const resp = await fetch(endpoint, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: { "Content-Type": "application/json", "X-CSRFToken": csrf() },
+      body: JSON.stringify({ filename: file.name, size: file.size, field, campaign_id: campaignId }),
+    });
+    const data = await resp.json();
+    if (!resp.ok || !data.ok) throw new Error(data.error || "upload_create_failed");
+    window.localStorage.setItem(key, data.id);
+    return { id: data.id, offset: data.offset || 0, chunkSize: data.chunk_size };
+  };
+
+  const sendChunks = async (file, session, chunkSize) => {
+    let offset = session.offset || 0;
+    let retries = 0;
+    while (offset < file.size) {
+      const blob = file.slice(offset, offset + chunkSize);
+      const buffer = await blob.arrayBuffer();
+      const digest = await window.crypto.subtle.digest("SHA-256", buffer);
+      let resp;
+      try {
+        resp = await fetch(`${endpoint}${session.id}/`, {
+          method: "PATCH",
+          credentials: "same-origin",
+          headers: {
+            "Content-Type": "application/offset+octet-stream",
+            "Upload-Offset": String(offset),
+            "Upload-Checksum": "sha256 " + toBase64(digest),
+            "X-CSRFToken": csrf(),
+          },
+          body: buffer,
+        });
+      } catch (err) {
+        resp = null;
+      }
+      if (resp && resp.ok) {
+        offset = parseInt(resp.headers.get("Upload-Offset") || String(offset + buffer.byteLength), 10);
+        retries = 0;
+        showProgress(offset, file.size);
+        continue;
+      }
+      if (resp && resp.status === 409 && resp.headers.get("Upload-Offset")) {
+        // Le serveur a déjà reçu une partie: reprendre depuis son offset
+        offset = parseInt(resp.headers.get("Upload-Offset"), 10);
+        continue;
+      }
+      retries += 1;
+      if (retries > maxRetries) throw new Error("upload_failed");
+      showProgress(offset, file.size, "Connexion instable, nouvelle tentative…");
+      await sleep(Math.min(30000, 1000 * 2 ** retries));
+    }
+  };
+
+  // Écoute au niveau du document: les validations propres à la page passent d'abord
+  document.addEventListener("submit", async (event) => {
+    if (event.target !== form || event.defaultPrevented) return;
+    if (form.dataset.chunkedReady === "1") return;
+    const field = fields.find((name) => {
+      const input = form.querySelector(`input[type="file"][name="${name}"]`);
+      return input && input.files && input.files.length && input.offsetParent !== null;
+    }) || fields.find((name) => {
+      const input = form.querySelector(`input[type="file"][name="${name}"]`);
+      return input && input.files && input.files.length;
+    });
+    if (!field) return;
+    const input = form.querySelector(`input[type="file"][name="${field}"]`);
+    const file = input.files[0];
+
+    event.preventDefault();
+    try {
+      const session = await openSession(file, field);
+      await sendChunks(file, session, session.chunkSize || 5 * 1024 * 1024);
+      window.localStorage.removeItem(storageKey(file, field));
+
+      ["upload_id", "upload_field"].forEach((name) => {
+        let hidden = form.querySelector(`input[type="hidden"][name="${name}"]`);
+        if (!hidden) {
+          hidden = document.createElement("input");
+          hidden.type = "hidden";
+          hidden.name = name;
+          form.appendChild(hidden);
+        }
+        hidden.value = name === "upload_id" ? session.id : field;
+      });
+      fields.forEach((name) => {
+        const el = form.querySelector(`input[type="file"][name="${name}"]`);
+        if (el) el.disabled = true;
+      });
+      form.dataset.chunkedReady = "1";
+      showProgress(file.size, file.size, "Fichier reçu, enregistrement…");
+      HTMLFormElement.prototype.submit.call(form);
+    } catch (err) {
+      showProgress(0, file.size, "Échec du téléversement. Réessayez: l'envoi reprendra où il s'est arrêté.");
+    }
+  });
+})();
@@ -0,0 +1,138 @@
+"""
+Stockage des médias adressé par contenu.
+
+Chaque fichier est haché (SHA-256) en flux puis rangé dans une arborescence
+`cas/ab/cd/<empreinte>.<ext>`. Un contenu identique n'est écrit qu'une fois;
+les références sont comptées dans `MediaBlob` et le fichier n'est supprimé
+qu'à la disparition de la dernière référence.
+
+Le contenu est haché pendant sa copie dans un fichier temporaire
+(`cas/tmp/`), puis lié sous son nom définitif: un blob n'est jamais visible
+à moitié écrit, et deux envois simultanés du même contenu aboutissent au
+même nom (le second trouve le blob en place).
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+
+
+BLOB_PREFIX = 'cas'
+HASH_BLOCK = 1024 * 1024
+_BLOB_RE = re.compile(r'^%s/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.[A-Za-z0-9]+)?$' % BLOB_PREFIX)
+
+
+def blob_name(digest, ext=''):
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{(ext or "").lower()}'
+
+
+def digest_from_name(name):
+    """Empreinte contenue dans un nom de blob, sinon None (fichiers hérités)."""
+    m = _BLOB_RE.match((name or '').replace('\\', '/'))
+    return m.group(1) if m else None
+
+
+def hash_content(content):
+    """Hache le contenu en flux; renvoie (empreinte hexadécimale, taille)."""
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(content, 'temporary_file_path'):
+        with open(content.temporary_file_path(), 'rb') as fh:
+            for block in iter(lambda: fh.read(HASH_BLOCK), b''):
+                digest.update(block)
+                size += len(block)
+        return digest.hexdigest(), size
+    for block in content.chunks(HASH_BLOCK):
+        digest.update(block)
+        size += len(block)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest(), size
+
+
+def _blocks(content):
+    if hasattr(content, 'temporary_file_path'):
+        with open(content.temporary_file_path(), 'rb') as fh:
+            yield from iter(lambda: fh.read(HASH_BLOCK), b'')
+        return
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    yield from content.chunks(HASH_BLOCK)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage dédupliqué par empreinte SHA-256."""
+
+    def _save(self, name, content):
+        staging = self.path(f'{BLOB_PREFIX}/tmp')
+        os.makedirs(staging, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=staging)
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as out:
+                for block in _blocks(content):
+                    digest.update(block)
+                    size += len(block)
+                    out.write(block)
+            os.chmod(tmp, self.file_permissions_mode or 0o644)
+            target = blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            path = self.path(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                # Même contenu déjà stocké (éventuellement à l'instant)
+                pass
+            except OSError:
+                # Liens physiques non pris en charge: remplacement atomique
+                os.replace(tmp, path)
+        finally:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+        self.add_reference(digest.hexdigest(), target, size)
+        return target
+
+    def add_reference(self, digest, name, size):
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            MediaBlob.objects.get_or_create(sha256=digest, defaults={'name': name, 'size': size})
+            MediaBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+
+    def delete(self, name):
+        digest = digest_from_name(name)
+        if not digest:
+            return super().delete(name)
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(sha256=digest).first()
+            if blob and blob.ref_count > 1:
+                MediaBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') - 1)
+                return
+            if blob:
+                blob.delete()
+        super().delete(name)
+
+    def etag(self, name):
+        """ETag fort: l'empreinte du contenu, sans lecture du fichier."""
+        digest = digest_from_name(name)
+        return f'"{digest}"' if digest else None
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def spot_media_storage():
+    if getattr(settings, 'SPOT_MEDIA_CONTENT_ADDRESSED', True):
+        return content_addressed_storage
+    return default_storage
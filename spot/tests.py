@@ -1,4 +1,4 @@
-from django.test import TestCase, Client, RequestFactory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -6,11 +6,20 @@ from decimal import Decimal
 import uuid
 
 from .models import Campaign, Spot, TimeSlot, PricingRule
-from .models import SpotSchedule, Notification, CorrespondenceThread
+from .models import SpotSchedule, Notification, CorrespondenceThread, MediaBlob
 from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import date, datetime, timedelta, time
 import urllib.parse
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
 
 User = get_user_model()
 
@@ -478,3 +487,1261 @@ class ReportExportFilterTests(TestCase):
         resp = self.client.get(reverse('report_export'), {'start': '2024-02-01', 'end': '2024-02-28'})
         # Si openpyxl installé => 200, sinon redirection (302)
         self.assertIn(resp.status_code, (200, 302))
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        from .services import uploads
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        media = override_settings(MEDIA_ROOT=os.path.join(self.tmpdir, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+        for p in (
+            patch.object(uploads, 'STAGING_DIR', os.path.join(self.tmpdir, 'staging')),
+            patch.object(uploads, 'CHUNK_SIZE', 4),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.user = User.objects.create_user(username='uploader', password='testpass123', role='client')
+        self.campaign = Campaign.objects.create(
+            client=self.user, title='Camp', description='D',
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('1000'),
+        )
+        self.client.login(username='uploader', password='testpass123')
+
+    def _chunk(self, upload_id, offset, data, checksum=None):
+        digest = checksum or 'sha256 ' + base64.b64encode(hashlib.sha256(data).digest()).decode()
+        return self.client.generic(
+            'PATCH', reverse('upload_detail', args=[upload_id]), data,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=digest,
+        )
+
+    def test_resumable_upload_attaches_to_spot(self):
+        resp = self.client.post(
+            reverse('upload_create'),
+            data=json.dumps({'filename': 'clip.mp4', 'size': 10, 'field': 'video_file', 'campaign_id': str(self.campaign.id)}),
+            content_type='application/json',
+        )
+        self.assertEqual(resp.status_code, 201)
+        upload_id = resp.json()['id']
+
+        self.assertEqual(self._chunk(upload_id, 0, b'0123').status_code, 200)
+        # Offset incorrect: le serveur renvoie l'offset attendu
+        resp = self._chunk(upload_id, 0, b'4567')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp['Upload-Offset'], '4')
+        # Empreinte invalide: morceau rejeté, offset inchangé
+        resp = self._chunk(upload_id, 4, b'4567', checksum='sha256 ' + 'A' * 44)
+        self.assertEqual(resp.status_code, 460)
+        self.assertEqual(self.client.get(reverse('upload_detail', args=[upload_id])).json()['offset'], 4)
+        self.assertEqual(self._chunk(upload_id, 4, b'4567').status_code, 200)
+        resp = self._chunk(upload_id, 8, b'89')
+        self.assertEqual(resp.json()['status'], 'complete')
+
+        # Session ouverte pour une autre campagne: non rattachée ici
+        other = Campaign.objects.create(
+            client=self.user, title='Autre', description='D',
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('1000'),
+        )
+        self.client.post(reverse('spot_upload', args=[other.id]), {
+            'title': 'Spot', 'description': '', 'media_type': 'video', 'duration_seconds': 30,
+            'upload_id': upload_id, 'upload_field': 'video_file',
+        })
+        self.assertFalse(Spot.objects.filter(campaign=other).exists())
+
+        resp = self.client.post(reverse('spot_upload', args=[self.campaign.id]), {
+            'title': 'Spot', 'description': '', 'media_type': 'video', 'duration_seconds': 30,
+            'upload_id': upload_id, 'upload_field': 'video_file',
+        })
+        self.assertEqual(resp.status_code, 302)
+        spot = Spot.objects.get(campaign=self.campaign)
+        with spot.video_file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'0123456789')
+
+    def test_upload_rejects_unsupported_format(self):
+        resp = self.client.post(
+            reverse('upload_create'),
+            data=json.dumps({'filename': 'clip.exe', 'size': 10}),
+            content_type='application/json',
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['error'], 'unsupported_format')
+
+    def test_chunk_without_checksum_is_refused(self):
+        resp = self.client.post(
+            reverse('upload_create'),
+            data=json.dumps({'filename': 'clip.mp4', 'size': 4}),
+            content_type='application/json',
+        )
+        resp = self.client.generic(
+            'PATCH', reverse('upload_detail', args=[resp.json()['id']]), b'0123',
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual((resp.status_code, resp.json()['error']), (400, 'missing_checksum'))
+
+
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        media = override_settings(MEDIA_ROOT=self.tmpdir)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username='dedup', password='testpass123', role='client')
+        self.campaign = Campaign.objects.create(
+            client=self.user, title='Camp', description='D',
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('1000'),
+        )
+
+    def _spot(self, filename):
+        return Spot.objects.create(
+            campaign=self.campaign, title=filename, description='', media_type='video', duration_seconds=30,
+            video_file=SimpleUploadedFile(filename, b'same-bytes', content_type='video/mp4'),
+        )
+
+    def test_identical_content_is_stored_once(self):
+        first = self._spot('a.mp4')
+        second = self._spot('b.mp4')
+        digest = hashlib.sha256(b'same-bytes').hexdigest()
+        self.assertEqual(first.video_file.name, f'cas/{digest[:2]}/{digest[2:4]}/{digest}.mp4')
+        self.assertEqual(first.video_file.name, second.video_file.name)
+        self.assertEqual(MediaBlob.objects.get(sha256=digest).ref_count, 2)
+
+        path = first.video_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.filter(sha256=digest).exists())
+
+    def test_replaced_media_is_released_and_keeps_its_upload_name(self):
+        spot = self._spot('Clip été.mp4')
+        old = spot.video_file.name
+        self.assertEqual(spot.media_name, 'Clip été.mp4')
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'cas', 'tmp')), [])
+
+        spot.video_file = SimpleUploadedFile('Nouveau clip été.mp4', b'other-bytes', content_type='video/mp4')
+        with self.captureOnCommitCallbacks(execute=True):
+            spot.save()
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, old)))
+        self.assertEqual(list(MediaBlob.objects.values_list('ref_count', flat=True)), [1])
+
+        self.client.force_login(User.objects.create_user(username='dl_diff', password='x', role='diffuser'))
+        resp = self.client.get(reverse('diffusion_download_spot', args=[spot.id]))
+        self.assertIn("filename*=utf-8''Nouveau%20clip%20%C3%A9t%C3%A9.mp4", resp['Content-Disposition'])
+        resp.close()
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='testpass123', role='client')
+        start = timezone.now()
+        for i in range(5):
+            campaign = Campaign.objects.create(
+                client=self.user, title=f'C{i}', description='D',
+                start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('100'),
+            )
+            # Deux campagnes partagent la même date: départage par id
+            Campaign.objects.filter(pk=campaign.pk).update(created_at=start - timedelta(minutes=min(i, 3)))
+
+    def test_cursor_walks_forward_and_back_without_gaps(self):
+        from .pagination import KeysetPaginator
+
+        paginator = KeysetPaginator(Campaign.objects.all(), ('-created_at',), per_page=2)
+        expected = list(Campaign.objects.order_by('-created_at', 'pk').values_list('pk', flat=True))
+
+        seen, cursor, pages = [], None, []
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            seen.extend(obj.pk for obj in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([obj.pk for obj in back], expected[2:4])
+        self.assertTrue(back.has_previous())
+        self.assertEqual(paginator.approximate_count, (5, False))
+
+    def test_campaign_list_accepts_cursor(self):
+        self.client.login(username='pager', password='testpass123')
+        resp = self.client.get(reverse('campaign_list'), {'cursor': 'invalide'})
+        self.assertEqual(resp.status_code, 200)
+
+
+class DiffusionSpotsListTests(TestCase):
+    def setUp(self):
+        self.diffuser = User.objects.create_user(username='diff', password='testpass123', role='diffuser')
+        client = User.objects.create_user(username='cli', password='testpass123', role='client')
+        campaign = Campaign.objects.create(
+            client=client, title='Camp', description='D',
+            start_date=date(2024, 1, 1), end_date=date(2024, 12, 31), budget=Decimal('1000'),
+        )
+        slot = TimeSlot.objects.create(name='Matin', start_time=time(8, 0), end_time=time(9, 0))
+        today = timezone.localdate()
+        self.busy = Spot.objects.create(campaign=campaign, title='Busy', media_type='video', duration_seconds=30, status='approved')
+        self.idle = Spot.objects.create(campaign=campaign, title='Idle', media_type='video', duration_seconds=30, status='approved')
+        for offset, minute in ((-1, 0), (2, 10), (1, 20)):
+            SpotSchedule.objects.create(
+                spot=self.busy, time_slot=slot, broadcast_date=today + timedelta(days=offset),
+                broadcast_time=time(8, minute), price=Decimal('0'),
+            )
+        self.client.login(username='diff', password='testpass123')
+
+    def test_next_broadcast_is_annotated_once_per_spot(self):
+        resp = self.client.get(reverse('diffusion_spots'), {'sort': 'next_broadcast_asc'})
+        rows = list(resp.context['page_obj'])
+        self.assertEqual([s.title for s in rows], ['Busy', 'Idle'])
+        self.assertEqual(rows[0].next_broadcast_date, timezone.localdate() + timedelta(days=1))
+        self.assertEqual(rows[0].next_broadcast_time, time(8, 20))
+        self.assertIsNone(rows[1].next_broadcast_date)
+
+    def test_date_filter_uses_schedule_window(self):
+        resp = self.client.get(reverse('diffusion_spots'), {'date': 'tomorrow'})
+        rows = list(resp.context['page_obj'])
+        self.assertEqual([s.title for s in rows], ['Busy'])
+
+
+class SearchServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='annonceur', password='testpass123', role='client')
+        self.match = Campaign.objects.create(
+            client=self.user, title='Lancement Télévision', description='Campagne nationale de rentrée',
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('100'),
+        )
+        Campaign.objects.create(
+            client=self.user, title='Radio', description='Autre sujet',
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('100'),
+        )
+
+    def test_prefix_terms_must_all_match(self):
+        from .services import search
+
+        found = Campaign.objects.filter(search.text_match('campaign', 'lance rentr'))
+        self.assertEqual(list(found), [self.match])
+        self.assertFalse(Campaign.objects.filter(search.text_match('campaign', 'lance radio')).exists())
+
+    def test_index_follows_updates(self):
+        from .services import search
+
+        Campaign.objects.filter(pk=self.match.pk).update(title='Affichage urbain')
+        self.assertFalse(Campaign.objects.filter(search.text_match('campaign', 'lancement')).exists())
+        self.client.login(username='annonceur', password='testpass123')
+        resp = self.client.get(reverse('campaign_list'), {'search': 'urbain'})
+        self.assertEqual([c.pk for c in resp.context['campaigns']], [self.match.pk])
+
+    def test_missing_triggers_are_rebuilt(self):
+        from django.db import connection
+        from .services import search
+
+        # État laissé par une reconstruction de table sous SQLite
+        with connection.cursor() as cursor:
+            for suffix in search.TRIGGER_SUFFIXES:
+                cursor.execute(f'DROP TRIGGER spot_campaign_fts{suffix}')
+        self.assertEqual(search.ensure_search_indexes(), ['campaign'])
+        Campaign.objects.filter(pk=self.match.pk).update(title='Affichage urbain')
+        found = Campaign.objects.filter(search.text_match('campaign', 'affich'))
+        self.assertEqual(list(found), [self.match])
+        self.assertEqual(search.ensure_search_indexes(), [])
+
+
+class ClientTypeaheadTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.diffuser = User.objects.create_user(username='diffta', password='testpass123', role='diffuser')
+        for username, company, count in (('kabore', 'Orange Faso', 2), ('kaboret', '', 1), ('ouedraogo', 'Kaba SA', 1)):
+            user = User.objects.create_user(username=username, password='x', role='client', company=company)
+            for i in range(count):
+                Campaign.objects.create(
+                    client=user, title=f'C{i}', description='D',
+                    start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('100'),
+                )
+        self.client.login(username='diffta', password='testpass123')
+
+    def test_ranked_deduplicated_results_with_etag(self):
+        url = reverse('diffusion_clients_search_api')
+        resp = self.client.get(url, {'q': 'Kab'})
+        self.assertEqual([r['username'] for r in resp.json()['results']], ['kabore', 'kaboret', 'ouedraogo'])
+        resp = self.client.get(url, {'q': 'kab'}, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_new_client_invalidates_index(self):
+        url = reverse('diffusion_clients_search_api')
+        self.assertEqual(self.client.get(url, {'q': 'zon'}).json()['results'], [])
+        user = User.objects.create_user(username='zongo', password='x', role='client')
+        with self.captureOnCommitCallbacks(execute=True):
+            Campaign.objects.create(
+                client=user, title='Z', description='D',
+                start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), budget=Decimal('100'),
+            )
+        self.assertEqual([r['username'] for r in self.client.get(url, {'q': 'zon'}).json()['results']], ['zongo'])
+
+
+class PlanningEventsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        client = User.objects.create_user(username='plan', password='x', role='client')
+        campaign = Campaign.objects.create(
+            client=client, title='Camp', description='D',
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 31), budget=Decimal('100'),
+        )
+        self.spot = Spot.objects.create(campaign=campaign, title='S', media_type='video', duration_seconds=30, status='scheduled')
+        self.slot = TimeSlot.objects.create(name='Soir', start_time=time(19, 0), end_time=time(20, 0))
+        self.day = date(2030, 1, 10)
+
+    def test_snapshot_is_shared_and_invalidated_by_events(self):
+        from .services import planning
+
+        sched = SpotSchedule.objects.create(
+            spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'),
+        )
+        seq, items = planning.snapshot([self.day])
+        self.assertEqual((seq, [i['id'] for i in items]), (0, [str(sched.id)]))
+        with self.assertNumQueries(0):
+            planning.snapshot([self.day])
+
+        other_day = date(2030, 1, 11)
+        previous = sched.broadcast_date
+        sched.broadcast_date = other_day
+        sched.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            event = planning.record(sched, previous_date=previous)
+
+        seq, items = planning.snapshot([self.day])
+        self.assertEqual((seq, items), (event.seq, []))
+        events = planning.events_since(0, [self.day])
+        self.assertEqual([(e['seq'], e['item']['date_iso']) for e in events], [(event.seq, '2030-01-11')])
+        self.assertEqual(planning.events_since(event.seq, [self.day, other_day]), [])
+
+    def test_outbox_is_relayed_once_in_batches_per_day(self):
+        from django.db import transaction
+        from .models import PlanningEvent
+        from .services import planning
+
+        other_day = date(2030, 1, 11)
+        with transaction.atomic():
+            first = SpotSchedule.objects.create(
+                spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'),
+            )
+            second = SpotSchedule.objects.create(
+                spot=self.spot, time_slot=self.slot, broadcast_date=other_day, broadcast_time=time(19, 5), price=Decimal('0'),
+            )
+            planning.record_many([first, second])
+        # Un retour arrière n'émet rien
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            planning.record(first, 'remove')
+            raise RuntimeError
+        # ... et rend son numéro: les numéros validés se suivent sans trou
+        last = planning.record(second)
+        self.assertEqual(list(PlanningEvent.objects.values_list('seq', flat=True)), [last.seq - 2, last.seq - 1, last.seq])
+
+        # Couche indisponible: le lot reste en attente, repris au passage suivant
+        with patch.object(planning, 'publish', side_effect=ConnectionError), self.assertRaises(ConnectionError):
+            planning.relay()
+        self.assertEqual(PlanningEvent.objects.filter(published_at__isnull=True).count(), 3)
+        with patch.object(planning, 'publish') as publish:
+            self.assertEqual(planning.relay(), 3)
+            self.assertEqual(planning.relay(), 0)
+        by_day = publish.call_args.args[0]
+        self.assertEqual(sorted(by_day), [self.day, other_day])
+        self.assertEqual([e['item']['id'] for e in by_day[self.day]], [str(first.id)])
+        self.assertEqual([e['item']['id'] for e in by_day[other_day]], [str(second.id)] * 2)
+        self.assertFalse(PlanningEvent.objects.filter(published_at__isnull=True).exists())
+
+    def test_broadcast_time_confirmation_is_all_or_nothing(self):
+        from .services import planning
+
+        sched = SpotSchedule.objects.create(
+            spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'),
+        )
+        Spot.objects.filter(id=self.spot.id).update(status='approved')
+        self.client.force_login(User.objects.create_user(username='plan_diff', password='x', role='diffuser'))
+        url = reverse('diffusion_notify_broadcast_time', args=[self.spot.id])
+        with patch.object(planning, 'record', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.post(url, {'broadcast_date': '2030-01-11', 'broadcast_time': '19:05'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        sched.refresh_from_db()
+        self.assertEqual(sched.broadcast_date, self.day)
+        self.assertEqual(Spot.objects.get(id=self.spot.id).status, 'approved')
+
+
+class RecurrenceSchedulingTests(TestCase):
+    def setUp(self):
+        client = User.objects.create_user(username='rec', password='x', role='client')
+        campaign = Campaign.objects.create(
+            client=client, title='Camp', description='D',
+            start_date=date(2030, 1, 1), end_date=date(2030, 3, 31), budget=Decimal('100'),
+        )
+        self.spot = Spot.objects.create(campaign=campaign, title='S', media_type='video', duration_seconds=30, status='approved')
+        self.slot = TimeSlot.objects.create(name='Journée', start_time=time(6, 0), end_time=time(23, 0))
+        self.diffuser = User.objects.create_user(username='rec_d', password='x', role='diffuser')
+
+    def test_expand_weekdays_exclusions_and_count(self):
+        from .services import recurrence
+
+        options = recurrence.parse_rrule('FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5')
+        excluded_days, excluded_slots = recurrence.parse_exclusions('2030-01-09,2030-01-14T20:00')
+        occurrences = recurrence.expand(
+            date(2030, 1, 7), [time(8, 0), time(20, 0)],
+            excluded_days=excluded_days, excluded_slots=excluded_slots, **options,
+        )
+        self.assertEqual(occurrences, [
+            (date(2030, 1, 7), time(8, 0)), (date(2030, 1, 7), time(20, 0)),
+            (date(2030, 1, 14), time(8, 0)),
+            (date(2030, 1, 16), time(8, 0)), (date(2030, 1, 16), time(20, 0)),
+        ])
+
+    def test_dry_run_reports_conflicts_then_bulk_insert(self):
+        other = Spot.objects.create(campaign=self.spot.campaign, title='Autre', media_type='video', duration_seconds=30, status='scheduled')
+        SpotSchedule.objects.create(
+            spot=other, time_slot=self.slot, broadcast_date=date(2030, 1, 8), broadcast_time=time(19, 0), price=Decimal('0'),
+        )
+        self.client.force_login(self.diffuser)
+        url = reverse('diffusion_bulk_schedule_spot', args=[self.spot.id])
+        data = {
+            'start_date': '2030-01-07', 'end_date': '2030-01-13', 'days': 'mon,tue,wed',
+            'broadcast_times': '08:00,19:00', 'time_slot_id': str(self.slot.id),
+        }
+        preview = self.client.post(url, {**data, 'dry_run': '1'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertEqual((len(preview['to_create']), preview['occurrences']), (5, 6))
+        self.assertEqual([(c['date'], c['conflict_with']) for c in preview['conflicts']], [('2030-01-08', 'Autre')])
+        self.assertFalse(SpotSchedule.objects.filter(spot=self.spot).exists())
+
+        result = self.client.post(url, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertEqual((result['created'], result['conflicts']), (5, 1))
+        self.assertEqual(SpotSchedule.objects.filter(spot=self.spot).count(), 5)
+        self.spot.refresh_from_db()
+        self.assertEqual(self.spot.status, 'scheduled')
+
+    def test_apply_reports_only_its_rows_and_preview_writes_nothing(self):
+        from .services import recurrence
+
+        occurrences = [(date(2030, 1, 7), time(8, 0)), (date(2030, 1, 8), time(8, 0))]
+        candidates, _ = recurrence.plan(self.spot, occurrences, lambda t: self.slot)
+        # Même spot, même clé, inséré entre l'aperçu et l'écriture
+        SpotSchedule.objects.create(
+            spot=self.spot, time_slot=self.slot, broadcast_date=date(2030, 1, 7), broadcast_time=time(8, 0), price=Decimal('0'),
+        )
+        created = recurrence.apply(self.spot, candidates)
+        self.assertEqual([s.broadcast_date for s in created], [date(2030, 1, 8)])
+
+        TimeSlot.objects.all().delete()
+        self.client.force_login(self.diffuser)
+        preview = self.client.post(reverse('diffusion_bulk_schedule_spot', args=[self.spot.id]), {
+            'start_date': '2030-02-04', 'broadcast_time': '10:00', 'dry_run': '1',
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertEqual(len(preview['to_create']), 1)
+        self.assertFalse(TimeSlot.objects.exists())
+
+
+class SlotInventoryTests(TestCase):
+    def setUp(self):
+        client = User.objects.create_user(username='inv', password='x', role='client')
+        self.campaign = Campaign.objects.create(
+            client=client, title='Camp', description='D',
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 31), budget=Decimal('100'),
+        )
+        self.spot = Spot.objects.create(campaign=self.campaign, title='S', media_type='video', duration_seconds=30, status='scheduled')
+        self.slot = TimeSlot.objects.create(name='Soir', start_time=time(19, 0), end_time=time(21, 0), ad_capacity_seconds=60)
+        self.day = date(2030, 1, 10)
+
+    def _inventory(self):
+        from .models import SlotInventory
+
+        return {
+            (row.time_slot_id, row.broadcast_date): (row.booked_seconds, row.spot_count)
+            for row in SlotInventory.objects.exclude(spot_count=0)
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        from .services import inventory
+
+        first = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'))
+        second = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 30), price=Decimal('0'))
+        self.assertEqual(inventory.remaining(self.slot, self.day), 0)
+        self.assertFalse(inventory.fits(self.slot, self.day, 5))
+        # En transaction, la ligne d'un jour vide est créée pour être verrouillée
+        self.assertTrue(inventory.fits(self.slot, date(2030, 1, 12), 60))
+        self.assertTrue(self.slot.inventory.filter(broadcast_date=date(2030, 1, 12), booked_seconds=0).exists())
+
+        second.broadcast_date = date(2030, 1, 11)
+        second.save()
+        self.spot.duration_seconds = 45
+        self.spot.save()
+        first.delete()
+        self.assertEqual(self._inventory(), {(self.slot.id, date(2030, 1, 11)): (45, 1)})
+
+        inventory.rebuild()
+        self.assertEqual(self._inventory(), {(self.slot.id, date(2030, 1, 11)): (45, 1)})
+        self.spot.delete()
+        self.assertEqual(self._inventory(), {})
+
+    def test_moving_a_schedule_to_another_spot_and_bulk_delete(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        longer = Spot.objects.create(campaign=self.campaign, title='L', media_type='video', duration_seconds=45, status='scheduled')
+        sched = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'))
+        sched.spot = longer
+        sched.save()
+        self.assertEqual(self._inventory(), {(self.slot.id, self.day): (45, 1)})
+        sched.spot = self.spot
+        sched.broadcast_date = date(2030, 1, 11)
+        sched.save()
+        self.assertEqual(self._inventory(), {(self.slot.id, date(2030, 1, 11)): (30, 1)})
+
+        SpotSchedule.objects.create(spot=longer, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'))
+        # Durées lues une fois pour tout le lot, pas une requête par ligne
+        with CaptureQueriesContext(connection) as ctx:
+            SpotSchedule.objects.filter(time_slot=self.slot).delete()
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "spot_spot"' in q['sql'] and 'JOIN' not in q['sql']])
+        self.assertEqual(self._inventory(), {})
+
+    def test_bulk_insert_rechecks_capacity_under_lock(self):
+        from .services import recurrence
+
+        occurrences = [(self.day, time(19, 10)), (self.day, time(19, 20))]
+        candidates, conflicts = recurrence.plan(self.spot, occurrences, lambda t: self.slot)
+        self.assertEqual((len(candidates), conflicts), (2, []))
+        # Réservation concurrente validée entre l'aperçu et l'insertion
+        other = Spot.objects.create(campaign=self.campaign, title='O', media_type='video', duration_seconds=30, status='scheduled')
+        SpotSchedule.objects.create(spot=other, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'))
+        admitted, full = recurrence.admit(self.spot, candidates)
+        self.assertEqual([c.broadcast_time for c in admitted], [time(19, 10)])
+        self.assertEqual([(c['time'], c['reason']) for c in full], [('19:20', 'slot_full')])
+
+    def test_availability_api(self):
+        SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=self.day, broadcast_time=time(19, 5), price=Decimal('0'))
+        diffuser = User.objects.create_user(username='inv_d', password='x', role='diffuser')
+        self.client.force_login(diffuser)
+        rows = self.client.get(reverse('diffusion_slot_availability_api'), {
+            'start': '2030-01-10', 'end': '2030-01-11', 'seconds': '45',
+        }).json()['availability']
+        self.assertEqual(
+            [(r['date'], r['remaining_seconds'], r['fits']) for r in rows],
+            [('2030-01-10', 30, False), ('2030-01-11', 60, True)],
+        )
+
+
+class PricingEngineTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        PricingRule.objects.create(name='Court', base_price=Decimal('900'), duration_min=5, duration_max=30)
+        PricingRule.objects.create(name='Large', base_price=Decimal('800'), duration_min=20, duration_max=60)
+        self.slot = TimeSlot.objects.create(name='Prime', start_time=time(19, 0), end_time=time(21, 0), price_multiplier=Decimal('1.50'))
+
+    def test_compiled_table_lookup_and_invalidation(self):
+        from .services import pricing
+
+        self.assertEqual(
+            [(r['duration_min'], r['duration_max']) for r in pricing.rules_for_display()],
+            [(5, 30), (31, 60)],
+        )
+        self.assertEqual(pricing.base_price(25), Decimal('900'))
+        self.assertEqual(pricing.base_price(45), Decimal('800'))
+        self.assertEqual(pricing.base_price(90), pricing.DEFAULT_BASE_PRICE)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slot.price_multiplier = Decimal('2.00')
+            self.slot.save()
+        quotes = pricing.quote_many([(30, self.slot.id, 2), (45, self.slot.id, 1)])
+        self.assertEqual([q['subtotal'] for q in quotes], [Decimal('108000'), Decimal('72000')])
+        self.assertEqual(quotes[0]['total'], Decimal('127440'))
+
+        from .utils import calculate_campaign_cost
+
+        cost = calculate_campaign_cost(30, Decimal('2.00'), 2)
+        self.assertEqual(cost['total_price'], quotes[0]['subtotal'])
+        self.assertEqual(cost['final_price'], quotes[0]['total'])
+
+    def test_quote_api_and_schedule_prices(self):
+        client = User.objects.create_user(username='price', password='x', role='client')
+        self.client.force_login(client)
+        response = self.client.post(
+            reverse('pricing_quote_api'),
+            json.dumps({'scenarios': [{'duration': 30, 'time_slot': self.slot.id, 'broadcast_count': 2}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['quotes'][0]['total'], '95580.00')
+        response = self.client.post(
+            reverse('pricing_quote_api'),
+            json.dumps({'scenarios': [{'duration': 30, 'time_slot': self.slot.id + 99}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['time_slots'], [self.slot.id + 99])
+
+        campaign = Campaign.objects.create(
+            client=client, title='Camp', description='D',
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 31), budget=Decimal('100'),
+        )
+        spot = Spot.objects.create(campaign=campaign, title='S', media_type='video', duration_seconds=30, status='approved')
+        diffuser = User.objects.create_user(username='price_d', password='x', role='diffuser')
+        self.client.force_login(diffuser)
+        self.client.post(reverse('diffusion_bulk_schedule_spot', args=[spot.id]), {
+            'start_date': '2030-01-07', 'count': '2', 'broadcast_time': '19:30', 'time_slot_id': str(self.slot.id),
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(set(spot.schedules.values_list('price', flat=True)), {Decimal('40500.00')})
+
+
+class SlotAllocationTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='alloc', password='x', role='client')
+        self.slot = TimeSlot.objects.create(name='Soir', start_time=time(19, 0), end_time=time(21, 0))
+
+    def _campaign(self, title, days=1, duration=30):
+        campaign = Campaign.objects.create(
+            client=self.client_user, title=title, description='D', status='pending',
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, days), budget=Decimal('100'),
+        )
+        campaign.preferred_time_slots.add(self.slot)
+        Spot.objects.create(campaign=campaign, title=f'S {title}', media_type='video', duration_seconds=duration, status='approved', approved_at=timezone.now())
+        return campaign
+
+    def test_approvals_are_packed_without_collision(self):
+        for title in ('A', 'B'):
+            campaign = self._campaign(title)
+            campaign.status = 'approved'
+            with self.captureOnCommitCallbacks(execute=True):
+                campaign.save()
+        self.assertEqual(
+            sorted(SpotSchedule.objects.values_list('broadcast_time', flat=True)),
+            [time(19, 0), time(19, 0, 30)],
+        )
+
+    def test_batch_shares_scarce_capacity(self):
+        from .services import allocation
+
+        self.slot.ad_capacity_seconds = 60
+        self.slot.save()
+        campaigns = [self._campaign(title, days=2) for title in ('A', 'B', 'C')]
+        Campaign.objects.update(status='approved')
+        created, refused = allocation.schedule(allocation.load_campaigns(Campaign.objects.all()))
+        self.assertEqual(len(created), 4)
+        self.assertEqual(allocation.describe_refusals(refused), '2 capacité du créneau atteinte')
+        served = {c.spot.campaign_id for c in created}
+        self.assertEqual(served, {c.id for c in campaigns})
+
+
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='mod_admin', password='x', role='admin')
+        self.owner = User.objects.create_user(username='mod_client', password='x', role='client')
+        User.objects.create_user(username='mod_diff', password='x', role='diffuser')
+        self.slot = TimeSlot.objects.create(name='Midi', start_time=time(12, 0), end_time=time(13, 0))
+
+    def test_campaign_batch_approval(self):
+        from .models import CampaignHistory
+        from .services import moderation
+
+        for n in range(3):
+            campaign = Campaign.objects.create(
+                client=self.owner, title=f'C{n}', description='D', status='pending',
+                start_date=date(2030, 2, 1), end_date=date(2030, 2, 2), budget=Decimal('100'),
+            )
+            campaign.preferred_time_slots.add(self.slot)
+            Spot.objects.create(campaign=campaign, title=f'S{n}', media_type='video', duration_seconds=20, status='approved')
+        Campaign.objects.filter(title='C2').update(status='draft')
+
+        approved, created, refused = moderation.approve_campaigns(Campaign.objects.all(), self.admin)
+        self.assertEqual(sorted(c.title for c in approved), ['C0', 'C1'])
+        self.assertEqual(len(created), 4)
+        self.assertEqual(CampaignHistory.objects.filter(action='approved').count(), 2)
+        self.assertEqual(Notification.objects.filter(title='Campagne approuvée').count(), 2)
+        # Déjà approuvées: rien à reprendre
+        self.assertEqual(moderation.approve_campaigns(Campaign.objects.all(), self.admin), ([], [], []))
+
+    def test_spot_batch_approval_and_rejection(self):
+        from .services import moderation
+
+        campaign = Campaign.objects.create(
+            client=self.owner, title='C', description='D',
+            start_date=date(2030, 2, 1), end_date=date(2030, 2, 2), budget=Decimal('100'),
+        )
+        spots = [Spot.objects.create(campaign=campaign, title=f'S{n}', status='pending_review') for n in range(3)]
+        self.assertEqual(moderation.approve_spots(Spot.objects.filter(id__in=[s.id for s in spots[:2]]), self.admin), 2)
+        self.assertEqual(moderation.reject_spots(Spot.objects.all(), self.admin, 'Flou'), 1)
+        self.assertEqual(Notification.objects.filter(title='Spot approuvé').count(), 1)
+        self.assertEqual(Notification.objects.filter(title='Spot approuvé (Diffusion)').count(), 2)
+        self.assertEqual(Spot.objects.get(id=spots[2].id).rejection_reason, 'Flou')
+
+
+class CampaignProgressTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='prog', password='x', role='client')
+        self.campaign = Campaign.objects.create(
+            client=owner, title='Camp', description='D',
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 31), budget=Decimal('100'),
+        )
+        self.spot = Spot.objects.create(campaign=self.campaign, title='S', media_type='video', duration_seconds=30, status='scheduled')
+        self.slot = TimeSlot.objects.create(name='Soir', start_time=time(19, 0), end_time=time(21, 0))
+
+    def _rows(self):
+        from .models import CampaignProgress
+
+        # Lignes du global (`all`, `all:n`) additionnées sous `all`
+        rows = {}
+        for p in CampaignProgress.objects.all():
+            scope = 'all' if p.scope.startswith('all') else p.scope
+            values = (p.scheduled_count, p.broadcast_count, p.late_count, p.booked_seconds)
+            rows[scope] = tuple(map(sum, zip(rows.get(scope, (0, 0, 0, 0)), values)))
+        return rows
+
+    def test_incremental_counters_match_reconcile(self):
+        from .services import progress
+
+        past = timezone.localdate() - timedelta(days=2)
+        late = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=past, broadcast_time=time(19, 0), price=Decimal('0'))
+        future = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=date(2030, 1, 5), broadcast_time=time(20, 0), price=Decimal('0'))
+        other = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=date(2030, 1, 6), broadcast_time=time(19, 0), price=Decimal('0'))
+        self.assertEqual(progress.for_campaign(self.campaign)['late'], 1)
+
+        late.is_broadcasted = True
+        late.save(update_fields=['is_broadcasted'])
+        future.broadcast_date = past
+        future.save()
+        other.delete()
+        self.spot.duration_seconds = 45
+        self.spot.save()
+        scope = str(self.campaign.id)
+        expected = {scope: (1, 1, 1, 90), 'all': (1, 1, 1, 90)}
+        self.assertEqual(self._rows(), expected)
+        self.assertEqual(progress.reconcile(), 0)
+        self.assertEqual(progress.totals()['scheduled'], 1)
+
+        # Créneau supprimé: ses programmations partent en cascade
+        self.slot.delete()
+        self.assertEqual(self._rows(), {scope: (0, 0, 0, 0), 'all': (0, 0, 0, 0)})
+        self.campaign.delete()
+        self.assertEqual(self._rows(), {'all': (0, 0, 0, 0)})
+
+    def test_lateness_removed_is_the_one_counted(self):
+        from django.core.cache import cache
+        from .services import progress
+
+        cache.delete(progress.RECONCILED_KEY)
+        self.addCleanup(cache.delete, progress.RECONCILED_KEY)
+        today = timezone.localdate()
+        day = today - timedelta(days=5)
+        # Programmée la veille de sa date, recalculée ce jour-là: pas en retard
+        with patch.object(progress.timezone, 'localdate', return_value=day - timedelta(days=1)), \
+                self.captureOnCommitCallbacks(execute=True):
+            sched = SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=day, broadcast_time=time(19, 0), price=Decimal('0'))
+            progress.reconcile()
+        SpotSchedule.objects.create(spot=self.spot, time_slot=self.slot, broadcast_date=day - timedelta(days=5), broadcast_time=time(19, 0), price=Decimal('0'))
+        sched.is_broadcasted = True
+        sched.save(update_fields=['is_broadcasted'])
+        scope = str(self.campaign.id)
+        self.assertEqual(self._rows(), {scope: (1, 1, 1, 60), 'all': (1, 1, 1, 60)})
+        self.assertEqual(progress.reconcile(), 0)
+
+
+class CorrespondenceInboxTests(TestCase):
+    def setUp(self):
+        from .models import CorrespondenceMessage
+
+        self.owner = User.objects.create_user(username='corr', password='x', role='client')
+        self.thread = CorrespondenceThread.objects.create(client=self.owner, subject='Facture')
+        base = timezone.now()
+        self.messages = []
+        for n in range(3):
+            msg = CorrespondenceMessage.objects.create(thread=self.thread, author=self.owner, content=f'Message   {n}')
+            CorrespondenceMessage.objects.filter(pk=msg.pk).update(created_at=base + timedelta(minutes=n))
+            self.messages.append(msg)
+
+    def test_thread_carries_last_message(self):
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.last_message_id, self.messages[-1].id)
+        self.assertEqual(self.thread.last_message_preview, 'Message 2')
+        self.assertEqual(self.thread.message_count, 3)
+
+        self.messages[-1].delete()
+        self.thread.refresh_from_db()
+        self.assertEqual((self.thread.last_message_id, self.thread.message_count), (self.messages[1].id, 2))
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('correspondence_list'))
+        self.assertContains(response, 'Message 1')
+
+    def test_message_windows(self):
+        from .services import correspondence
+
+        window, older = correspondence.message_window(self.thread, size=2)
+        self.assertEqual([m.content for m in window], ['Message   1', 'Message   2'])
+        window, older = correspondence.message_window(self.thread, older, size=2)
+        self.assertEqual(([m.content for m in window], older), (['Message   0'], None))
+
+    def test_post_message_notifies_and_publishes_after_commit(self):
+        from .models import Notification
+        from .services import correspondence
+
+        admin = User.objects.create_user(username='corr-admin', password='x', role='admin')
+        self.thread.refresh_from_db()
+        self.assertIsNotNone(correspondence.next_reply_at(self.thread, self.owner))
+        with patch.object(correspondence, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                message = correspondence.post_message(self.thread, admin, 'Réponse')
+        self.thread.refresh_from_db()
+        self.assertEqual((self.thread.status, self.thread.last_message_id), ('open', message.id))
+        self.assertIsNone(correspondence.next_reply_at(self.thread, self.owner))
+        thread_id, event = publish.call_args.args
+        self.assertEqual((thread_id, event['type'], event['message']['content']), (self.thread.id, 'correspondence_message', 'Réponse'))
+        self.assertEqual(correspondence.mark_read(self.thread, self.owner), 1)
+        self.assertFalse(Notification.objects.filter(user=self.owner, is_read=False).exists())
+
+
+class EditorialDataTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Journalist
+
+        cache.clear()
+        self.manager = User.objects.create_user(username='redac', password='x', role='editorial_manager')
+        self.journalist = Journalist.objects.create(name='Awa')
+        self.day = timezone.localdate()
+
+    def _coverage(self, n, assigned=True):
+        from .models import AssignmentLog, CoverageAssignment, CoverageRequest
+
+        cv = CoverageRequest.objects.create(
+            event_title=f'Événement {n}', event_type='press_conference', event_date=self.day, start_time=time(9, n),
+            address='Ouaga', contact_name='C', contact_phone='1', coverage_type='video_report', status='review',
+        )
+        if assigned:
+            ass = CoverageAssignment.objects.create(coverage=cv, journalist=self.journalist)
+            AssignmentLog.objects.create(assignment=ass, label='Notifié')
+        return cv
+
+    def test_planning_queries_do_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.manager)
+        self._coverage(1)
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(reverse('editorial_planning'), {'view': 'day'})
+        self.assertContains(response, 'Awa')
+        for n in range(2, 6):
+            self._coverage(n)
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(reverse('editorial_planning'), {'view': 'day'})
+        self.assertEqual(len(more), len(first))
+
+        cv = self._coverage(9)
+        self.assertContains(self.client.get(reverse('editorial_coverage_detail', args=[cv.id])), 'Journaliste: Awa')
+        self.assertEqual(self.client.get(reverse('editorial_coverages')).status_code, 200)
+
+    def test_unassigned_and_cached_counts(self):
+        from .models import CoverageRequest
+        from .services import editorial
+
+        self._coverage(1)
+        free = self._coverage(2, assigned=False)
+        self.assertEqual(list(editorial.unassigned(CoverageRequest.objects.all())), [free])
+        self.assertEqual(editorial.status_counts(), {'review': 2})
+        with self.assertNumQueries(0):
+            editorial.status_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            free.status = 'closed'
+            free.save()
+        self.assertEqual(editorial.status_counts(), {'review': 1, 'closed': 1})
+
+    def test_assign_crew_in_one_transaction(self):
+        from .models import AssignmentNotificationCampaign, CoverageAssignment, Driver, Journalist
+
+        cv = self._coverage(1, assigned=False)
+        other = Journalist.objects.create(name='Binta', email='binta@example.com', workload_score=2)
+        driver = Driver.objects.create(name='Issa', phone='70000000')
+        self.client.force_login(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('editorial_assign_coverage', args=[cv.id]),
+                {'journalist_ids': [self.journalist.id, other.id, 'inconnu'], 'driver_ids': [driver.id]},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CoverageAssignment.objects.filter(coverage=cv).count(), 3)
+        other.refresh_from_db()
+        self.assertEqual((other.status, other.workload_score), ('on_mission', 3))
+        self.assertEqual(AssignmentNotificationCampaign.objects.filter(assignment__coverage=cv).count(), 3)
+        self.assertTrue(Notification.objects.filter(user=self.manager, related_coverage=cv).exists())
+
+    def test_reminders_are_claimed_once_and_sent_in_batch(self):
+        from .models import AssignmentNotificationAttempt, AssignmentNotificationCampaign, CoverageAssignment
+        from .services import reminders
+
+        cv = self._coverage(1, assigned=False)
+        assignment = CoverageAssignment.objects.create(coverage=cv, journalist=self.journalist)
+        past = timezone.now() - timedelta(minutes=1)
+        for n in range(3):
+            AssignmentNotificationCampaign.objects.create(
+                assignment=assignment, recipient_kind='journalist', to_phone=f'+22670{n:06d}',
+                confirm_code='123456', next_attempt_at=past,
+            )
+        owner, claimed = reminders.claim(limit=2)
+        self.assertEqual(len(claimed), 2)
+        # Un second processus ne reprend que la campagne restante
+        other, rest = reminders.claim()
+        self.assertEqual(len(rest), 1)
+        self.assertFalse({c.id for c in claimed} & {c.id for c in rest})
+
+        with patch('spot.utils.send_sms', return_value=(True, 'm1', '')) as send_sms:
+            self.assertEqual(reminders.process(claimed, owner, workers=2), 2)
+        self.assertEqual(send_sms.call_count, 2)
+        self.assertEqual(AssignmentNotificationAttempt.objects.filter(status='sent').count(), 2)
+        first = AssignmentNotificationCampaign.objects.get(id=claimed[0].id)
+        self.assertEqual((first.reminder_count, first.lease_owner), (1, ''))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+
+    def test_confirmation_during_sending_is_kept(self):
+        from .models import AssignmentNotificationCampaign, CoverageAssignment
+        from .services import reminders
+        from .utils import confirm_assignment_notification_campaign
+
+        cv = self._coverage(1, assigned=False)
+        assignment = CoverageAssignment.objects.create(coverage=cv, journalist=self.journalist)
+        campaign = AssignmentNotificationCampaign.objects.create(
+            assignment=assignment, recipient_kind='journalist', to_phone='+22670000000',
+            confirm_code='123456', next_attempt_at=timezone.now() - timedelta(minutes=1),
+        )
+        owner, claimed = reminders.claim()
+        # Confirmation reçue pendant que le lot réservé est en cours d'envoi
+        confirm_assignment_notification_campaign(AssignmentNotificationCampaign.objects.get(id=campaign.id), 'sms')
+        with patch('spot.utils.send_sms', return_value=(True, 'm1', '')):
+            reminders.process(claimed, owner, workers=1)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.next_attempt_at, campaign.lease_owner), ('confirmed', None, ''))
+
+
+class GatewayClientTests(TestCase):
+    def test_streamed_json_body_matches_encoded_payload(self):
+        import io
+        from .services import gateway
+
+        pdf = os.urandom(100_001)
+        body = gateway.json_body({'to': '+226', 'message': 'M'}, [('fiche.pdf', io.BytesIO(pdf), 'application/pdf')])
+        data = b''.join(body.factory())
+        self.assertEqual(len(data), body.length)
+        parsed = json.loads(data)
+        self.assertEqual(base64.b64decode(parsed['attachments'][0]['content_base64']), pdf)
+        self.assertEqual(b''.join(body.factory()), data)
+
+    def test_keep_alive_pool_and_circuit_breaker(self):
+        from .services import gateway
+        from .services.gateway_stub import StubGateway
+
+        stub = StubGateway().start()
+        self.addCleanup(stub.stop)
+        client = gateway.GatewayClient(stub.url + 'sms', max_connections=2)
+        self.addCleanup(client.close)
+        for _ in range(3):
+            self.assertTrue(gateway.message_id(client.post_json({'to': '1', 'message': 'x'})))
+        self.assertEqual((stub.received, client.pool.idle.qsize()), (3, 1))
+
+        stub.failure_rate = 1.0
+        breaker = gateway.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        failing = gateway.GatewayClient(stub.url, retries=1, backoff=0, breaker=breaker)
+        self.addCleanup(failing.close)
+        for _ in range(2):
+            with self.assertRaises(gateway.GatewayError):
+                failing.post_json({'to': '1'})
+        received = stub.received
+        with self.assertRaises(gateway.CircuitOpen):
+            failing.post_json({'to': '1'})
+        self.assertEqual(stub.received, received)
+
+        # Envoi d'essai en échec hors réponse (pool saturé): le disjoncteur se rouvre
+        breaker.opened_at -= 60
+        failing.pool.slots.acquire()
+        failing.pool_timeout = 0
+        with self.assertRaises(gateway.GatewayError):
+            failing.post_json({'to': '1'})
+        self.assertEqual((breaker.state, breaker.probing), ('open', False))
+
+    def test_only_unprocessed_requests_are_retried(self):
+        from .services import gateway
+
+        client = gateway.GatewayClient('http://gateway.test/sms', retries=2, backoff=0)
+        for status, calls in ((503, 3), (502, 1), (400, 1)):
+            with patch.object(client, '_once', return_value=(status, b'{}')) as once:
+                with self.assertRaises(gateway.GatewayError):
+                    client.post_json({'to': '1'})
+            self.assertEqual(once.call_count, calls)
+        self.assertEqual(client.breaker.failures, 0)
+
+
+class MailBatchTests(TestCase):
+    def test_notifications_share_one_smtp_session(self):
+        from django.core import mail as outbox
+        from unittest.mock import patch
+        from .services import mail
+
+        users = [User.objects.create_user(username=f'm{i}', email=f'm{i}@ex.com', password='x', role='admin') for i in range(3)]
+        notifications = [Notification.objects.create(user=u, title='Lot', message='Bonjour', type='info') for u in users]
+        cfg = {'enabled': True, 'roles': {'admin': {'email': True}}, 'dedupe_minutes': 0}
+        outbox.outbox = []
+        with self.settings(OFFSITE_NOTIFICATIONS=cfg), \
+                patch('spot.services.mail.get_connection', wraps=mail.get_connection) as connect:
+            self.assertEqual(mail.deliver_notifications(notifications), 3)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(len(outbox.outbox), 3)
+
+    def test_notifications_of_a_transaction_are_sent_as_one_batch(self):
+        from django.core import mail as outbox
+        from django.db import transaction
+        from unittest.mock import patch
+        from .services import mail
+
+        users = [User.objects.create_user(username=f't{i}', email=f't{i}@ex.com', password='x', role='admin') for i in range(3)]
+        cfg = {'enabled': True, 'roles': {'admin': {'email': True}}, 'dedupe_minutes': 0}
+        outbox.outbox = []
+        with self.settings(OFFSITE_NOTIFICATIONS=cfg), \
+                patch('spot.services.mail.deliver_notifications', wraps=mail.deliver_notifications) as deliver, \
+                self.captureOnCommitCallbacks(execute=True):
+            for user in users[:2]:
+                Notification.objects.create(user=user, title='Lot', message='Bonjour', type='info')
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Notification.objects.create(user=users[2], title='Annulée', message='-', type='info')
+                raise RuntimeError
+        self.assertEqual(deliver.call_count, 1)
+        self.assertEqual(sorted(m.to[0] for m in outbox.outbox), ['t0@ex.com', 't1@ex.com'])
+        self.assertEqual(
+            set(Notification.objects.filter(title='Lot').values_list('email_status', flat=True)), {'sent'},
+        )
+
+
+class CrewRecommendationTests(TestCase):
+    def setUp(self):
+        from .services import crew
+
+        crew.reset()
+        self.day = timezone.localdate()
+
+    def _coverage(self, title, start, end, **extra):
+        from .models import CoverageRequest
+
+        return CoverageRequest.objects.create(
+            event_title=title, event_type='cultural_sport', event_date=self.day, start_time=start, end_time=end,
+            address='Ouaga', contact_name='C', contact_phone='1', coverage_type='video_report', status='review', **extra,
+        )
+
+    def test_ranking_follows_timelines_and_updates_incrementally(self):
+        from .models import CoverageAssignment, Driver, Journalist
+        from .services import assignments, crew
+
+        busy = Journalist.objects.create(name='Awa', specialties='sport')
+        sport = Journalist.objects.create(name='Binta', specialties='Économie, Sport')
+        Journalist.objects.create(name='Chantal', specialties='politique')
+        driver = Driver.objects.create(name='Djibril')
+        morning = self._coverage('Conseil', time(9, 0), time(11, 0))
+        match = self._coverage('Finale de football', time(10, 30), None)
+        CoverageAssignment.objects.create(coverage=morning, journalist=busy)
+
+        ranked = crew.recommend(match)
+        self.assertEqual([j['name'] for j in ranked['journalists']], ['Binta', 'Chantal', 'Awa'])
+        self.assertEqual(ranked['journalists'][0]['specialties'], ['sport'])
+        self.assertEqual(ranked['journalists'][2]['conflicts'][0]['start'], '09:00')
+        self.assertTrue(ranked['drivers'][0]['available'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            assignments.assign(morning, [], [driver.id])
+        with self.assertNumQueries(2):
+            ranked = crew.recommend(match)
+        self.assertFalse(ranked['drivers'][0]['available'])
+
+        manager = User.objects.create_user(username='crew', password='x', role='editorial_manager')
+        self.client.force_login(manager)
+        response = self.client.get(reverse('editorial_api_coverage_recommendations', args=[match.id]))
+        self.assertEqual(response.json()['journalists'][0]['id'], str(sport.id))
+
+
+class RetentionTests(TestCase):
+    def test_expired_rows_are_archived_then_deleted_in_batches(self):
+        import gzip
+        import json
+        import tempfile
+        from datetime import timedelta
+        from .models import AssignmentNotificationAttempt, AssignmentNotificationCampaign, CoverageAssignment, CoverageRequest
+        from .models import PlanningEvent
+        from .services import retention
+
+        user = User.objects.create_user(username='ret', password='x')
+        old = timezone.now() - timedelta(days=200)
+        read = [Notification.objects.create(user=user, title=f'Lue {n}', message='m', is_read=True) for n in range(3)]
+        unread = Notification.objects.create(user=user, title='Non lue', message='m')
+        recent = Notification.objects.create(user=user, title='Récente', message='m', is_read=True)
+        Notification.objects.filter(id__in=[n.id for n in read] + [unread.id]).update(created_at=old)
+
+        cv = CoverageRequest.objects.create(
+            event_title='E', event_type='other', event_date=timezone.localdate(), start_time=time(9, 0),
+            address='A', contact_name='C', contact_phone='1', coverage_type='video_report',
+        )
+        campaign = AssignmentNotificationCampaign.objects.create(
+            assignment=CoverageAssignment.objects.create(coverage=cv), recipient_kind='driver', confirm_code='1',
+        )
+        attempt = AssignmentNotificationAttempt.objects.create(campaign=campaign, channel='sms', body='Long SMS', meta={'k': 1})
+        AssignmentNotificationAttempt.objects.filter(id=attempt.id).update(created_at=timezone.now() - timedelta(days=40))
+        for seq, published in ((1, True), (2, False), (3, True)):
+            PlanningEvent.objects.create(
+                seq=seq, action='upsert', schedule_id=seq, broadcast_date=date(2030, 1, 1),
+                published_at=timezone.now() if published else None,
+            )
+        PlanningEvent.objects.filter(seq__in=[1, 2]).update(created_at=old)
+
+        with tempfile.TemporaryDirectory() as folder, self.settings(SPOT_ARCHIVE_DIR=folder), \
+                self.assertLogs('spot', level='INFO'):
+            report = {e['policy']: e for e in retention.run(batch=2)}
+            with gzip.open(report['notifications']['file'], 'rt', encoding='utf-8') as fh:
+                rows = [json.loads(line) for line in fh]
+
+        self.assertEqual(report['notifications']['deleted'], 3)
+        self.assertEqual(sorted(r['title'] for r in rows), ['Lue 0', 'Lue 1', 'Lue 2'])
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)), {unread.id, recent.id})
+        self.assertEqual(report['assignment_attempts']['compacted'], 1)
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.body, attempt.meta), ('', {}))
+        # Événements du planning: publiés ou non, sans archive
+        self.assertEqual((report['planning_events']['deleted'], report['planning_events']['file']), (2, None))
+        self.assertEqual(list(PlanningEvent.objects.values_list('seq', flat=True)), [3])
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_read_only_work_goes_to_replica_unless_user_just_wrote(self):
+        from unittest.mock import patch
+        from django.http import HttpResponse
+        from . import db_router
+        from .middleware import ReplicaStickinessMiddleware
+        from .models import Campaign
+
+        router = db_router.ReplicaRouter()
+        seen = []
+
+        @db_router.read_only
+        def report(request):
+            seen.append(router.db_for_read(Campaign))
+            return HttpResponse('ok')
+
+        middleware = ReplicaStickinessMiddleware(lambda request: report(request))
+        factory = RequestFactory()
+        with patch('spot.db_router.configured', return_value=True):
+            self.assertEqual(router.db_for_read(Campaign), 'default')
+            middleware(factory.get('/reports/'))
+            response = middleware(factory.post('/campaigns/'))
+            self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+            request = factory.get('/reports/')
+            request.COOKIES[db_router.STICKY_COOKIE] = '1'
+            middleware(request)
+        self.assertEqual(seen, ['replica', 'replica', 'default'])
+        self.assertEqual(router.db_for_write(Campaign), 'default')
+
+
+class SearchMigrationTests(TransactionTestCase):
+    def test_thread_search_survives_migrating_to_head(self):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+        from .models import CorrespondenceThread
+        from .services import search
+
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'spot_correspondencethread_fts_%'"
+                )
+                return cursor.fetchone()[0]
+
+        for target in ['0034_campaign_progress', '0035_correspondence_last_message']:
+            MigrationExecutor(connection).migrate([('spot', target)])
+        # 0035 reconstruit la table: ses triggers doivent être recréés
+        self.assertEqual(triggers(), 3)
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('spot'))
+        self.assertEqual(triggers(), 3)
+        client = User.objects.create_user(username='fts', password='x', role='client')
+        thread = CorrespondenceThread.objects.create(client=client, subject='Facturation du mois de mars')
+        found = CorrespondenceThread.objects.filter(search.text_match('thread', 'factur'))
+        self.assertEqual(list(found), [thread])
+
+
+try:
+    from channels.testing import WebsocketCommunicator
+except Exception:
+    # Canaux en option (et `channels.testing` requiert daphne)
+    WebsocketCommunicator = None
+
+
+@unittest.skipUnless(WebsocketCommunicator, 'channels.testing indisponible')
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class CorrespondenceConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='ws_client', password='x', role='client')
+        self.admin = User.objects.create_user(username='ws_admin', password='x', role='admin')
+        self.other = User.objects.create_user(username='ws_other', password='x', role='client')
+        self.thread = CorrespondenceThread.objects.create(client=self.owner, subject='Facture')
+
+    def _communicator(self, user, thread_id=None):
+        from channels.routing import URLRouter
+        from .routing import websocket_urlpatterns
+
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/correspondence/{thread_id or self.thread.id}/',
+        )
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_connection_is_refused_without_access(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        async def scenario():
+            results = []
+            for user, thread_id in ((AnonymousUser(), None), (self.other, None), (self.owner, 'abc')):
+                communicator = self._communicator(user, thread_id)
+                results.append(await communicator.connect())
+                await communicator.disconnect()
+            return results
+
+        self.assertEqual(async_to_sync(scenario)(), [(False, 4001), (False, 4003), (False, 4003)])
+
+    def test_messages_typing_and_read_are_relayed(self):
+        async def receive(communicator):
+            return json.loads(await communicator.receive_from(timeout=2))
+
+        async def scenario():
+            client, admin = self._communicator(self.owner), self._communicator(self.admin)
+            self.assertEqual((await client.connect())[0], True)
+            self.assertEqual((await admin.connect())[0], True)
+            try:
+                await client.send_to(text_data=json.dumps({'type': 'message', 'content': 'Bonjour'}))
+                for communicator in (client, admin):
+                    event = await receive(communicator)
+                    self.assertEqual((event['type'], event['status'], event['message']['content']), ('message', 'pending', 'Bonjour'))
+                # Relance avant le délai: refusée, rien n'est diffusé
+                await client.send_to(text_data=json.dumps({'type': 'message', 'content': 'Relance'}))
+                self.assertEqual((await receive(client))['error'], 'reply_delay')
+                self.assertTrue(await admin.receive_nothing())
+
+                await admin.send_to(text_data=json.dumps({'type': 'typing'}))
+                self.assertEqual(await receive(client), {'type': 'typing', 'author': 'ws_admin'})
+                await client.send_to(text_data=json.dumps({'type': 'read', 'message_id': 'm1'}))
+                self.assertEqual(await receive(admin), {'type': 'read', 'message_id': 'm1'})
+                # Pas d'écho vers l'auteur
+                self.assertTrue(await admin.receive_nothing())
+                self.assertTrue(await client.receive_nothing())
+            finally:
+                await client.disconnect()
+                await admin.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.thread.messages.count(), 1)
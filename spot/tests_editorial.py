@@ -156,6 +156,31 @@ class EditorialPagesTests(TestCase):
         camp.refresh_from_db()
         self.assertEqual(camp.status, 'confirmed')
 
+    def test_sms_inbound_batch_matches_sender_and_ignores_retries(self):
+        url = reverse('editorial_assign_coverage', args=[self.coverage.id])
+        self.client.post(url, data={'journalist_id': str(self.journalist.id), 'driver_id': str(self.driver.id)})
+        camps = AssignmentNotificationCampaign.objects.filter(assignment__coverage=self.coverage)
+        camps.update(confirm_code='123456')
+        driver_camp = camps.get(recipient_kind='driver')
+        self.assertEqual(driver_camp.phone_tail, '70000001')
+        payload = [
+            {'id': 'm1', 'from': '0022670000001', 'body': 'OK 123456'},
+            {'id': 'm2', 'from': '+22670000001', 'body': 'merci'},
+        ]
+        inbound_url = reverse('sms_inbound')
+        resp = self.client.post(inbound_url, data=payload, content_type='application/json')
+        self.assertEqual(
+            [(r['result'], r['duplicate']) for r in resp.json()['results']],
+            [('confirmed', False), ('code_missing', False)],
+        )
+        driver_camp.refresh_from_db()
+        self.assertEqual(driver_camp.status, 'confirmed')
+        self.assertEqual(camps.get(recipient_kind='journalist').status, 'active')
+
+        resp = self.client.post(inbound_url, data={'messages': payload[:1]}, content_type='application/json')
+        self.assertEqual(resp.json()['results'][0], {'id': 'm1', 'result': 'confirmed', 'duplicate': True})
+        self.assertEqual(AssignmentNotificationAttempt.objects.filter(campaign=driver_camp, status='confirmed').count(), 1)
+
 
 @override_settings(
     EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
@@ -178,7 +203,7 @@ class OffsiteNotificationDeliveryTests(TestCase):
         )
 
     def test_delivers_email_and_whatsapp_and_marks_status_fields(self):
-        with patch('spot.signals.send_notification_email', return_value=True) as email_mock:
+        with patch('spot.services.mail.send_batch', side_effect=lambda messages: [True] * len(messages)) as email_mock:
             with self.captureOnCommitCallbacks(execute=True):
                 n = Notification.objects.create(user=self.user, title='Titre', message='Message', type='info')
 
@@ -189,7 +214,7 @@ class OffsiteNotificationDeliveryTests(TestCase):
         self.assertEqual(n.email_error, '')
 
     def test_dedup_skips_second_notification(self):
-        with patch('spot.signals.send_notification_email', return_value=True) as email_mock:
+        with patch('spot.services.mail.send_batch', side_effect=lambda messages: [True] * len(messages)) as email_mock:
             with self.captureOnCommitCallbacks(execute=True):
                 Notification.objects.create(user=self.user, title='Titre', message='Message', type='info')
             with self.captureOnCommitCallbacks(execute=True):
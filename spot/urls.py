@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 from . import views_additional
 from . import views_editorial_people
+from . import views_uploads
 
 urlpatterns = [
     # Accueil et session
@@ -19,6 +20,9 @@ urlpatterns = [
     path('campaigns/<uuid:campaign_id>/upload/', views.spot_upload, name='spot_upload'),
     path('spots/<uuid:spot_id>/', views.spot_detail, name='spot_detail'),
     path('spots/', views.spot_list, name='spot_list'),
+    # Téléversements reprenables (médias des spots, par morceaux)
+    path('uploads/', views_uploads.upload_create, name='upload_create'),
+    path('uploads/<uuid:upload_id>/', views_uploads.upload_detail, name='upload_detail'),
 
     # Grille de diffusion
     path('broadcasts/', views.broadcast_grid, name='broadcast_grid'),
@@ -44,6 +48,7 @@ urlpatterns = [
 
     # Simulateur de coût (dans views_additional)
     path('cost-simulator/', views_additional.cost_simulator, name='cost_simulator'),
+    path('api/pricing/quote/', views_additional.pricing_quote_api, name='pricing_quote_api'),
 
     # Notifications & profil
     path('notifications/', views.notifications, name='notifications'),
@@ -97,6 +102,7 @@ urlpatterns = [
     path('editorial/api/journalists/<uuid:journalist_id>/', views_editorial_people.api_journalist_detail, name='editorial_api_journalist_detail'),
     path('editorial/api/drivers/', views_editorial_people.api_drivers, name='editorial_api_drivers'),
     path('editorial/api/drivers/<uuid:driver_id>/', views_editorial_people.api_driver_detail, name='editorial_api_driver_detail'),
+    path('editorial/api/coverages/<uuid:coverage_id>/recommendations/', views_editorial_people.api_coverage_recommendations, name='editorial_api_coverage_recommendations'),
     path('assignments/confirm/<uuid:campaign_id>/<str:code>/', views.assignment_confirm, name='assignment_confirm'),
     path('assignments/pdf/<uuid:campaign_id>/<str:code>/', views.assignment_pdf, name='assignment_pdf'),
     path('assignments/notify/email/<uuid:campaign_id>/', views.assignment_notify_email, name='assignment_notify_email'),
@@ -32,6 +32,7 @@ urlpatterns = [
     path('api/notifications/list/', is_diffuser_required(views_diffusion.diffusion_notifications_list_partial), name='diffusion_notifications_list_partial'),
     path('api/kpi/', is_diffuser_required(views_diffusion.kpi_api), name='diffusion_kpi_api'),
     path('api/clients-search/', is_diffuser_required(views_diffusion.clients_search_api), name='diffusion_clients_search_api'),
+    path('api/availability/', is_diffuser_required(views_diffusion.slot_availability_api), name='diffusion_slot_availability_api'),
     path('export/spots/csv/', is_diffuser_required(views_diffusion.export_spots_csv), name='diffusion_export_spots_csv'),
     path('export/spots/xlsx/', is_diffuser_required(views_diffusion.export_spots_xlsx), name='diffusion_export_spots_xlsx'),
     path('export/spots/broadcasted/pdf/', is_diffuser_required(views_diffusion.export_spots_broadcasted_pdf), name='diffusion_export_spots_broadcasted_pdf'),
@@ -4,17 +4,11 @@ Utilitaires pour l'application BF1 TV
 
 import os
 import uuid
-import json
 import secrets
-import urllib.request
-import urllib.error
-import urllib.parse
 import logging
-import base64
 from decimal import Decimal
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import datetime, timedelta
 
@@ -28,7 +22,7 @@ def generate_unique_filename(instance, filename):
     return os.path.join('uploads', filename)
 
 
-def calculate_campaign_cost(duration, time_slot_multiplier, broadcast_count, base_price=1000):
+def calculate_campaign_cost(duration, time_slot_multiplier, broadcast_count, base_price=None):
     """
     Calcule le coût d'une campagne publicitaire
     
@@ -36,24 +30,23 @@ def calculate_campaign_cost(duration, time_slot_multiplier, broadcast_count, bas
         duration (int): Durée du spot en secondes
         time_slot_multiplier (Decimal): Multiplicateur du créneau horaire
         broadcast_count (int): Nombre de diffusions
-        base_price (int): Prix de base par seconde
+        base_price (Decimal): Prix de base par seconde (par défaut: grille active)
     
     Returns:
         dict: Détail du calcul du coût
     """
-    duration_price = Decimal(str(base_price)) * Decimal(str(duration))
-    total_price = duration_price * time_slot_multiplier * Decimal(str(broadcast_count))
-    tax_rate = Decimal('0.18')  # 18% TVA
-    tax_amount = total_price * tax_rate
-    final_price = total_price + tax_amount
-    
+    from .services import pricing
+
+    detail = pricing.breakdown(
+        duration, None, broadcast_count, price=base_price, factor=time_slot_multiplier,
+    )
     return {
-        'base_price': Decimal(str(base_price)),
-        'duration_price': duration_price,
+        'base_price': detail['base_price'],
+        'duration_price': detail['base_price'] * Decimal(str(duration)),
         'time_multiplier': time_slot_multiplier,
-        'total_price': total_price,
-        'tax_amount': tax_amount,
-        'final_price': final_price,
+        'total_price': detail['subtotal'],
+        'tax_amount': detail['tax'],
+        'final_price': detail['total'],
     }
 
 
@@ -67,33 +60,10 @@ def send_notification_email(user, subject, message, campaign=None, attachments=N
         message (str): Message de l'email
         campaign: Campagne liée (optionnel)
     """
+    from .services import mail
+
     try:
-        context = {
-            'user': user,
-            'message': message,
-            'campaign': campaign,
-            'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
-        }
-        
-        html_message = render_to_string('emails/notification.html', context)
-        plain_message = render_to_string('emails/notification.txt', context)
-        
-        email = EmailMultiAlternatives(
-            subject=f'[BF1 TV] {subject}',
-            body=plain_message,
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@bf1tv.bf'),
-            to=[user.email],
-        )
-        email.attach_alternative(html_message, 'text/html')
-        for att in attachments or []:
-            try:
-                filename, content, mimetype = att
-                email.attach(filename, content, mimetype)
-            except Exception:
-                pass
-        email.send(fail_silently=False)
-        
-        return True
+        return mail.send_one(mail.notification_message(user, subject, message, campaign, attachments))
     except Exception as e:
         logging.getLogger('spot').error('Erreur envoi email', exc_info=True)
         return False
@@ -115,6 +85,28 @@ def normalize_phone(phone):
     return cleaned
 
 
+def phone_tail(phone):
+    """8 derniers chiffres d'un numéro: clé de rapprochement indépendante de l'indicatif."""
+    return ''.join(ch for ch in str(phone or '') if ch.isdigit())[-8:]
+
+
+def _send_via_gateway(kind, api_url, token, payload, attachments=None):
+    from .services import gateway
+
+    try:
+        response = gateway.client(api_url, token).post_json(payload, attachments)
+        return True, gateway.message_id(response), ''
+    except gateway.CircuitOpen as e:
+        logging.getLogger('spot').warning('Envoi %s ignoré: %s', kind, e)
+        return False, None, str(e)
+    except gateway.GatewayError as e:
+        if e.status:
+            logging.getLogger('spot').error('HTTPError envoi %s: %s', kind, e.body)
+            return False, None, e.body or str(e)
+        logging.getLogger('spot').error('Erreur envoi %s: %s', kind, e)
+        return False, None, str(e)
+
+
 def send_sms(phone, message):
     api_url = getattr(settings, 'SPOT_SMS_API_URL', '') or ''
     token = getattr(settings, 'SPOT_SMS_API_TOKEN', '') or ''
@@ -128,33 +120,11 @@ def send_sms(phone, message):
     }
     if sender:
         payload['sender'] = sender
-    data = json.dumps(payload).encode('utf-8')
-    headers = {'Content-Type': 'application/json'}
-    if token:
-        headers['Authorization'] = f'Bearer {token}'
-    req = urllib.request.Request(api_url, data=data, headers=headers, method='POST')
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            body = resp.read() or b''
-        try:
-            parsed = json.loads(body.decode('utf-8') or '{}')
-        except Exception:
-            parsed = {}
-        msg_id = parsed.get('id') or parsed.get('message_id') or parsed.get('sid')
-        return True, msg_id, ''
-    except urllib.error.HTTPError as e:
-        try:
-            err_body = e.read().decode('utf-8')
-        except Exception:
-            err_body = str(e)
-        logging.getLogger('spot').error('HTTPError envoi SMS: %s', err_body)
-        return False, None, err_body
-    except Exception as e:
-        logging.getLogger('spot').error('Erreur envoi SMS', exc_info=True)
-        return False, None, str(e)
+    return _send_via_gateway('SMS', api_url, token, payload)
 
 
 def send_whatsapp(phone, message, attachments=None):
+    """Envoi WhatsApp; `attachments` [(nom, contenu, type)], contenu en bytes ou fichier binaire."""
     api_url = getattr(settings, 'SPOT_WHATSAPP_API_URL', '') or ''
     token = getattr(settings, 'SPOT_WHATSAPP_API_TOKEN', '') or ''
     sender = getattr(settings, 'SPOT_WHATSAPP_SENDER', '') or ''
@@ -171,41 +141,10 @@ def send_whatsapp(phone, message, attachments=None):
     for att in attachments or []:
         try:
             filename, content, mimetype = att
-            att_list.append(
-                {
-                    'filename': filename,
-                    'mimetype': mimetype,
-                    'content_base64': base64.b64encode(content).decode('ascii'),
-                }
-            )
+            att_list.append((filename, content, mimetype))
         except Exception:
             pass
-    if att_list:
-        payload['attachments'] = att_list
-    data = json.dumps(payload).encode('utf-8')
-    headers = {'Content-Type': 'application/json'}
-    if token:
-        headers['Authorization'] = f'Bearer {token}'
-    req = urllib.request.Request(api_url, data=data, headers=headers, method='POST')
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            body = resp.read() or b''
-        try:
-            parsed = json.loads(body.decode('utf-8') or '{}')
-        except Exception:
-            parsed = {}
-        msg_id = parsed.get('id') or parsed.get('message_id') or parsed.get('sid')
-        return True, msg_id, ''
-    except urllib.error.HTTPError as e:
-        try:
-            err_body = e.read().decode('utf-8')
-        except Exception:
-            err_body = str(e)
-        logging.getLogger('spot').error('HTTPError envoi WhatsApp: %s', err_body)
-        return False, None, err_body
-    except Exception as e:
-        logging.getLogger('spot').error('Erreur envoi WhatsApp', exc_info=True)
-        return False, None, str(e)
+    return _send_via_gateway('WhatsApp', api_url, token, payload, att_list)
 
 
 def build_coverage_pdf(coverage):
@@ -325,6 +264,8 @@ def build_coverage_pdf(coverage):
 
 
 def send_assignment_notification_email(to_email, recipient_label, subject, attachments=None):
+    from .services import mail
+
     try:
         plain = f'Bonjour {recipient_label},\n\nVeuillez trouver en pièce jointe la fiche complète de la couverture assignée.\n\nCordialement,\nBF1 TV'
         html = f'<p>Bonjour {recipient_label},</p><p>Veuillez trouver en pièce jointe la fiche complète de la couverture assignée.</p><p>Cordialement,<br/>BF1 TV</p>'
@@ -341,8 +282,7 @@ def send_assignment_notification_email(to_email, recipient_label, subject, attac
                 email.attach(filename, content, mimetype)
             except Exception:
                 pass
-        email.send(fail_silently=False)
-        return True
+        return mail.send_one(email)
     except Exception:
         logging.getLogger('spot').error('Erreur envoi email assignation', exc_info=True)
         return False
@@ -446,60 +386,10 @@ def create_assignment_notification_campaigns(assignment, created_by=None):
 
 
 def process_due_assignment_notification_campaigns(now=None, limit=100):
-    from .models import AssignmentNotificationCampaign, AssignmentNotificationAttempt, AssignmentLog
+    """Relances SMS dues (réservation par bail, envois en parallèle)."""
+    from .services import reminders
 
-    now = now or timezone.now()
-    qs = AssignmentNotificationCampaign.objects.select_related('assignment', 'assignment__coverage').filter(
-        status='active',
-        confirmed_at__isnull=True,
-        next_attempt_at__isnull=False,
-        next_attempt_at__lte=now,
-    ).order_by('next_attempt_at')[:limit]
-
-    processed = 0
-    for campaign in qs:
-        phone = campaign.to_phone or ''
-        if not phone:
-            campaign.next_attempt_at = None
-            campaign.save(update_fields=['next_attempt_at', 'updated_at'])
-            continue
-
-        coverage = campaign.assignment.coverage
-        site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
-        confirm_url = f'{site_url}/assignments/confirm/{campaign.id}/{campaign.confirm_code}/'
-        base = (
-            f'Assignation BF1 TV: {coverage.event_title} le {coverage.event_date} '
-            f'à {coverage.start_time.strftime("%H:%M")} — {coverage.address}. '
-            f'Code {campaign.confirm_code}. Lien {confirm_url}'
-        )
-        if campaign.reminder_count == 0:
-            text = base
-            next_at = now + timedelta(minutes=30)
-        else:
-            text = f'RAPPEL — {base}'
-            next_at = None
-
-        ok, msg_id, err = send_sms(phone, text)
-        AssignmentNotificationAttempt.objects.create(
-            campaign=campaign,
-            channel='sms',
-            status='sent' if ok else 'failed',
-            to=phone,
-            body=text,
-            provider=getattr(settings, 'SPOT_SMS_PROVIDER', ''),
-            provider_message_id=msg_id or '',
-            error='' if ok else err,
-            sent_at=timezone.now() if ok else None,
-        )
-        AssignmentLog.objects.create(assignment=campaign.assignment, label='Relance SMS', note=f'{campaign.recipient_kind} — {"ok" if ok else "failed"}')
-        campaign.reminder_count = min(campaign.reminder_count + 1, 2)
-        campaign.next_attempt_at = next_at
-        if not next_at and campaign.reminder_count >= 2:
-            campaign.status = 'expired'
-        campaign.save(update_fields=['reminder_count', 'next_attempt_at', 'status', 'updated_at'])
-        processed += 1
-
-    return processed
+    return reminders.process_due(now=now, limit=limit)
 
 
 def confirm_assignment_notification_campaign(campaign, via):
@@ -687,7 +577,15 @@ def send_campaign_reminder():
         status='active'
     )
     
-    for campaign in campaigns_ending_soon:
-        subject = "Rappel: Votre campagne se termine bientôt"
-        message = f"Votre campagne '{campaign.title}' se termine dans 3 jours ({campaign.end_date})."
-        send_notification_email(campaign.client, subject, message, campaign)
+    # Un seul lot SMTP pour tous les rappels
+    from .services import mail
+
+    subject = "Rappel: Votre campagne se termine bientôt"
+    mail.send_batch([
+        mail.notification_message(
+            campaign.client, subject,
+            f"Votre campagne '{campaign.title}' se termine dans 3 jours ({campaign.end_date}).",
+            campaign,
+        )
+        for campaign in campaigns_ending_soon.select_related('client')
+    ])
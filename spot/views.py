@@ -58,6 +58,15 @@ from .models import (
     CoverageRequest, CoverageAttachment, Journalist, Driver, CoverageAssignment, AssignmentLog,
     AssignmentNotificationCampaign
 )
+from .services import assignments as coverage_assignments
+from .services import correspondence
+from .services import editorial as editorial_data
+from .services import inbound_sms
+from .services import progress as campaign_progress
+from .services import search as text_search
+from .services import uploads as chunked_uploads
+from .pagination import KeysetPaginator
+from .db_router import read_only
 from .forms import (
     CustomUserCreationForm, CustomAuthenticationForm, CampaignForm,
     SpotForm, CostSimulatorForm, CampaignSpotForm,
@@ -76,6 +85,7 @@ def home(request):
             Campaign.objects.filter(client=request.user).exists()
             or CoverageRequest.objects.filter(user=request.user).exists()
         )
+    totals = campaign_progress.totals()
     context = {
         'total_campaigns': Campaign.objects.count(),
         'active_campaigns': Campaign.objects.filter(status='active').count(),
@@ -84,12 +94,9 @@ def home(request):
         'requests_in_progress_count': Campaign.objects.filter(
             status__in=['pending', 'approved', 'active']
         ).count(),
-        'scheduled_broadcasts_count': SpotSchedule.objects.filter(
-            is_broadcasted=False
-        ).count(),
-        'completed_services_count': SpotSchedule.objects.filter(
-            is_broadcasted=True
-        ).count(),
+        # Compteurs dénormalisés (services.progress): une ligne lue
+        'scheduled_broadcasts_count': totals['scheduled'],
+        'completed_services_count': totals['broadcast'],
         'quick_guide_user_is_active': quick_guide_user_is_active,
     }
     return render(request, 'spot/home.html', context)
@@ -190,18 +197,15 @@ def campaign_list(request):
     
     search = request.GET.get('search')
     if search:
-        campaigns = campaigns.filter(
-            Q(title__icontains=search) | 
-            Q(description__icontains=search)
-        )
+        campaigns = campaigns.filter(text_search.text_match('campaign', search))
     
-    # Pagination
-    paginator = Paginator(campaigns.order_by('-created_at'), 10)
-    page_number = request.GET.get('page')
-    campaigns = paginator.get_page(page_number)
+    # Pagination par curseur
+    paginator = KeysetPaginator(campaigns, ('-created_at', 'id'), per_page=10)
+    campaigns = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'campaigns': campaigns,
+        'page_obj': campaigns,
         'status_choices': Campaign.STATUS_CHOICES,
     }
     
@@ -267,6 +271,37 @@ def campaign_create(request):
     })
 
 
+def _files_with_staged_upload(request, campaign=None):
+    """Complète request.FILES avec un média téléversé par morceaux (champ `upload_id`).
+
+    Renvoie (files, session): la session est None si aucun téléversement reprenable
+    n'est utilisé, ou s'il a été ouvert pour une autre campagne que `campaign`.
+    """
+    upload_id = (request.POST.get('upload_id') or '').strip()
+    field = (request.POST.get('upload_field') or 'video_file').strip()
+    if not upload_id:
+        return request.FILES, None
+    try:
+        upload, staged = chunked_uploads.staged_file(upload_id, request.user, field, campaign)
+    except ValidationError:
+        upload, staged = None, None
+    if not staged:
+        return request.FILES, None
+    files = request.FILES.copy()
+    files[field] = staged
+    return files, upload
+
+
+def _release_staged_upload(files, upload, attached):
+    if not upload:
+        return
+    staged = files.get(upload.target_field)
+    if staged is not None:
+        staged.close()
+    if attached:
+        chunked_uploads.mark_attached(upload)
+
+
 @login_required
 def campaign_spot_create(request):
     """Mode Facile: création de campagne + upload du spot en une fois"""
@@ -284,7 +319,8 @@ def campaign_spot_create(request):
     slot_label = ''
 
     if request.method == 'POST':
-        form = CampaignSpotForm(request.POST, request.FILES)
+        files, staged_upload = _files_with_staged_upload(request)
+        form = CampaignSpotForm(request.POST, files)
         if form.is_valid():
             campaign = Campaign(
                 title=form.cleaned_data['title'],
@@ -339,11 +375,14 @@ def campaign_spot_create(request):
                 else:
                     spot.media_type = media_type or 'image'
                 spot.save()
+                _release_staged_upload(files, staged_upload, attached=True)
                 messages.success(request, "Votre pub est enregistrée. Elle sera validée par un administrateur.")
             else:
+                _release_staged_upload(files, staged_upload, attached=False)
                 messages.success(request, "Votre campagne est enregistrée. Vous pourrez uploader votre spot plus tard.")
             return redirect('campaign_detail', campaign_id=campaign.id)
         else:
+            _release_staged_upload(files, staged_upload, attached=False)
             messages.error(request, "Veuillez corriger les erreurs du formulaire.")
     else:
         today = timezone.now().date()
@@ -483,6 +522,7 @@ def campaign_detail(request, campaign_id):
     context = {
         'campaign': campaign,
         'spots': spots,
+        'progress': campaign_progress.for_campaign(campaign),
         'history': history,
         'history_display_limit': 5,
         'suppress_messages': True,
@@ -508,12 +548,14 @@ def spot_upload(request, campaign_id):
         return redirect('campaign_detail', campaign_id=campaign.id)
     
     if request.method == 'POST':
-        form = SpotForm(request.POST, request.FILES)
+        files, staged_upload = _files_with_staged_upload(request, campaign)
+        form = SpotForm(request.POST, files)
         if form.is_valid():
             spot = form.save(commit=False)
             spot.campaign = campaign
             spot.status = 'pending_review'
             spot.save()
+            _release_staged_upload(files, staged_upload, attached=True)
             
             # Mettre à jour le statut de la campagne si nécessaire
             if campaign.status == 'draft':
@@ -533,6 +575,7 @@ def spot_upload(request, campaign_id):
             
             messages.success(request, 'Votre spot a été téléchargé avec succès et sera examiné par notre équipe.')
             return redirect('campaign_detail', campaign_id=campaign.id)
+        _release_staged_upload(files, staged_upload, attached=False)
     else:
         form = SpotForm()
     
@@ -905,6 +948,7 @@ def coverage_request_detail(request, coverage_id):
 
 
 @login_required
+@read_only
 def admin_dashboard(request):
     """Tableau de bord administrateur"""
     if not request.user.is_admin():
@@ -976,8 +1020,8 @@ def spot_list(request):
     if status in valid_statuses:
         qs = qs.filter(status=status)
 
-    paginator = Paginator(qs, 10)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    paginator = KeysetPaginator(qs, ('-created_at', 'id'), per_page=10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'spot/spot_list.html', {
         'spots': page_obj.object_list,
@@ -1027,18 +1071,26 @@ def broadcast_grid(request):
     campaigns_qs = Campaign.objects.filter(start_date__lte=selected_date, end_date__gte=selected_date)
     if request.user.is_client():
         campaigns_qs = campaigns_qs.filter(client=request.user)
-    campaigns_qs = campaigns_qs.select_related('client').order_by('-created_at')
-
-    # Calculs par campagne: spots et programmations du jour
-    campaigns_for_day = []
-    for c in campaigns_qs:
-        spots_count = c.spots.count()
-        schedules_count = SpotSchedule.objects.filter(spot__campaign=c, broadcast_date=selected_date).count()
-        campaigns_for_day.append({
+    campaigns_qs = campaigns_qs.select_related('client').annotate(
+        spots_count=Count('spots', distinct=True),
+    ).order_by('-created_at')
+
+    # Calculs par campagne: spots, programmations du jour et avancement global
+    campaigns = list(campaigns_qs)
+    day_counts = dict(
+        SpotSchedule.objects.filter(spot__campaign__in=campaigns, broadcast_date=selected_date)
+        .order_by().values_list('spot__campaign_id').annotate(n=Count('id'))
+    )
+    progress_by_campaign = campaign_progress.for_campaigns([c.id for c in campaigns])
+    campaigns_for_day = [
+        {
             'campaign': c,
-            'spots_count': spots_count,
-            'schedules_count': schedules_count,
-        })
+            'spots_count': c.spots_count,
+            'schedules_count': day_counts.get(c.id, 0),
+            'progress': progress_by_campaign[c.id],
+        }
+        for c in campaigns
+    ]
 
     # Navigation date précédente/suivante
     prev_date = (selected_date - timedelta(days=1)).strftime('%Y-%m-%d')
@@ -1060,51 +1112,27 @@ def broadcast_grid(request):
 
 @login_required
 def correspondence_list(request):
-    """Liste des correspondances (tickets)"""
-    if request.user.is_admin():
-        threads = CorrespondenceThread.objects.select_related('client', 'related_campaign')\
-            .prefetch_related('messages')\
-            .order_by('-last_message_at', '-created_at')
-    else:
-        threads = CorrespondenceThread.objects.filter(client=request.user)\
-            .select_related('related_campaign')\
-            .prefetch_related('messages')\
-            .order_by('-last_message_at', '-created_at')
-
+    """Liste des correspondances (tickets), paginée par curseur"""
     # Filtre par statut
     status = request.GET.get('status')
     valid_statuses = dict(CorrespondenceThread.STATUS_CHOICES)
-    if status in valid_statuses:
-        threads = threads.filter(status=status)
+    if status not in valid_statuses:
+        status = None
 
     # Recherche par sujet
     q = (request.GET.get('q') or '').strip()
-    if q:
-        threads = threads.filter(subject__icontains=q)
 
-    # Compteurs
-    if request.user.is_admin():
-        stats = {
-            'open': CorrespondenceThread.objects.filter(status='open').count(),
-            'pending': CorrespondenceThread.objects.filter(status='pending').count(),
-            'closed': CorrespondenceThread.objects.filter(status='closed').count(),
-        }
-    else:
-        stats = {
-            'open': CorrespondenceThread.objects.filter(client=request.user, status='open').count(),
-            'pending': CorrespondenceThread.objects.filter(client=request.user, status='pending').count(),
-            'closed': CorrespondenceThread.objects.filter(client=request.user, status='closed').count(),
-        }
+    # Dernier message dénormalisé: aucun message chargé pour l'aperçu
+    threads = correspondence.inbox(request.user, status=status, search=q)
+    page = correspondence.inbox_page(threads, request.GET.get('cursor'))
 
-    # Nouveau: construire une liste et injecter le dernier message sans indexation négative sur QuerySet
-    threads_list = list(threads)
-    for t in threads_list:
-        msgs = list(t.messages.all())
-        t.last_message_obj = msgs[-1] if msgs else None
+    # Compteurs
+    stats = correspondence.status_counts(request.user)
 
     return render(request, 'spot/correspondence_list.html', {
         'threads': threads,           # pour STATUS_CHOICES
-        'threads_list': threads_list, # pour l'itération et l'aperçu
+        'threads_list': page,         # pour l'itération et l'aperçu
+        'page_obj': page,
         'status': status,
         'q': q,
         'stats': stats,
@@ -1113,17 +1141,14 @@ def correspondence_list(request):
 @login_required
 def correspondence_thread(request, thread_id):
     """Détail d'une correspondance et ajout de messages"""
-    thread = get_object_or_404(CorrespondenceThread, id=thread_id)
+    thread = get_object_or_404(CorrespondenceThread.objects.select_related('last_message'), id=thread_id)
 
     # Contrôle d'accès
     if not (getattr(request.user, 'is_admin', lambda: False)() or getattr(request.user, 'is_staff', False)) and thread.client_id != request.user.id:
         messages.error(request, "Accès non autorisé.")
         return redirect('correspondence_list')
 
-    now = timezone.now()
-    last_msg = thread.messages.last()
-    can_reply_now = True
-    next_allowed_reply_at = None
+    last_msg = thread.last_message
 
     # État dérivé (affichage)
     if thread.status == 'closed':
@@ -1137,12 +1162,8 @@ def correspondence_thread(request, thread_id):
         state_label = 'Réponse reçue'
 
     # Délai 24h pour les relances client si pas de réponse du support
-    if request.user.is_client():
-        if last_msg and last_msg.author_id == request.user.id:
-            limit = last_msg.created_at + timedelta(hours=24)
-            if now < limit:
-                can_reply_now = False
-                next_allowed_reply_at = limit
+    next_allowed_reply_at = correspondence.next_reply_at(thread, request.user)
+    can_reply_now = next_allowed_reply_at is None
 
     if request.method == 'POST':
         # Action: marquer comme résolu
@@ -1156,14 +1177,7 @@ def correspondence_thread(request, thread_id):
         # Action: relancer (admin)
         if action == 'relance' and (getattr(request.user, 'is_admin', lambda: False)() or getattr(request.user, 'is_staff', False)):
             relance_text = (request.POST.get('relance_text') or "Bonjour, nous relançons la discussion pour avancer.").strip()
-            CorrespondenceMessage.objects.create(
-                thread=thread,
-                author=request.user,
-                content=relance_text
-            )
-            thread.status = 'open'
-            thread.last_message_at = timezone.now()
-            thread.save(update_fields=['status', 'last_message_at', 'updated_at'])
+            correspondence.post_message(thread, request.user, relance_text, notify=False)
             Notification.objects.create(
                 user=thread.client,
                 title='Relance du support',
@@ -1187,42 +1201,17 @@ def correspondence_thread(request, thread_id):
                     f"Vous pourrez relancer après le {next_allowed_reply_at.strftime('%d/%m/%Y %H:%M')}.")
                 return redirect('correspondence_thread', thread_id=thread.id)
 
-            CorrespondenceMessage.objects.create(
-                thread=thread,
-                author=request.user,
-                content=content,
-                attachment=attachment
-            )
-            # Mettre à jour statut + notifier
-            sender_is_thread_owner = request.user.id == thread.client_id
-            if sender_is_thread_owner:
-                thread.status = 'pending'
-                for admin in User.objects.filter(role='admin'):
-                    Notification.objects.create(
-                        user=admin,
-                        title='Nouveau message',
-                        message=f'{request.user.username} a écrit sur "{thread.subject}".',
-                        related_campaign=thread.related_campaign,
-                        related_thread=thread
-                    )
-            else:
-                thread.status = 'open'
-                Notification.objects.create(
-                    user=thread.client,
-                    title='Réponse du support',
-                    message=f'Nouvelle réponse sur votre demande "{thread.subject}".',
-                    related_campaign=thread.related_campaign,
-                    related_thread=thread
-                )
-            thread.last_message_at = timezone.now()
-            thread.save(update_fields=['status', 'last_message_at', 'updated_at'])
+            correspondence.post_message(thread, request.user, content, attachment)
 
             messages.success(request, "Message envoyé.")
             return redirect('correspondence_thread', thread_id=thread.id)
 
+    messages_qs, older_cursor = correspondence.message_window(thread, request.GET.get('before'))
     return render(request, 'spot/correspondence_thread.html', {
         'thread': thread,
-        'messages_qs': thread.messages.all(),
+        'messages_qs': messages_qs,
+        'older_cursor': older_cursor,
+        'is_older_window': bool(request.GET.get('before')),
         'can_reply_now': can_reply_now,
         'next_allowed_reply_at': next_allowed_reply_at,
         'state_code': state_code,
@@ -1253,13 +1242,13 @@ def editorial_chat_thread(request, thread_id):
     if not (getattr(u, 'is_editorial_manager', lambda: False)() or getattr(u, 'is_admin', lambda: False)() or getattr(u, 'is_staff', False)):
         messages.error(request, 'Accès réservé à la rédaction.')
         return redirect('home')
-    thread = get_object_or_404(CorrespondenceThread, id=thread_id)
+    thread = get_object_or_404(CorrespondenceThread.objects.select_related('last_message'), id=thread_id)
     if not (getattr(u, 'is_admin', lambda: False)() or getattr(u, 'is_staff', False)) and thread.client_id != u.id:
         messages.error(request, "Accès non autorisé.")
         return redirect('editorial_dashboard')
 
     now = timezone.now()
-    last_msg = thread.messages.last()
+    last_msg = thread.last_message
     can_reply_now = True
     next_allowed_reply_at = None
 
@@ -1283,14 +1272,7 @@ def editorial_chat_thread(request, thread_id):
 
         if action == 'relance' and (getattr(u, 'is_admin', lambda: False)() or getattr(u, 'is_staff', False)):
             relance_text = (request.POST.get('relance_text') or "Bonjour, nous relançons la discussion pour avancer.").strip()
-            CorrespondenceMessage.objects.create(
-                thread=thread,
-                author=u,
-                content=relance_text
-            )
-            thread.status = 'open'
-            thread.last_message_at = timezone.now()
-            thread.save(update_fields=['status', 'last_message_at', 'updated_at'])
+            correspondence.post_message(thread, u, relance_text, notify=False)
             Notification.objects.create(
                 user=thread.client,
                 title='Relance du support',
@@ -1306,40 +1288,16 @@ def editorial_chat_thread(request, thread_id):
         if not content:
             messages.error(request, "Veuillez saisir un message.")
         else:
-            CorrespondenceMessage.objects.create(
-                thread=thread,
-                author=u,
-                content=content,
-                attachment=attachment
-            )
-            sender_is_thread_owner = u.id == thread.client_id
-            if sender_is_thread_owner:
-                thread.status = 'pending'
-                for admin in User.objects.filter(role='admin'):
-                    Notification.objects.create(
-                        user=admin,
-                        title='Nouveau message',
-                        message=f'{u.username} a écrit sur "{thread.subject}".',
-                        related_campaign=thread.related_campaign,
-                        related_thread=thread
-                    )
-            else:
-                thread.status = 'open'
-                Notification.objects.create(
-                    user=thread.client,
-                    title='Réponse du support',
-                    message=f'Nouvelle réponse sur votre demande "{thread.subject}".',
-                    related_campaign=thread.related_campaign,
-                    related_thread=thread
-                )
-            thread.last_message_at = timezone.now()
-            thread.save(update_fields=['status', 'last_message_at', 'updated_at'])
+            correspondence.post_message(thread, u, content, attachment)
             messages.success(request, "Message envoyé.")
             return redirect('editorial_chat_thread', thread_id=thread.id)
 
+    messages_qs, older_cursor = correspondence.message_window(thread, request.GET.get('before'))
     return render(request, 'spot/correspondence_thread.html', {
         'thread': thread,
-        'messages_qs': thread.messages.all(),
+        'messages_qs': messages_qs,
+        'older_cursor': older_cursor,
+        'is_older_window': bool(request.GET.get('before')),
         'can_reply_now': can_reply_now,
         'next_allowed_reply_at': next_allowed_reply_at,
         'state_code': state_code,
@@ -1731,6 +1689,7 @@ def inspiration(request):
     return render(request, 'spot/inspiration.html', {'cases': cases})
 
 @login_required
+@read_only
 def report_overview(request):
     """Bilan intelligent: synthèse des campagnes sur une période (sans métriques Diffusions/Durée)."""
     start_date, end_date = _parse_period(request, default_to_current_month=True, max_span_days=365)
@@ -1776,6 +1735,7 @@ def report_overview(request):
     })
 
 @login_required
+@read_only
 def  excel_export_report(request):
     """Export Excel contenant exactement les informations du bilan (période + indicateurs + activités du mois)."""
     if Workbook is None:
@@ -1947,6 +1907,7 @@ def  excel_export_report(request):
     return response
 
 @login_required
+@read_only
 def pdf_export_report(request):
     """Export PDF contenant les informations du bilan, avec une mise en page professionnelle."""
     # Vérifier la disponibilité de reportlab
@@ -2111,6 +2072,132 @@ def pdf_export_report(request):
     request.session['export_history'] = hist[:20]
     return response
 
+
+# Grille tarifaire extraite de l'image (montants illisibles marqués « Sur devis »)
+TARIFF_SHEET = {
+    "prestations": [
+        {
+            "no": 1,
+            "label": "Confection et diffusion de petite annonce",
+            "lines": [
+                {"sub": None, "unit": "JOUR", "number": 3, "price_ttc": 35400},
+                {"sub": None, "unit": "SEMAINE", "number": 21, "price_ttc": 200000},
+                {"sub": None, "unit": "MOIS", "number": 84, "price_ttc": 600000},
+            ],
+        },
+        {
+            "no": 2,
+            "label": "Diffusion de message défilant",
+            "lines": [
+                {"sub": "Diffusion", "unit": "JOUR", "number": 1, "price_ttc": 35400},
+                {"sub": "Diffusion", "unit": "SEMAINE", "number": 21, "price_ttc": 150000},
+            ],
+        },
+        {
+            "no": 3,
+            "label": "Kosi Teedo",
+            "lines": [
+                {"sub": "Réalisation et diffusion", "unit": "SEMAINE", "number": 17, "price_ttc": 300000},
+                {"sub": "Rediffusion", "unit": "SEMAINE", "number": 17, "price_ttc": None},  # Sur devis
+                {"sub": "Diffusion (≤ 6 min)", "unit": "UNITE", "number": 1, "price_ttc": 350000},
+            ],
+        },
+        {
+            "no": 4,
+            "label": "Publireportage",
+            "lines": [
+                {"sub": "Réalisation", "unit": "UNITE", "number": 1, "price_ttc": None},  # Sur devis
+                {"sub": "Diffusion JT 13h", "unit": "UNITE", "number": 1, "price_ttc": 250000},
+                {"sub": "Diffusion JT 19h30", "unit": "UNITE", "number": 1, "price_ttc": 350000},
+            ],
+        },
+        {
+            "no": 5,
+            "label": "Passage aux émissions",
+            "lines": [
+                {"sub": "La télé s'amuse - annonce", "unit": "UNITE", "number": 1, "price_ttc": 50000},
+                {"sub": "La télé s'amuse - avec public", "unit": "UNITE", "number": 1, "price_ttc": 150000},
+            ],
+        },
+        {
+            "no": 6,
+            "label": "PAD (Diffusion)",
+            "lines": [
+                {"sub": "≤ 13 min", "unit": "UNITE", "number": 1, "price_ttc": 500000},
+                {"sub": "≤ 26 min", "unit": "UNITE", "number": 1, "price_ttc": 750000},
+                {"sub": "≤ 52 min", "unit": "UNITE", "number": 1, "price_ttc": 1000000},
+            ],
+        },
+        {
+            "no": 7,
+            "label": "Décrochage d'antenne (Réalisation)",
+            "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1590000}],
+        },
+        {
+            "no": 8,
+            "label": "Réalisation d'émission spéciale en studio BF1",
+            "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1130000}],
+        },
+        {
+            "no": 9,
+            "label": "Enregistrement d'émission spéciale hors studio à Ouaga",
+            "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1500000}],
+        },
+        {
+            "no": 10,
+            "label": "Retransmission en direct hors studio à Ouaga",
+            "lines": [{"sub": None, "unit": "HEURE", "number": 2, "price_ttc": 1100000}],  # à confirmer
+        },
+        {
+            "no": 11,
+            "label": "Retransmission en direct hors studio hors Ouaga",
+            "lines": [{"sub": None, "unit": "HEURE", "number": 2, "price_ttc": None}],  # Sur devis
+        },
+        {
+            "no": 12,
+            "label": "Le clip à la Une",
+            "lines": [
+                {"sub": "Sans message défilant", "unit": "SEMAINE", "number": 21, "price_ttc": 100000},
+                {"sub": "Avec message défilant", "unit": "SEMAINE", "number": 21, "price_ttc": 150000},
+                {"sub": "Avec 1 prestation à 'La télé s'amuse'", "unit": "SEMAINE", "number": 21, "price_ttc": None},  # Sur devis
+            ],
+        },
+        {
+            "no": 13,
+            "label": "Diffusion sur la page Facebook/YouTube",
+            "lines": [
+                {"sub": "Publireportage", "unit": "UNITE", "number": 1, "price_ttc": 150000},
+                {"sub": "Spot vidéo", "unit": "UNITE", "number": 1, "price_ttc": 50000},
+                {"sub": "Visuel", "unit": "UNITE", "number": 1, "price_ttc": 35400},
+            ],
+        },
+    ],
+    "spots": {
+        "durations": ["0 à 30 s", "31 à 60 s"],
+        "rows": [
+            {"slot": "6h – 11h", "prices": [44870, 49855], "extra_per_second_ht": 997, "cultural_price": 35400},
+            {"slot": "11h25 – 14h25", "prices": [103545, 115050], "extra_per_second_ht": 2301},
+            {"slot": "14h30 – 16h55", "prices": [51773, 57525], "extra_per_second_ht": 1150},
+            {"slot": "17h55 – 19h", "prices": [69030, 76700], "extra_per_second_ht": 1534},
+            {"slot": "Prime time 19h25 – 20h55", "prices": [103545, 115050], "extra_per_second_ht": 2301, "prime": True},
+            {"slot": "21h55 – fin", "prices": [69030, 76700], "extra_per_second_ht": 1534},
+        ],
+    },
+    "coverage": {
+        "title": "Couverture médiatique – activités ordinaires (Ouagadougou / Bobo-Dioulasso)",
+        "rows": [
+            {"label": "JT de 13h", "price": 250000},
+            {"label": "JT de 19h30", "price": 350000},
+            {"label": "Sport", "price": 150000},
+        ],
+    },
+    "premium_offer": {
+        "label": "JT 13h + JT 19h30 + Kibaye Wakato + rediffusion de chaque session",
+        "price": 500000,
+    },
+}
+
+
 def pricing_overview(request):
     """Vue de la page de tarification publique"""
     # Blocage préventif pour administrateurs
@@ -2128,135 +2215,11 @@ def pricing_overview(request):
 
     durations = [10, 15, 20, 30, 45, 60]  # affichage standard (indicatif)
 
-    # Grille tarifaire extraite de l'image (montants illisibles marqués « Sur devis »)
-    tariff_sheet = {
-        "prestations": [
-            {
-                "no": 1,
-                "label": "Confection et diffusion de petite annonce",
-                "lines": [
-                    {"sub": None, "unit": "JOUR", "number": 3, "price_ttc": 35400},
-                    {"sub": None, "unit": "SEMAINE", "number": 21, "price_ttc": 200000},
-                    {"sub": None, "unit": "MOIS", "number": 84, "price_ttc": 600000},
-                ],
-            },
-            {
-                "no": 2,
-                "label": "Diffusion de message défilant",
-                "lines": [
-                    {"sub": "Diffusion", "unit": "JOUR", "number": 1, "price_ttc": 35400},
-                    {"sub": "Diffusion", "unit": "SEMAINE", "number": 21, "price_ttc": 150000},
-                ],
-            },
-            {
-                "no": 3,
-                "label": "Kosi Teedo",
-                "lines": [
-                    {"sub": "Réalisation et diffusion", "unit": "SEMAINE", "number": 17, "price_ttc": 300000},
-                    {"sub": "Rediffusion", "unit": "SEMAINE", "number": 17, "price_ttc": None},  # Sur devis
-                    {"sub": "Diffusion (≤ 6 min)", "unit": "UNITE", "number": 1, "price_ttc": 350000},
-                ],
-            },
-            {
-                "no": 4,
-                "label": "Publireportage",
-                "lines": [
-                    {"sub": "Réalisation", "unit": "UNITE", "number": 1, "price_ttc": None},  # Sur devis
-                    {"sub": "Diffusion JT 13h", "unit": "UNITE", "number": 1, "price_ttc": 250000},
-                    {"sub": "Diffusion JT 19h30", "unit": "UNITE", "number": 1, "price_ttc": 350000},
-                ],
-            },
-            {
-                "no": 5,
-                "label": "Passage aux émissions",
-                "lines": [
-                    {"sub": "La télé s'amuse - annonce", "unit": "UNITE", "number": 1, "price_ttc": 50000},
-                    {"sub": "La télé s'amuse - avec public", "unit": "UNITE", "number": 1, "price_ttc": 150000},
-                ],
-            },
-            {
-                "no": 6,
-                "label": "PAD (Diffusion)",
-                "lines": [
-                    {"sub": "≤ 13 min", "unit": "UNITE", "number": 1, "price_ttc": 500000},
-                    {"sub": "≤ 26 min", "unit": "UNITE", "number": 1, "price_ttc": 750000},
-                    {"sub": "≤ 52 min", "unit": "UNITE", "number": 1, "price_ttc": 1000000},
-                ],
-            },
-            {
-                "no": 7,
-                "label": "Décrochage d'antenne (Réalisation)",
-                "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1590000}],
-            },
-            {
-                "no": 8,
-                "label": "Réalisation d'émission spéciale en studio BF1",
-                "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1130000}],
-            },
-            {
-                "no": 9,
-                "label": "Enregistrement d'émission spéciale hors studio à Ouaga",
-                "lines": [{"sub": None, "unit": "HEURE", "number": 1, "price_ttc": 1500000}],
-            },
-            {
-                "no": 10,
-                "label": "Retransmission en direct hors studio à Ouaga",
-                "lines": [{"sub": None, "unit": "HEURE", "number": 2, "price_ttc": 1100000}],  # à confirmer
-            },
-            {
-                "no": 11,
-                "label": "Retransmission en direct hors studio hors Ouaga",
-                "lines": [{"sub": None, "unit": "HEURE", "number": 2, "price_ttc": None}],  # Sur devis
-            },
-            {
-                "no": 12,
-                "label": "Le clip à la Une",
-                "lines": [
-                    {"sub": "Sans message défilant", "unit": "SEMAINE", "number": 21, "price_ttc": 100000},
-                    {"sub": "Avec message défilant", "unit": "SEMAINE", "number": 21, "price_ttc": 150000},
-                    {"sub": "Avec 1 prestation à 'La télé s'amuse'", "unit": "SEMAINE", "number": 21, "price_ttc": None},  # Sur devis
-                ],
-            },
-            {
-                "no": 13,
-                "label": "Diffusion sur la page Facebook/YouTube",
-                "lines": [
-                    {"sub": "Publireportage", "unit": "UNITE", "number": 1, "price_ttc": 150000},
-                    {"sub": "Spot vidéo", "unit": "UNITE", "number": 1, "price_ttc": 50000},
-                    {"sub": "Visuel", "unit": "UNITE", "number": 1, "price_ttc": 35400},
-                ],
-            },
-        ],
-        "spots": {
-            "durations": ["0 à 30 s", "31 à 60 s"],
-            "rows": [
-                {"slot": "6h – 11h", "prices": [44870, 49855], "extra_per_second_ht": 997, "cultural_price": 35400},
-                {"slot": "11h25 – 14h25", "prices": [103545, 115050], "extra_per_second_ht": 2301},
-                {"slot": "14h30 – 16h55", "prices": [51773, 57525], "extra_per_second_ht": 1150},
-                {"slot": "17h55 – 19h", "prices": [69030, 76700], "extra_per_second_ht": 1534},
-                {"slot": "Prime time 19h25 – 20h55", "prices": [103545, 115050], "extra_per_second_ht": 2301, "prime": True},
-                {"slot": "21h55 – fin", "prices": [69030, 76700], "extra_per_second_ht": 1534},
-            ],
-        },
-        "coverage": {
-            "title": "Couverture médiatique – activités ordinaires (Ouagadougou / Bobo-Dioulasso)",
-            "rows": [
-                {"label": "JT de 13h", "price": 250000},
-                {"label": "JT de 19h30", "price": 350000},
-                {"label": "Sport", "price": 150000},
-            ],
-        },
-        "premium_offer": {
-            "label": "JT 13h + JT 19h30 + Kibaye Wakato + rediffusion de chaque session",
-            "price": 500000,
-        },
-    }
-
     context = {
         'service_categories': service_categories,
         'time_slots': time_slots,
         'durations': durations,
-        'tariff_sheet': tariff_sheet
+        'tariff_sheet': TARIFF_SHEET
     }
     return render(request, 'spot/pricing_overview.html', context)
 
@@ -2302,9 +2265,9 @@ def _apply_campaign_filters(qs, request):
 
     if q:
         qs = qs.filter(
-            Q(title__icontains=q) |
-            Q(client__username__icontains=q) |
-            Q(client__company__icontains=q)
+            text_search.text_match('campaign', q) |
+            text_search.fuzzy_match('client__username', q) |
+            text_search.fuzzy_match('client__company', q)
         )
     if status:
         try:
@@ -2347,7 +2310,7 @@ def editorial_coverage_detail(request, coverage_id):
         messages.error(request, 'Accès réservé à la rédaction.')
         return redirect('home')
     coverage = get_object_or_404(CoverageRequest, id=coverage_id)
-    assignments = coverage.assignments.select_related('journalist', 'driver').order_by('-assigned_at')
+    assignments = editorial_data.coverage_assignments(coverage)
     # Simplifier: lister uniquement les disponibles pour une sélection claire
     spec = (coverage.event_type or '').lower()
     timeline = []
@@ -2356,7 +2319,7 @@ def editorial_coverage_detail(request, coverage_id):
         timeline.append({'label': 'Validée', 'at': coverage.updated_at})
     for a in assignments:
         timeline.append({'label': 'Assignation', 'at': a.assigned_at})
-        for lg in a.logs.all().order_by('at'):
+        for lg in a.sorted_logs:
             timeline.append({'label': lg.label, 'at': lg.at})
     all_journalists = Journalist.objects.all().order_by('name')
     all_drivers = Driver.objects.all().order_by('name')
@@ -2399,58 +2362,11 @@ def editorial_assign_coverage(request, coverage_id):
         if not dids and request.POST.get('driver_id'):
             dids = [request.POST.get('driver_id')]
 
-        created = []
-        jids = [x for x in jids if x]
-        dids = [x for x in dids if x]
-        if len(jids) == 1 and len(dids) == 1:
-            j = Journalist.objects.filter(id=jids[0]).first()
-            d = Driver.objects.filter(id=dids[0]).first()
-            if j and d:
-                ass = CoverageAssignment.objects.create(coverage=coverage, journalist=j, driver=d, status='assigned')
-                AssignmentLog.objects.create(assignment=ass, label='Assignation créée')
-                j.status = 'on_mission'
-                j.workload_score = (j.workload_score or 0) + 1
-                j.save(update_fields=['status', 'workload_score', 'updated_at'])
-                d.status = 'on_mission'
-                d.save(update_fields=['status', 'updated_at'])
-                created.append(ass)
-        if not created:
-            for jid in jids:
-                j = Journalist.objects.filter(id=jid).first()
-                if not j:
-                    continue
-                ass = CoverageAssignment.objects.create(coverage=coverage, journalist=j, driver=None, status='assigned')
-                AssignmentLog.objects.create(assignment=ass, label='Assignation créée')
-                j.status = 'on_mission'
-                j.workload_score = (j.workload_score or 0) + 1
-                j.save(update_fields=['status', 'workload_score', 'updated_at'])
-                created.append(ass)
-
-            for did in dids:
-                d = Driver.objects.filter(id=did).first()
-                if not d:
-                    continue
-                ass = CoverageAssignment.objects.create(coverage=coverage, journalist=None, driver=d, status='assigned')
-                AssignmentLog.objects.create(assignment=ass, label='Assignation créée')
-                d.status = 'on_mission'
-                d.save(update_fields=['status', 'updated_at'])
-                created.append(ass)
-
+        created = coverage_assignments.assign(coverage, jids, dids, user=request.user)
         if not created:
             messages.warning(request, "Aucun membre sélectionné.")
             return redirect('editorial_coverage_detail', coverage_id=coverage.id)
 
-        admins = User.objects.filter(role='admin')
-        for u in [u for u in admins] + ([request.user] if request.user else []):
-            Notification.objects.create(user=u, title='Assignation couverture', message=f"{coverage.event_title}", type='success', related_coverage=coverage)
-
-        try:
-            from .utils import create_assignment_notification_campaigns
-            for ass in created:
-                create_assignment_notification_campaigns(ass, created_by=request.user)
-        except Exception:
-            logging.getLogger('spot').error('Erreur préparation notifications assignation', exc_info=True)
-
         messages.success(request, 'Assignation effectuée.')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'ok': True, 'assignment_ids': [str(a.id) for a in created]})
@@ -2596,41 +2512,24 @@ def assignment_notify_whatsapp(request, campaign_id):
 
 @csrf_exempt
 def sms_inbound(request):
-    sender = (request.POST.get('from') or request.POST.get('From') or request.GET.get('from') or request.GET.get('From') or '').strip()
-    body = (request.POST.get('body') or request.POST.get('Body') or request.POST.get('text') or request.POST.get('message') or request.GET.get('body') or request.GET.get('Body') or request.GET.get('text') or request.GET.get('message') or '').strip()
-    m = re.search(r'\b(\d{6})\b', body or '')
-    if not m:
+    try:
+        received, batch = inbound_sms.parse(request)
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'invalid_payload'}, status=400)
+    if len(received) > inbound_sms.MAX_BATCH:
+        return JsonResponse({'ok': False, 'error': 'too_many_messages'}, status=413)
+    results = inbound_sms.ingest(received)
+    if batch:
+        return JsonResponse({'ok': True, 'results': results})
+    result = results[0]
+    if result['result'] == 'code_missing':
         return JsonResponse({'ok': False, 'error': 'code_missing'}, status=400)
-    code = m.group(1)
-    qs = AssignmentNotificationCampaign.objects.filter(
-        confirm_code=code,
-        confirmed_at__isnull=True,
-        status='active',
-    ).order_by('-created_at')
-    campaign = None
-    if sender:
-        try:
-            from .utils import normalize_phone
-            sn = normalize_phone(sender)
-            tail = ''.join(ch for ch in sn if ch.isdigit())[-8:]
-            if tail:
-                for c in qs[:25]:
-                    tp = ''.join(ch for ch in (c.to_phone or '') if ch.isdigit())[-8:]
-                    if tp and tp == tail:
-                        campaign = c
-                        break
-        except Exception:
-            campaign = None
-    if not campaign:
-        campaign = qs.first()
-    if not campaign:
+    if result['result'] == 'campaign_not_found':
         return JsonResponse({'ok': False, 'error': 'campaign_not_found'}, status=404)
-    try:
-        from .utils import confirm_assignment_notification_campaign
-        confirm_assignment_notification_campaign(campaign, via='sms')
-    except Exception:
-        logging.getLogger('spot').error('Erreur confirmation SMS assignation', exc_info=True)
-    return JsonResponse({'ok': True})
+    if result['result'] == 'error':
+        # Rien n'a été enregistré: la passerelle peut réessayer
+        return JsonResponse({'ok': False, 'error': 'confirmation_failed'}, status=500)
+    return JsonResponse({'ok': True, 'duplicate': result['duplicate']})
 
 @login_required
 def editorial_assignments(request):
@@ -2676,7 +2575,7 @@ def editorial_assignments(request):
     status = (request.GET.get('status') or '').strip()
     qs = CoverageAssignment.objects.select_related('coverage', 'journalist', 'driver')
     if q:
-        qs = qs.filter(Q(coverage__event_title__icontains=q) | Q(coverage__address__icontains=q))
+        qs = qs.filter(text_search.text_match('coverage', q, path='coverage__'))
     if jid:
         qs = qs.filter(journalist__id=jid)
     if did:
@@ -2752,7 +2651,7 @@ def editorial_planning(request):
         base = datetime.strptime(ref_str, '%Y-%m-%d').date() if ref_str else timezone.localdate()
     except Exception:
         base = timezone.localdate()
-    qs = CoverageRequest.objects.select_related('user').prefetch_related('assignments').exclude(status__in=['closed'])
+    qs = CoverageRequest.objects.exclude(status__in=['closed'])
     if view == 'day':
         target = base
         qs = qs.filter(event_date=target).order_by('start_time')
@@ -2767,21 +2666,7 @@ def editorial_planning(request):
         start_week = base - timezone.timedelta(days=base.weekday())
         end_week = start_week + timezone.timedelta(days=7)
         qs = qs.filter(event_date__gte=start_week, event_date__lt=end_week).order_by('event_date', 'start_time')
-    items = []
-    for cv in qs:
-        ass = cv.assignments.order_by('-assigned_at').first()
-        items.append({
-            'id': str(cv.id),
-            'title': cv.event_title,
-            'date': cv.event_date,
-            'time': cv.start_time,
-            'type': cv.event_type,
-            'address': cv.address,
-            'journalist': getattr(ass, 'journalist', None).name if ass and ass.journalist else '',
-            'driver': getattr(ass, 'driver', None).name if ass and ass.driver else '',
-            'status': cv.status,
-            'detail_url': reverse('editorial_coverage_detail', args=[cv.id]),
-        })
+    items = editorial_data.planning_items(qs)
     week_days = [start_week + timezone.timedelta(days=i) for i in range(7)] if view == 'week' else []
     # Navigation dates
     if view == 'day':
@@ -2835,7 +2720,7 @@ def editorial_planning_move(request):
     coverage.event_date = nd
     coverage.start_time = nt
     coverage.save(update_fields=['event_date', 'start_time', 'updated_at'])
-    ass = coverage.assignments.order_by('-assigned_at').first()
+    ass = editorial_data.latest_assignment(coverage)
     if ass:
         AssignmentLog.objects.create(assignment=ass, label='Planning déplacé')
     return JsonResponse({'ok': True})
@@ -2850,9 +2735,9 @@ def editorial_coverages(request):
     status = (request.GET.get('status') or '').strip() or 'validated'
     sort = (request.GET.get('sort') or 'date_desc').strip()
     page = request.GET.get('page')
-    qs = CoverageRequest.objects.all().prefetch_related('assignments')
+    qs = CoverageRequest.objects.all()
     if q:
-        qs = qs.filter(Q(event_title__icontains=q) | Q(address__icontains=q) | Q(description__icontains=q))
+        qs = qs.filter(text_search.text_match('coverage', q))
     if status:
         if status == 'validated':
             qs = qs.filter(status__in=['review', 'scheduled'])
@@ -2864,7 +2749,7 @@ def editorial_coverages(request):
         qs = qs.order_by('-event_date', '-start_time')
 
     # N'afficher que les couvertures non assignées sur la page Couvertures
-    qs = qs.annotate(assign_count=Count('assignments')).filter(assign_count=0)
+    qs = editorial_data.unassigned(qs)
     paginator = Paginator(qs, 24)
     page_obj = paginator.get_page(page)
 
@@ -2891,9 +2776,10 @@ def editorial_coverages(request):
             }
         })
 
-    status_counts = CoverageRequest.objects.values('status').annotate(count=Count('status'))
-    counts = {item['status']: item['count'] for item in status_counts}
-    inbox_items = CoverageRequest.objects.annotate(assign_count=Count('assignments')).filter(assign_count=0, status__in=['new','review']).order_by('event_date','start_time')[:12]
+    counts = editorial_data.status_counts()
+    inbox_items = editorial_data.unassigned(
+        CoverageRequest.objects.filter(status__in=['new', 'review'])
+    ).order_by('event_date', 'start_time')[:12]
     available_journalists = Journalist.objects.all().order_by('name')
     available_drivers = Driver.objects.all().order_by('name')
     return render(request, 'editorial/coverages.html', {
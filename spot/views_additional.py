@@ -11,12 +11,13 @@ from django.http import JsonResponse
 from django.urls import reverse
 from decimal import Decimal
 
-from .models import User, Campaign, Spot, CoverageRequest, TimeSlot, PricingRule
+from .models import User, Campaign, Spot, CoverageRequest, TimeSlot
 from .models import CorrespondenceThread
 from .services.chatbot import LocalLLMResponder, ChatMemory, append_persistent_memory
 from .services.nlu import detect_intent, build_actions, guide_message
 from .services.kb import search as kb_search
 from .services.logs import log_unresolved
+from .services import moderation, pricing
 from .forms import CampaignForm, SpotForm, CostSimulatorForm
 
 
@@ -240,13 +241,8 @@ def cost_simulator(request):
             return redirect('home')
     except Exception:
         return redirect('home')
-    tax_rate = Decimal('0.18')
     time_slots = TimeSlot.objects.filter(is_active=True).order_by('start_time')
-    pricing_rules = list(
-        PricingRule.objects.filter(is_active=True)
-        .order_by('duration_min')
-        .values('duration_min', 'duration_max', 'base_price')
-    )
+    pricing_rules = pricing.rules_for_display()
 
     estimated_cost = None
     calculation_details = None
@@ -254,33 +250,12 @@ def cost_simulator(request):
     if request.method == 'POST':
         form = CostSimulatorForm(request.POST)
         if form.is_valid():
-            duration = form.cleaned_data['duration']
-            time_slot = form.cleaned_data['time_slot']
-            broadcast_count = form.cleaned_data['broadcast_count']
-
-            base_price = None
-            for r in pricing_rules:
-                if r['duration_min'] <= duration <= r['duration_max']:
-                    base_price = Decimal(str(r['base_price']))
-                    break
-            if base_price is None:
-                base_price = Decimal('1000')
-
-            time_multiplier = time_slot.price_multiplier
-            subtotal = base_price * Decimal(duration) * Decimal(time_multiplier) * Decimal(broadcast_count)
-            tax_amount = subtotal * tax_rate
-            total = subtotal + tax_amount
-
-            estimated_cost = total
-            calculation_details = {
-                'duration': duration,
-                'base_price': base_price,
-                'time_multiplier': time_multiplier,
-                'broadcast_count': broadcast_count,
-                'subtotal': subtotal,
-                'tax': tax_amount,
-                'total': total,
-            }
+            calculation_details = pricing.breakdown(
+                form.cleaned_data['duration'],
+                form.cleaned_data['time_slot'],
+                form.cleaned_data['broadcast_count'],
+            )
+            estimated_cost = calculation_details['total']
     else:
         form = CostSimulatorForm()
 
@@ -291,13 +266,45 @@ def cost_simulator(request):
             'form': form,
             'time_slots': time_slots,
             'pricing_rules': pricing_rules,
-            'tax_rate': tax_rate,
+            'tax_rate': pricing.TAX_RATE,
             'estimated_cost': estimated_cost,
             'calculation_details': calculation_details,
         },
     )
 
 
+@login_required
+@require_POST
+def pricing_quote_api(request):
+    """Devis groupés: {"scenarios": [{"duration": 30, "time_slot": 1, "broadcast_count": 10}, ...]}.
+
+    Montants renvoyés en chaînes décimales (pas d'arrondi flottant).
+    """
+    import json
+
+    try:
+        data = json.loads(request.body.decode('utf-8') or '{}')
+        raw = data.get('scenarios') or []
+        if not isinstance(raw, list):
+            raise ValueError
+        scenarios = [
+            (int(item['duration']), int(item['time_slot']), int(item.get('broadcast_count', 1)))
+            for item in raw[:pricing.MAX_BATCH]
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'ok': False, 'error': 'invalid_payload'}, status=400)
+    if any(d <= 0 or c <= 0 for d, _, c in scenarios):
+        return JsonResponse({'ok': False, 'error': 'invalid_payload'}, status=400)
+    try:
+        quotes = [
+            {key: str(value) if isinstance(value, Decimal) else value for key, value in quote.items()}
+            for quote in pricing.quote_many(scenarios)
+        ]
+    except pricing.UnknownTimeSlot as exc:
+        return JsonResponse({'ok': False, 'error': exc.code, 'time_slots': exc.ids}, status=400)
+    return JsonResponse({'ok': True, 'tax_rate': str(pricing.TAX_RATE), 'quotes': quotes})
+
+
 # Vue notifications dupliquée migrée dans views.py — supprimée pour éviter la confusion
 
 
@@ -424,15 +431,7 @@ def admin_campaign_reject(request):
         if not rejection_reason:
             messages.error(request, 'Veuillez fournir une raison de rejet.')
         else:
-            updated = 0
-            for campaign in campaigns:
-                if campaign.status == 'pending':
-                    campaign.status = 'rejected'
-                    campaign.approved_by = request.user
-                    campaign.approved_at = timezone.now()
-                    campaign.rejection_reason = rejection_reason
-                    campaign.save()
-                    updated += 1
+            updated = moderation.reject_campaigns(campaigns, request.user, rejection_reason)
             
             if updated > 0:
                 messages.success(request, f'{updated} campagne(s) rejetée(s) avec succès.')
@@ -462,15 +461,7 @@ def admin_spot_reject(request):
         if not rejection_reason:
             messages.error(request, 'Veuillez fournir une raison de rejet.')
         else:
-            updated = 0
-            for spot in spots:
-                if spot.status == 'pending':
-                    spot.status = 'rejected'
-                    spot.approved_by = request.user
-                    spot.approved_at = timezone.now()
-                    spot.rejection_reason = rejection_reason
-                    spot.save()
-                    updated += 1
+            updated = moderation.reject_spots(spots, request.user, rejection_reason)
             
             if updated > 0:
                 messages.success(request, f'{updated} spot(s) rejeté(s) avec succès.')
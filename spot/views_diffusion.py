@@ -12,7 +12,8 @@ from django.template.loader import render_to_string
 from django.contrib import messages
 from django.db import transaction
 from django.db import IntegrityError
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils.cache import get_conditional_response
 from django.utils.dateparse import parse_date
 from django.utils.timezone import timedelta as tz_timedelta
 import csv
@@ -27,7 +28,17 @@ try:
 except Exception:
     SimpleDocTemplate = None
 
-from .models import Spot, SpotSchedule, Campaign, Notification, CampaignHistory, TimeSlot, CorrespondenceThread, CorrespondenceMessage
+from .models import Spot, SpotSchedule, Notification, CampaignHistory, TimeSlot, CorrespondenceThread, CorrespondenceMessage
+from .db_router import read_only
+from .pagination import KeysetPaginator
+from .services import search
+from .services import typeahead
+from .services import planning as planning_events
+from .services import pricing
+from .services import correspondence
+from .services import inventory
+from .services import progress
+from .services import recurrence
 try:
     from channels.layers import get_channel_layer
     from asgiref.sync import async_to_sync
@@ -93,12 +104,13 @@ def _parse_lenient_time(s):
         return None
 
 
-def _ensure_active_timeslot(selected_slot=None, candidate_time=None):
+def _ensure_active_timeslot(selected_slot=None, candidate_time=None, create=True):
     """Retourne un TimeSlot actif. Crée un créneau par défaut si aucun n'existe.
     - Si selected_slot est fourni, le retourne.
     - Sinon, tente de trouver un TimeSlot actif contenant candidate_time.
     - À défaut, retourne le premier TimeSlot actif.
-    - Si aucun TimeSlot n'existe, crée un créneau par défaut couvrant la journée.
+    - Si aucun TimeSlot n'existe, crée un créneau par défaut couvrant la journée
+      (non enregistré si create=False, pour un aperçu sans écriture).
     """
     if selected_slot:
         return selected_slot
@@ -114,7 +126,7 @@ def _ensure_active_timeslot(selected_slot=None, candidate_time=None):
     # Aucun créneau: créer un par défaut
     default_start = datetime.strptime('00:00', '%H:%M').time()
     default_end = datetime.strptime('23:59', '%H:%M').time()
-    return TimeSlot.objects.create(
+    slot = TimeSlot(
         name='Général',
         start_time=default_start,
         end_time=default_end,
@@ -123,42 +135,35 @@ def _ensure_active_timeslot(selected_slot=None, candidate_time=None):
         is_active=True,
         is_prime=False
     )
+    if create:
+        slot.save()
+    return slot
 
 
-def _planning_item_payload(sched: SpotSchedule):
-    try:
-        return {
-            'id': str(sched.id),
-            'date_iso': sched.broadcast_date.isoformat(),
-            'time_iso': sched.broadcast_time.strftime('%H:%M:%S'),
-            'date_str': sched.broadcast_date.strftime('%d/%m/%Y'),
-            'time_str': sched.broadcast_time.strftime('%H:%M'),
-            'title': getattr(sched.spot, 'title', ''),
-            'client': getattr(getattr(sched.spot, 'campaign', None), 'client', None) and getattr(sched.spot.campaign.client, 'username', '') or '',
-            'media_type': getattr(sched.spot, 'media_type', ''),
-            'duration_seconds': getattr(sched.spot, 'duration_seconds', None),
-            'spot_id': str(getattr(sched.spot, 'id', '')),
-            'has_media': bool(getattr(sched.spot, 'video_file', None) or getattr(sched.spot, 'image_file', None)),
-            'is_broadcasted': bool(getattr(sched, 'is_broadcasted', False)),
-        }
-    except Exception:
-        return {'id': str(getattr(sched, 'id', '')), 'date_iso': '', 'time_iso': '', 'title': getattr(getattr(sched, 'spot', None), 'title', '')}
+def _slot_full_response(request, slot, day, seconds, as_json=False):
+    """Réponse d'erreur si `seconds` d'antenne ne tiennent plus dans `slot` ce jour-là."""
+    if not slot or inventory.fits(slot, day, seconds):
+        return None
+    if as_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'ok': False,
+            'error': 'slot_full',
+            'remaining_seconds': inventory.remaining(slot, day),
+        }, status=409)
+    messages.error(request, f"Créneau « {slot.name} » complet le {day:%d/%m/%Y}.")
+    return redirect('diffusion_spots')
 
 
-def _emit_planning_upsert(sched: SpotSchedule):
-    try:
-        layer = get_channel_layer()
-        if not layer:
-            return
-        payload = _planning_item_payload(sched)
-        async_to_sync(layer.group_send)('planning_updates', {
-            'type': 'planning_update',
-            'action': 'upsert',
-            'item': payload,
-        })
-    except Exception:
-        # silencieux pour ne pas bloquer la réponse HTTP
-        pass
+_planning_item_payload = planning_events.item_payload
+
+
+def _emit_planning_upsert(sched: SpotSchedule, previous_date=None):
+    """Journalise la mise à jour dans la transaction courante (boîte d'envoi).
+
+    À appeler dans le bloc atomique de la modification: la diffusion aux
+    écrans Planning est faite par le relais, après validation.
+    """
+    planning_events.record(sched, 'upsert', previous_date=previous_date)
 
 
 def _base_context(user):
@@ -186,7 +191,7 @@ def home(request):
     today = timezone.localdate()
     # KPI
     spots_today_count = SpotSchedule.objects.filter(broadcast_date=today).count()
-    late_spots_count = SpotSchedule.objects.filter(broadcast_date__lt=today, is_broadcasted=False).count()
+    late_spots_count = progress.totals()['late']
     start_week = today - timezone.timedelta(days=today.weekday())
     week_days = [start_week + timezone.timedelta(days=i) for i in range(7)]
     week_counts = {
@@ -361,62 +366,74 @@ def spots_list(request):
             qs = qs.filter(duration_seconds=int(duration))
         except ValueError:
             pass
-    # Filtre par date (aujourd'hui/demain/semaine/mois ou personnalisé)
+    # Filtre par date (aujourd'hui/demain/semaine/mois ou personnalisé):
+    # sous-requêtes corrélées plutôt qu'une jointure sur schedules + DISTINCT
     date_range = (request.GET.get('date') or '').lower()
     today = timezone.localdate()
+    window = SpotSchedule.objects.filter(spot=OuterRef('pk'))
+    date_filtered = True
     if date_range == 'today':
-        qs = qs.filter(schedules__broadcast_date=today)
+        window = window.filter(broadcast_date=today)
     elif date_range == 'tomorrow':
-        qs = qs.filter(schedules__broadcast_date=today + timezone.timedelta(days=1))
+        window = window.filter(broadcast_date=today + timezone.timedelta(days=1))
     elif date_range == 'week':
         start_week = today - timezone.timedelta(days=today.weekday())
         end_week = start_week + timezone.timedelta(days=7)
-        qs = qs.filter(schedules__broadcast_date__gte=start_week, schedules__broadcast_date__lt=end_week)
+        window = window.filter(broadcast_date__gte=start_week, broadcast_date__lt=end_week)
     elif date_range == 'month':
         start_month = today.replace(day=1)
         if start_month.month == 12:
             next_month = start_month.replace(year=start_month.year+1, month=1)
         else:
             next_month = start_month.replace(month=start_month.month+1)
-        qs = qs.filter(schedules__broadcast_date__gte=start_month, schedules__broadcast_date__lt=next_month)
+        window = window.filter(broadcast_date__gte=start_month, broadcast_date__lt=next_month)
     elif date_range == 'custom':
         date_from = request.GET.get('date_from')
         date_to = request.GET.get('date_to')
+        date_filtered = False
         try:
             if date_from:
                 df = timezone.datetime.fromisoformat(date_from).date()
-                qs = qs.filter(schedules__broadcast_date__gte=df)
+                window = window.filter(broadcast_date__gte=df)
+                date_filtered = True
             if date_to:
                 dt = timezone.datetime.fromisoformat(date_to).date()
-                qs = qs.filter(schedules__broadcast_date__lte=dt)
+                window = window.filter(broadcast_date__lte=dt)
+                date_filtered = True
         except Exception:
             pass
+    else:
+        date_filtered = False
 
-    qs = qs.distinct()
-    # Tri
-    sort = (request.GET.get('sort') or '').strip()
-    if sort == 'campaign_start_desc':
-        qs = qs.order_by('-campaign__start_date', '-campaign__end_date', '-created_at')
-    elif sort == 'campaign_start_asc':
-        qs = qs.order_by('campaign__start_date', 'campaign__end_date', 'created_at')
-    elif sort == 'next_broadcast_desc':
-        qs = qs.order_by('-schedules__broadcast_date', '-schedules__broadcast_time', '-created_at')
-    elif sort == 'next_broadcast_asc':
-        qs = qs.order_by('schedules__broadcast_date', 'schedules__broadcast_time', 'created_at')
-    elif sort == 'client_asc':
-        qs = qs.order_by('campaign__client__username', 'created_at')
-    elif sort == 'client_desc':
-        qs = qs.order_by('-campaign__client__username', '-created_at')
-    elif sort == 'date_desc':
-        qs = qs.order_by('-created_at')
-    elif sort == 'date_asc':
-        qs = qs.order_by('created_at')
+    if date_filtered:
+        qs = qs.filter(Exists(window))
     else:
-        # Par défaut: prioriser les campagnes qui débutent le plus tôt
-        qs = qs.order_by('campaign__start_date', 'campaign__end_date', 'created_at')
+        # Sans filtre de date, la prochaine diffusion est la première à venir
+        window = window.filter(broadcast_date__gte=today)
+    # Prochaine diffusion (dans la fenêtre filtrée): tri et affichage sans jointure
+    next_schedule = window.order_by('broadcast_date', 'broadcast_time')
+    qs = qs.annotate(
+        next_broadcast_date=Subquery(next_schedule.values('broadcast_date')[:1]),
+        next_broadcast_time=Subquery(next_schedule.values('broadcast_time')[:1]),
+    )
+
+    # Tri (clé de pagination par curseur)
+    sort = (request.GET.get('sort') or '').strip()
+    orderings = {
+        'campaign_start_desc': ('-campaign__start_date', '-campaign__end_date', '-created_at'),
+        'campaign_start_asc': ('campaign__start_date', 'campaign__end_date', 'created_at'),
+        'next_broadcast_desc': ('-next_broadcast_date', '-next_broadcast_time', '-created_at'),
+        'next_broadcast_asc': ('next_broadcast_date', 'next_broadcast_time', 'created_at'),
+        'client_asc': ('campaign__client__username', 'created_at'),
+        'client_desc': ('-campaign__client__username', '-created_at'),
+        'date_desc': ('-created_at',),
+        'date_asc': ('created_at',),
+    }
+    # Par défaut: prioriser les campagnes qui débutent le plus tôt
+    ordering = orderings.get(sort, ('campaign__start_date', 'campaign__end_date', 'created_at'))
 
-    paginator = Paginator(qs, 10)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    paginator = KeysetPaginator(qs, ordering, per_page=10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     ctx = _base_context(request.user)
     ctx.update({
@@ -427,7 +444,7 @@ def spots_list(request):
     return render(request, 'spot/diffusion/spots.html', ctx)
 
 
-def _filter_broadcasted_schedules(request):
+def _filter_broadcasted_schedules(request, with_ordering=False):
     """Construit le queryset des programmations diffusées avec filtres communs."""
     qs = SpotSchedule.objects.select_related('spot__campaign', 'time_slot').filter(is_broadcasted=True)
 
@@ -435,9 +452,9 @@ def _filter_broadcasted_schedules(request):
     q = (request.GET.get('q') or '').strip()
     if q:
         qs = qs.filter(
-            Q(spot__title__icontains=q) |
-            Q(spot__campaign__title__icontains=q) |
-            Q(spot__campaign__client__username__icontains=q)
+            search.text_match('spot', q, path='spot__') |
+            search.text_match('campaign', q, path='spot__campaign__') |
+            search.fuzzy_match('spot__campaign__client__username', q)
         )
 
     # Client
@@ -481,26 +498,24 @@ def _filter_broadcasted_schedules(request):
 
     # Tri
     sort = (request.GET.get('sort') or '').strip()
-    if sort == 'date_asc':
-        qs = qs.order_by('broadcast_date', 'broadcast_time')
-    elif sort == 'date_desc':
-        qs = qs.order_by('-broadcast_date', '-broadcast_time')
-    elif sort == 'client_asc':
-        qs = qs.order_by('spot__campaign__client__username', 'broadcast_date', 'broadcast_time')
-    elif sort == 'client_desc':
-        qs = qs.order_by('-spot__campaign__client__username', '-broadcast_date', '-broadcast_time')
-    else:
-        qs = qs.order_by('-broadcast_date', '-broadcast_time')
+    ordering = {
+        'date_asc': ('broadcast_date', 'broadcast_time', 'id'),
+        'date_desc': ('-broadcast_date', '-broadcast_time', 'id'),
+        'client_asc': ('spot__campaign__client__username', 'broadcast_date', 'broadcast_time', 'id'),
+        'client_desc': ('-spot__campaign__client__username', '-broadcast_date', '-broadcast_time', 'id'),
+    }.get(sort, ('-broadcast_date', '-broadcast_time', 'id'))
 
-    return qs
+    if with_ordering:
+        return qs, ordering
+    return qs.order_by(*ordering)
 
 
 @login_required
 def spots_broadcasted_list(request):
     """Vue: liste des spots diffusés (basée sur SpotSchedule.is_broadcasted)"""
-    qs = _filter_broadcasted_schedules(request)
-    paginator = Paginator(qs, 15)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    qs, ordering = _filter_broadcasted_schedules(request, with_ordering=True)
+    paginator = KeysetPaginator(qs, ordering, per_page=15)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     ctx = _base_context(request.user)
     ctx.update({
@@ -512,6 +527,7 @@ def spots_broadcasted_list(request):
 
 
 @login_required
+@read_only
 def export_spots_broadcasted_pdf(request):
     """Export PDF des spots diffusés. Téléchargement immédiat d'un document professionnel.
 
@@ -586,15 +602,17 @@ def export_spots_broadcasted_pdf(request):
 
 @login_required
 def clients_search_api(request):
-    """Recherche prédictive de clients (username)"""
-    q = (request.GET.get('q') or '').strip()
-    results = []
-    if q:
-        clients = Campaign.objects.select_related('client').filter(client__username__icontains=q)[:8]
-        for c in clients:
-            if getattr(c, 'client', None):
-                results.append({'username': c.client.username})
-    return JsonResponse({'results': results})
+    """Recherche prédictive de clients (identifiant, société, téléphone)"""
+    q = (request.GET.get('q') or '').strip()[:64]
+    version = typeahead.current_version()
+    etag = typeahead.etag(q, version)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    resp = JsonResponse({'results': typeahead.search(q, version=version)})
+    resp['ETag'] = etag
+    resp['Cache-Control'] = 'private, no-cache'
+    return resp
 
 
 @login_required
@@ -615,7 +633,15 @@ def mark_spot_broadcasted(request, spot_id):
                 schedules_qs = SpotSchedule.objects.select_for_update().filter(
                     spot=spot_locked, broadcast_date__lte=today, is_broadcasted=False
                 )
+                confirmed = list(schedules_qs)
                 updated_count = schedules_qs.update(is_broadcasted=True, broadcasted_at=timezone.now())
+                before = [progress.state(sched, spot_locked) for sched in confirmed]
+                for sched in confirmed:
+                    sched.spot = spot_locked
+                    sched.is_broadcasted = True
+                # QuerySet.update n'émet pas de signaux: compteurs ajustés en bloc
+                progress.apply(zip(before, [progress.state(sched) for sched in confirmed]))
+                planning_events.record_many(confirmed)
 
                 if updated_count > 0:
                     spot_locked.status = 'broadcasted'
@@ -693,17 +719,14 @@ def planning_confirm_broadcast(request):
                 user=request.user,
             )
 
+            # Mise à jour temps réel, publiée après validation
+            _emit_planning_upsert(locked_sched)
+
     except Exception as e:
         import logging
         logging.getLogger('bf1tv').exception('PLANNING_CONFIRM_BROADCAST_ERROR sched=%s err=%s', str(sid), str(e))
         return JsonResponse({'ok': False, 'error': 'server_error'}, status=500)
 
-    # Émettre update temps réel
-    try:
-        _emit_planning_upsert(locked_sched)
-    except Exception:
-        pass
-
     return JsonResponse({'ok': True, 'item': _planning_item_payload(locked_sched)})
 
 
@@ -764,16 +787,12 @@ def planning_undo_broadcast(request):
                 description=f"Annulation de confirmation pour '{locked_spot.title}' — {locked_sched.broadcast_date} {locked_sched.broadcast_time}",
                 user=request.user,
             )
+            _emit_planning_upsert(locked_sched)
     except Exception as e:
         import logging
         logging.getLogger('bf1tv').exception('PLANNING_UNDO_BROADCAST_ERROR sched=%s err=%s', str(sid), str(e))
         return JsonResponse({'ok': False, 'error': 'server_error'}, status=500)
 
-    try:
-        _emit_planning_upsert(locked_sched)
-    except Exception:
-        pass
-
     return JsonResponse({'ok': True, 'item': _planning_item_payload(locked_sched)})
 
 
@@ -844,81 +863,89 @@ def notify_broadcast_time(request, spot_id):
             except (ValueError, TimeSlot.DoesNotExist):
                 selected_slot = None
 
-        if next_sched:
-            # Mise à jour d'une programmation existante
-            if new_date:
-                next_sched.broadcast_date = new_date
-            if new_time:
-                next_sched.broadcast_time = new_time
-            # Déduire un créneau si utile (informative), mais ne pas bloquer
-            final_time = next_sched.broadcast_time or new_time
-            selected_slot = _ensure_active_timeslot(selected_slot, final_time)
-            fields = ['broadcast_date', 'broadcast_time']
-            if selected_slot and (not next_sched.time_slot_id or next_sched.time_slot_id != selected_slot.id):
-                # Conflit éventuel uniquement si on change le créneau et que même (date, heure) existe
-                if (getattr(next_sched, 'broadcast_date', None) and getattr(next_sched, 'broadcast_time', None)):
-                    exists_conflict = SpotSchedule.objects.filter(
-                        time_slot=selected_slot,
-                        broadcast_date=next_sched.broadcast_date,
-                        broadcast_time=next_sched.broadcast_time
-                    ).exclude(id=next_sched.id).exists()
-                    if exists_conflict:
-                        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                            return JsonResponse({'ok': False, 'error': 'schedule_conflict'}, status=409)
-                        messages.error(request, "Conflit de programmation: un créneau existe déjà pour cette date et cette heure.")
-                        return redirect('diffusion_spots')
-                next_sched.time_slot = selected_slot
-                fields.append('time_slot')
-            next_sched.save(update_fields=fields)
-        else:
-            # Création d'une première programmation à la volée
-            if not (new_date_str and new_time_str):
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return JsonResponse({'ok': False, 'error': 'missing_datetime'}, status=400)
-                messages.error(request, "Renseignez la date et l'heure.")
-                return redirect('diffusion_spots')
-            # Si parsing non concluant, on prend des valeurs par défaut non bloquantes
-            if not new_date:
-                new_date = timezone.localdate()
-            if not new_time:
-                new_time = datetime.strptime('00:00', '%H:%M').time()
-            selected_slot = _ensure_active_timeslot(selected_slot, new_time)
-            # Prix par défaut; à raffiner via PricingRule si nécessaire
-            price = Decimal('0')
-            try:
-                next_sched = SpotSchedule.objects.create(
-                    spot=spot,
-                    time_slot=selected_slot,
-                    broadcast_date=new_date,
-                    broadcast_time=new_time,
-                    price=price,
-                    is_broadcasted=False,
-                )
-            except IntegrityError:
-                # Conflit d'unicité (time_slot, date, heure)
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return JsonResponse({'ok': False, 'error': 'schedule_conflict'}, status=409)
-                messages.error(request, "Conflit de programmation: un créneau existe déjà pour cette date et cette heure.")
-                return redirect('diffusion_spots')
-
-        if new_duration_str:
-            try:
-                spot.duration_seconds = int(new_duration_str)
-                spot.save(update_fields=['duration_seconds'])
-            except ValueError:
-                # Ne pas bloquer la confirmation si la durée est invalide: ignorer la mise à jour
-                pass
+        # Programmation, statut du spot et événement Planning: tout ou rien
+        with transaction.atomic():
+            previous_date = None
+            if next_sched:
+                # Mise à jour d'une programmation existante
+                previous_date = next_sched.broadcast_date
+                previous_slot_id = next_sched.time_slot_id
+                if new_date:
+                    next_sched.broadcast_date = new_date
+                if new_time:
+                    next_sched.broadcast_time = new_time
+                # Déduire un créneau si utile (informative), mais ne pas bloquer
+                final_time = next_sched.broadcast_time or new_time
+                selected_slot = _ensure_active_timeslot(selected_slot, final_time)
+                fields = ['broadcast_date', 'broadcast_time']
+                if selected_slot and (not next_sched.time_slot_id or next_sched.time_slot_id != selected_slot.id):
+                    # Conflit éventuel uniquement si on change le créneau et que même (date, heure) existe
+                    if (getattr(next_sched, 'broadcast_date', None) and getattr(next_sched, 'broadcast_time', None)):
+                        exists_conflict = SpotSchedule.objects.filter(
+                            time_slot=selected_slot,
+                            broadcast_date=next_sched.broadcast_date,
+                            broadcast_time=next_sched.broadcast_time
+                        ).exclude(id=next_sched.id).exists()
+                        if exists_conflict:
+                            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                                return JsonResponse({'ok': False, 'error': 'schedule_conflict'}, status=409)
+                            messages.error(request, "Conflit de programmation: un créneau existe déjà pour cette date et cette heure.")
+                            return redirect('diffusion_spots')
+                    next_sched.time_slot = selected_slot
+                    fields.append('time_slot')
+                if (next_sched.time_slot_id, next_sched.broadcast_date) != (previous_slot_id, previous_date):
+                    full = _slot_full_response(request, next_sched.time_slot, next_sched.broadcast_date, spot.duration_seconds)
+                    if full:
+                        return full
+                next_sched.save(update_fields=fields)
+            else:
+                # Création d'une première programmation à la volée
+                if not (new_date_str and new_time_str):
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return JsonResponse({'ok': False, 'error': 'missing_datetime'}, status=400)
+                    messages.error(request, "Renseignez la date et l'heure.")
+                    return redirect('diffusion_spots')
+                # Si parsing non concluant, on prend des valeurs par défaut non bloquantes
+                if not new_date:
+                    new_date = timezone.localdate()
+                if not new_time:
+                    new_time = datetime.strptime('00:00', '%H:%M').time()
+                selected_slot = _ensure_active_timeslot(selected_slot, new_time)
+                full = _slot_full_response(request, selected_slot, new_date, spot.duration_seconds)
+                if full:
+                    return full
+                price = pricing.unit_price(spot.duration_seconds, selected_slot)
+                try:
+                    with transaction.atomic():
+                        next_sched = SpotSchedule.objects.create(
+                            spot=spot,
+                            time_slot=selected_slot,
+                            broadcast_date=new_date,
+                            broadcast_time=new_time,
+                            price=price,
+                            is_broadcasted=False,
+                        )
+                except IntegrityError:
+                    # Conflit d'unicité (time_slot, date, heure)
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return JsonResponse({'ok': False, 'error': 'schedule_conflict'}, status=409)
+                    messages.error(request, "Conflit de programmation: un créneau existe déjà pour cette date et cette heure.")
+                    return redirect('diffusion_spots')
 
-        # Mettre à jour le statut du spot
-        spot.status = 'scheduled'
-        spot.save(update_fields=['status'])
+            if new_duration_str:
+                try:
+                    spot.duration_seconds = int(new_duration_str)
+                    spot.save(update_fields=['duration_seconds'])
+                except ValueError:
+                    # Ne pas bloquer la confirmation si la durée est invalide: ignorer la mise à jour
+                    pass
 
-        # Émettre mise à jour pour la page Planning (déclassement automatique)
-        try:
+            # Mettre à jour le statut du spot
+            # Émettre mise à jour pour la page Planning (déclassement automatique)
+            spot.status = 'scheduled'
+            spot.save(update_fields=['status'])
             if next_sched:
-                _emit_planning_upsert(next_sched)
-        except Exception:
-            pass
+                _emit_planning_upsert(next_sched, previous_date=previous_date)
 
         # Historiser l'action
         CampaignHistory.objects.create(
@@ -1149,13 +1176,13 @@ def diffusion_support_chat(request):
 @login_required
 def diffusion_chat_thread(request, thread_id):
     u = request.user
-    thread = get_object_or_404(CorrespondenceThread, id=thread_id)
+    thread = get_object_or_404(CorrespondenceThread.objects.select_related('last_message'), id=thread_id)
     if thread.client_id != u.id:
         messages.error(request, "Accès non autorisé.")
         return redirect('diffusion_home')
 
     now = timezone.now()
-    last_msg = thread.messages.last()
+    last_msg = thread.last_message
     can_reply_now = True
     next_allowed_reply_at = None
 
@@ -1182,30 +1209,17 @@ def diffusion_chat_thread(request, thread_id):
         if not content:
             messages.error(request, "Veuillez saisir un message.")
         else:
-            CorrespondenceMessage.objects.create(
-                thread=thread,
-                author=u,
-                content=content,
-                attachment=attachment
-            )
-            thread.status = 'pending'
-            for admin in get_user_model().objects.filter(role='admin'):
-                Notification.objects.create(
-                    user=admin,
-                    title='Nouveau message',
-                    message=f'{u.username} a écrit sur "{thread.subject}".',
-                    related_campaign=thread.related_campaign,
-                    related_thread=thread
-                )
-            thread.last_message_at = timezone.now()
-            thread.save(update_fields=['status', 'last_message_at', 'updated_at'])
+            correspondence.post_message(thread, u, content, attachment)
 
             messages.success(request, "Message envoyé.")
             return redirect('diffusion_chat_thread', thread_id=thread.id)
 
+    messages_qs, older_cursor = correspondence.message_window(thread, request.GET.get('before'))
     return render(request, 'spot/correspondence_thread.html', {
         'thread': thread,
-        'messages_qs': thread.messages.all(),
+        'messages_qs': messages_qs,
+        'older_cursor': older_cursor,
+        'is_older_window': bool(request.GET.get('before')),
         'can_reply_now': can_reply_now,
         'next_allowed_reply_at': next_allowed_reply_at,
         'state_code': state_code,
@@ -1216,14 +1230,17 @@ def diffusion_chat_thread(request, thread_id):
 
 @login_required
 def bulk_schedule_spot(request, spot_id):
-    """Création de programmations multiples pour un spot (plage de dates et jours).
+    """Création de programmations multiples pour un spot (règle de récurrence).
 
     Champs attendus (POST):
     - start_date (YYYY-MM-DD)
-    - end_date (YYYY-MM-DD)
-    - broadcast_time (HH:MM)
+    - end_date (YYYY-MM-DD) et/ou count (nombre de diffusions)
+    - broadcast_time (HH:MM) ou broadcast_times (CSV: 08:00,12:30)
     - days (liste CSV parmi: mon,tue,wed,thu,fri,sat,sun) optionnel, par défaut tous les jours
+    - exclude_dates (CSV: 2030-01-05 ou 2030-01-05T19:00) optionnel
+    - rrule (ex. FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=12) optionnel, prioritaire
     - time_slot_id (optionnel)
+    - dry_run=1: aperçu (occurrences et conflits) sans rien créer
     """
     spot = get_object_or_404(Spot, id=spot_id)
     if request.method != 'POST':
@@ -1235,90 +1252,91 @@ def bulk_schedule_spot(request, spot_id):
         return JsonResponse({'ok': False, 'error': 'spot_not_validated'}, status=403)
 
     start_date_str = request.POST.get('start_date')
-    end_date_str = request.POST.get('end_date') or start_date_str
-    time_str = request.POST.get('broadcast_time')
-    days_csv = (request.POST.get('days') or '').strip()
+    end_date_str = request.POST.get('end_date')
+    count_str = (request.POST.get('count') or '').strip()
+    times_str = request.POST.get('broadcast_times') or request.POST.get('broadcast_time')
     time_slot_id_str = request.POST.get('time_slot_id')
+    dry_run = (request.POST.get('dry_run') or '').lower() in ('1', 'true', 'on')
 
-    if not start_date_str or not time_str:
+    if not start_date_str or not times_str:
         return JsonResponse({'ok': False, 'error': 'missing_params'}, status=400)
 
     try:
         start_d = parse_date(start_date_str)
-        end_d = parse_date(end_date_str)
-        if not start_d or not end_d:
+        end_d = parse_date(end_date_str) if end_date_str else None
+        if not start_d or (end_date_str and not end_d):
             raise ValueError('invalid_date')
-        if end_d < start_d:
-            raise ValueError('end_before_start')
-        # Parse heure
-        t = timezone.datetime.fromisoformat(f"1970-01-01T{time_str}:00").time() if len(time_str) == 5 else timezone.datetime.fromisoformat(f"1970-01-01T{time_str}").time()
-    except Exception:
+        options = {
+            'times': recurrence.parse_times(times_str),
+            'until': end_d,
+            'count': int(count_str) if count_str else None,
+            'weekdays': recurrence.parse_weekdays(request.POST.get('days')),
+        }
+        options.update(recurrence.parse_rrule(request.POST.get('rrule')))
+        # Sans fin explicite: le seul jour de début (comportement historique)
+        if options['until'] is None and not options['count']:
+            options['until'] = start_d
+        options['excluded_days'], options['excluded_slots'] = recurrence.parse_exclusions(request.POST.get('exclude_dates'))
+        occurrences = recurrence.expand(start_d, **options)
+    except recurrence.RecurrenceError as e:
+        return JsonResponse({'ok': False, 'error': e.code}, status=400)
+    except (ValueError, TypeError):
         return JsonResponse({'ok': False, 'error': 'invalid_datetime'}, status=400)
 
-    # Jours de semaine autorisés
-    days_map = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
-    selected_days = set()
-    if days_csv:
-        for part in days_csv.split(','):
-            key = part.strip().lower()
-            if key in days_map:
-                selected_days.add(days_map[key])
-    else:
-        selected_days = set(range(7))  # tous les jours
-
-    # Déterminer le créneau
+    # Déterminer le créneau (par heure si non imposé)
     selected_slot = None
     if time_slot_id_str:
         try:
             selected_slot = TimeSlot.objects.get(id=int(time_slot_id_str))
         except (ValueError, TimeSlot.DoesNotExist):
             selected_slot = None
-    selected_slot = _ensure_active_timeslot(selected_slot, t)
-
-    created = 0
-    conflicts = 0
-    with transaction.atomic():
-        cur = start_d
-        while cur <= end_d:
-            if cur.weekday() in selected_days:
-                try:
-                    SpotSchedule.objects.create(
-                        spot=spot,
-                        time_slot=selected_slot,
-                        broadcast_date=cur,
-                        broadcast_time=t,
-                        price=Decimal('0'),
-                        is_broadcasted=False,
-                    )
-                    created += 1
-                except IntegrityError:
-                    conflicts += 1
-            cur += timezone.timedelta(days=1)
-
-    if created > 0 and spot.status == 'approved':
-        spot.status = 'scheduled'
-        spot.save(update_fields=['status'])
 
-    # Émettre une mise à jour pour le dernier créneau si possible (indicatif)
-    try:
-        last_sched = spot.schedules.order_by('-broadcast_date', '-broadcast_time').first()
-        if last_sched:
-            _emit_planning_upsert(last_sched)
-    except Exception:
-        pass
-
-    # Historique
-    CampaignHistory.objects.create(
-        campaign=spot.campaign,
-        action='bulk_scheduled',
-        description=f'Programmations multiples: {created} créé(s), {conflicts} conflit(s).',
-        user=request.user,
+    candidates, conflict_list = recurrence.plan(
+        spot, occurrences, lambda t: _ensure_active_timeslot(selected_slot, t, create=not dry_run),
     )
+    if dry_run:
+        return JsonResponse({
+            'ok': True,
+            'dry_run': True,
+            'occurrences': len(occurrences),
+            'to_create': [
+                {'date': c.broadcast_date.isoformat(), 'time': c.broadcast_time.strftime('%H:%M')}
+                for c in candidates
+            ],
+            'conflicts': conflict_list,
+        })
+
+    with transaction.atomic():
+        # Capacité revérifiée sous verrou: `plan` a lu l'inventaire sans verrou
+        candidates, full = recurrence.admit(spot, candidates)
+        conflict_list += full
+        created_schedules = recurrence.apply(spot, candidates)
+        created = len(created_schedules)
+        # bulk_create n'émet pas de signaux: inventaire mis à jour en bloc
+        inventory.add_schedules(created_schedules)
+        progress.add_schedules(created_schedules)
+        # Conflits détectés + créneaux pris entre-temps (ignorés par la base)
+        conflicts = len(conflict_list) + len(candidates) - created
+
+        if created > 0 and spot.status == 'approved':
+            spot.status = 'scheduled'
+            spot.save(update_fields=['status'])
+
+        # Chaque créneau créé est publié au Planning après validation
+        planning_events.record_many(created_schedules)
+
+        # Historique
+        CampaignHistory.objects.create(
+            campaign=spot.campaign,
+            action='bulk_scheduled',
+            description=f'Programmations multiples: {created} créé(s), {conflicts} conflit(s).',
+            user=request.user,
+        )
 
     # Réponse adaptée: JSON pour AJAX, sinon redirection avec message
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     if is_ajax:
-        return JsonResponse({'ok': True, 'created': created, 'conflicts': conflicts})
+        return JsonResponse({'ok': True, 'created': created, 'conflicts': conflicts, 'conflict_list': conflict_list})
     else:
         messages.success(request, f"Programmations ajoutées: {created}, conflits: {conflicts}")
         return redirect('diffusion_spot_detail', spot_id=spot.id)
@@ -1349,10 +1367,19 @@ def planning(request):
         end_week = start_week + timezone.timedelta(days=7)
         schedules = schedules.filter(broadcast_date__gte=start_week, broadcast_date__lt=end_week).order_by('broadcast_date','broadcast_time')
 
+    # Jours affichés: abonnements temps réel correspondants
+    if view == 'day':
+        planning_dates = [today]
+    elif view == 'month':
+        planning_dates = [target_month_start + timezone.timedelta(days=i) for i in range((next_month_start - target_month_start).days)]
+    else:
+        planning_dates = [start_week + timezone.timedelta(days=i) for i in range(7)]
+
     ctx = _base_context(request.user)
     ctx.update({
         'view': view,
         'schedules': schedules,
+        'planning_dates': [d.isoformat() for d in planning_dates],
         'today': today,
         'week_days': [today - timezone.timedelta(days=today.weekday()) + timezone.timedelta(days=i) for i in range(7)] if view == 'week' else [],
     })
@@ -1438,14 +1465,22 @@ def planning_move(request):
         ).exclude(id=sched.id).select_related('spot').first()
         if conflict:
             return JsonResponse({'ok': False, 'error': 'schedule_conflict', 'conflict_with': getattr(conflict.spot, 'title', '')}, status=409)
-
     # Appliquer mise à jour
+    previous_date = sched.broadcast_date
     try:
         with transaction.atomic():
+            # Capacité publicitaire du créneau le jour cible (ligne verrouillée
+            # jusqu'à la validation)
+            if d != sched.broadcast_date:
+                full = _slot_full_response(request, sched.time_slot, d, spot.duration_seconds, as_json=True)
+                if full:
+                    return full
             sched.broadcast_date = d
             if t:
                 sched.broadcast_time = t
             sched.save(update_fields=['broadcast_date'] + (['broadcast_time'] if t else []))
+            # Notifier Planning (ancien et nouveau jour) après validation
+            _emit_planning_upsert(sched, previous_date=previous_date)
             if allow_extension and getattr(campaign, 'end_date', None) and d > campaign.end_date and can_override_user:
                 CampaignHistory.objects.create(
                     campaign=campaign,
@@ -1467,12 +1502,6 @@ def planning_move(request):
     except Exception as e:
         return JsonResponse({'ok': False, 'error': str(e)}, status=400)
 
-    # Notifier Planning
-    try:
-        _emit_planning_upsert(sched)
-    except Exception:
-        pass
-
     return JsonResponse({'ok': True, 'item': _planning_item_payload(sched)})
 
 
@@ -1500,14 +1529,16 @@ def planning_delete(request):
         return JsonResponse({'ok': False, 'error': 'already_broadcasted'}, status=422)
     try:
         spot = sched.spot
-        sched.delete()
-        # Historiser
-        CampaignHistory.objects.create(
-            campaign=spot.campaign,
-            action='deleted',
-            description=f"Programmation supprimée pour '{spot.title}'",
-            user=request.user,
-        )
+        with transaction.atomic():
+            planning_events.record(sched, 'remove')
+            sched.delete()
+            # Historiser
+            CampaignHistory.objects.create(
+                campaign=spot.campaign,
+                action='deleted',
+                description=f"Programmation supprimée pour '{spot.title}'",
+                user=request.user,
+            )
     except Exception as e:
         return JsonResponse({'ok': False, 'error': str(e)}, status=400)
     return JsonResponse({'ok': True})
@@ -1571,7 +1602,7 @@ def downloads_zip(request):
         for spot in spots:
             file_field = spot.video_file or spot.image_file
             file_path = getattr(file_field, 'path', None)
-            file_name = os.path.basename(getattr(file_field, 'name', str(spot.id)))
+            file_name = spot.media_name or os.path.basename(getattr(file_field, 'name', str(spot.id)))
             arcname = f"{spot.title[:50].replace(' ', '_')}_{file_name}"
             try:
                 if file_path and os.path.exists(file_path):
@@ -1596,11 +1627,20 @@ def download_spot_media(request, spot_id):
         spot = get_object_or_404(Spot, id=spot_id)
         file_field = spot.video_file or spot.image_file
         file_path = getattr(file_field, 'path', None)
-        file_name = os.path.basename(getattr(file_field, 'name', str(spot.id)))
+        # Nom déposé par le client plutôt que l'empreinte du stockage
+        file_name = spot.media_name or os.path.basename(getattr(file_field, 'name', str(spot.id)))
+        etag = file_field.storage.etag(file_field.name) if hasattr(file_field.storage, 'etag') else None
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
         if file_path and os.path.exists(file_path):
             f = open(file_path, 'rb')
-            resp = FileResponse(f)
-            resp['Content-Disposition'] = f'attachment; filename="{file_name}"'
+            resp = FileResponse(f, as_attachment=True, filename=file_name)
+            if etag:
+                # Contenu adressé par empreinte: immuable pour un nom donné
+                resp['ETag'] = etag
+                resp['Cache-Control'] = 'private, max-age=31536000, immutable'
             return resp
         # Fallback: si le stockage ne permet pas l'accès par chemin, rediriger vers l'URL du fichier
         file_url = getattr(file_field, 'url', '')
@@ -1614,6 +1654,7 @@ def download_spot_media(request, spot_id):
 
 
 @login_required
+@read_only
 def kpi_api(request):
     today = timezone.localdate()
     data = {
@@ -1629,6 +1670,34 @@ def kpi_api(request):
 
 
 @login_required
+def slot_availability_api(request):
+    """Temps d'antenne restant par créneau et par jour.
+
+    GET: start, end (YYYY-MM-DD, 7 jours par défaut), time_slot_id (optionnel),
+    seconds (optionnel: ajoute `fits` pour une durée de spot donnée).
+    """
+    today = timezone.localdate()
+    start = parse_date(request.GET.get('start') or '') or today
+    end = parse_date(request.GET.get('end') or '') or start + timezone.timedelta(days=6)
+    slots = TimeSlot.objects.filter(is_active=True)
+    slot_id = request.GET.get('time_slot_id')
+    if slot_id:
+        if not str(slot_id).isdigit():
+            return JsonResponse({'ok': False, 'error': 'invalid_time_slot'}, status=400)
+        slots = slots.filter(id=int(slot_id))
+    try:
+        seconds = int(request.GET['seconds']) if request.GET.get('seconds') else None
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'invalid_seconds'}, status=400)
+    rows = inventory.availability(start, end, slots=slots)
+    if seconds is not None:
+        for row in rows:
+            row['fits'] = not row['enforced'] or row['remaining_seconds'] >= seconds
+    return JsonResponse({'ok': True, 'availability': rows})
+
+
+@login_required
+@read_only
 def export_spots_csv(request):
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="spots_diffusion.csv"'
@@ -1651,6 +1720,7 @@ def export_spots_csv(request):
 
 
 @login_required
+@read_only
 def export_spots_xlsx(request):
     """Export Excel des spots (si openpyxl installé), sinon redirection CSV"""
     try:
@@ -1,13 +1,13 @@
 import json
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
-from .models import CoverageAssignment, Driver, Journalist
+from .models import CoverageAssignment, CoverageRequest, Driver, Journalist
+from .services import crew, search
 
 
 def _has_editorial_access(user) -> bool:
@@ -127,12 +127,7 @@ def api_journalists(request):
 
         qs = Journalist.objects.all()
         if q:
-            qs = qs.filter(
-                Q(name__icontains=q)
-                | Q(email__icontains=q)
-                | Q(phone__icontains=q)
-                | Q(specialties__icontains=q)
-            )
+            qs = qs.filter(search.text_match("journalist", q) | search.fuzzy_match("phone", q))
         if status:
             qs = qs.filter(status=status)
 
@@ -271,7 +266,7 @@ def api_drivers(request):
 
         qs = Driver.objects.all()
         if q:
-            qs = qs.filter(Q(name__icontains=q) | Q(phone__icontains=q))
+            qs = qs.filter(search.text_match("driver", q) | search.fuzzy_match("phone", q))
         if status:
             qs = qs.filter(status=status)
 
@@ -382,3 +377,15 @@ def api_driver_detail(request, driver_id):
         d.save()
 
     return JsonResponse({"ok": True, "item": _driver_to_card(d)})
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_coverage_recommendations(request, coverage_id):
+    if not _has_editorial_access(request.user):
+        return _api_forbidden()
+
+    cv = CoverageRequest.objects.filter(id=coverage_id).first()
+    if not cv:
+        return JsonResponse({"ok": False, "error": "not_found"}, status=404)
+    return JsonResponse({"ok": True, **crew.recommend(cv)})
@@ -0,0 +1,103 @@
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from .models import Campaign, ChunkedUpload
+from .services import uploads
+
+
+def _parse_body(request):
+    if request.content_type and "application/json" in request.content_type:
+        try:
+            return json.loads((request.body or b"{}").decode("utf-8"))
+        except Exception:
+            return {}
+    return request.POST
+
+
+def _upload_payload(upload):
+    return {
+        "ok": True,
+        "id": str(upload.id),
+        "offset": upload.received_bytes,
+        "size": upload.total_size,
+        "status": upload.status,
+        "chunk_size": uploads.CHUNK_SIZE,
+    }
+
+
+def _error(exc):
+    data = {"ok": False, "error": exc.code}
+    if exc.offset is not None:
+        data["offset"] = exc.offset
+    resp = JsonResponse(data, status=exc.status)
+    if exc.offset is not None:
+        resp["Upload-Offset"] = str(exc.offset)
+    return resp
+
+
+@login_required
+@require_http_methods(["POST"])
+def upload_create(request):
+    """Ouvre une session de téléversement reprenable."""
+    data = _parse_body(request)
+    campaign = None
+    campaign_id = str(data.get("campaign_id") or "").strip()
+    if campaign_id:
+        try:
+            campaign = Campaign.objects.filter(id=campaign_id).first()
+        except ValidationError:
+            campaign = None
+        if not campaign:
+            return JsonResponse({"ok": False, "error": "campaign_not_found"}, status=404)
+        if request.user.is_client() and campaign.client_id != request.user.id:
+            return JsonResponse({"ok": False, "error": "forbidden"}, status=403)
+    try:
+        upload = uploads.open_upload(
+            request.user,
+            filename=data.get("filename") or "",
+            total_size=data.get("size"),
+            target_field=data.get("field") or "video_file",
+            campaign=campaign,
+        )
+    except uploads.UploadError as exc:
+        return _error(exc)
+    return JsonResponse(_upload_payload(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "HEAD", "PATCH", "DELETE"])
+def upload_detail(request, upload_id):
+    """HEAD/GET: offset courant. PATCH: ajout d'un morceau. DELETE: abandon."""
+    if request.method == "DELETE":
+        uploads.cancel_upload(upload_id, request.user)
+        return HttpResponse(status=204)
+
+    if request.method == "PATCH":
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return JsonResponse({"ok": False, "error": "missing_offset"}, status=400)
+        try:
+            upload = uploads.append_chunk(
+                upload_id,
+                request.user,
+                offset,
+                request,
+                checksum=request.headers.get("Upload-Checksum"),
+            )
+        except uploads.UploadError as exc:
+            return _error(exc)
+    else:
+        upload = ChunkedUpload.objects.filter(id=upload_id, user=request.user).first()
+        if not upload:
+            return JsonResponse({"ok": False, "error": "not_found"}, status=404)
+
+    resp = JsonResponse(_upload_payload(upload))
+    resp["Upload-Offset"] = str(upload.received_bytes)
+    resp["Upload-Length"] = str(upload.total_size)
+    resp["Cache-Control"] = "no-store"
+    return resp
@@ -58,6 +58,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
     'spot.apps.SpotConfig',
     'crispy_forms',
     'crispy_tailwind',
@@ -73,6 +74,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'spot.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'spot.middleware.DiffusionStatusValidationMiddleware',
     'spot.middleware.AdminRestrictionMiddleware',
@@ -117,6 +119,31 @@ DATABASES = {
     }
 }
 
+# Réplique en lecture pour les tableaux de bord, bilans et exports
+# (voir spot/db_router.py). En local, deux bases SQLite ou PostgreSQL:
+# DATABASE_REPLICA_NAME (et DATABASE_REPLICA_HOST/PORT au besoin).
+def replica_database(primary):
+    name = os.environ.get('DATABASE_REPLICA_NAME', '').strip()
+    host = os.environ.get('DATABASE_REPLICA_HOST', '').strip()
+    if not (name or host):
+        return None
+    return dict(
+        primary,
+        NAME=name or primary['NAME'],
+        HOST=host or primary.get('HOST', ''),
+        PORT=os.environ.get('DATABASE_REPLICA_PORT', '').strip() or primary.get('PORT', ''),
+        # Tests: la réplique est la base de test principale
+        TEST={'MIRROR': 'default'},
+    )
+
+
+_replica = replica_database(DATABASES['default'])
+if _replica:
+    DATABASES['replica'] = _replica
+DATABASE_ROUTERS = ['spot.db_router.ReplicaRouter']
+# Durée (s) pendant laquelle un utilisateur lit sur la base principale après une écriture
+SPOT_REPLICA_STICKY_SECONDS = int(os.environ.get('SPOT_REPLICA_STICKY_SECONDS', '15'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -174,6 +201,19 @@ LOGOUT_REDIRECT_URL = '/'
 # Email settings (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Téléversements reprenables des médias (morceaux + empreinte SHA-256)
+SPOT_UPLOAD_CHUNK_SIZE = int(os.environ.get('SPOT_UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+SPOT_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+SPOT_UPLOAD_STAGING_DIR = os.environ.get('SPOT_UPLOAD_STAGING_DIR', os.path.join(BASE_DIR, 'tmp', 'uploads'))
+# Médias des spots dédupliqués par empreinte SHA-256 (media/cas/ab/cd/<empreinte>)
+SPOT_MEDIA_CONTENT_ADDRESSED = _env_truthy('SPOT_MEDIA_CONTENT_ADDRESSED', '1')
+# Rétention: archives JSONL compressées des lignes expirées
+# (`manage.py apply_retention`; politiques surchargées par SPOT_RETENTION)
+SPOT_ARCHIVE_DIR = os.environ.get('SPOT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archives'))
+# Relais du planning: `manage.py relay_planning_events` (processus dédié).
+# Le fil dans le processus web reste à activer explicitement (développement)
+PLANNING_RELAY_IN_PROCESS = _env_truthy('PLANNING_RELAY_IN_PROCESS', '0')
+
 OFFSITE_NOTIFICATIONS = {
     'enabled': _env_truthy('OFFSITE_NOTIFICATIONS_ENABLED', '1'),
     'dedupe_minutes': int(os.environ.get('OFFSITE_NOTIFICATIONS_DEDUPE_MINUTES', '5')),
@@ -238,6 +278,16 @@ CHATBOT_KNOWLEDGE_DIR = os.environ.get('CHATBOT_KNOWLEDGE_DIR', os.path.join(BAS
 CHATBOT_ENABLE_PERSISTENT_MEMORY = bool(int(os.environ.get('CHATBOT_ENABLE_PERSISTENT_MEMORY', '1')))
 CHATBOT_MEMORY_PATH = os.environ.get('CHATBOT_MEMORY_PATH', os.path.join(BASE_DIR, 'media', 'chatbot_memory.jsonl'))
 
+# Cache partagé (Redis si REDIS_URL, sinon mémoire locale du processus)
+if os.environ.get('REDIS_URL', '').strip():
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'].strip(),
+            'KEY_PREFIX': 'bf1',
+        }
+    }
+
 # Channels (dev: mémoire; prod: Redis via env REDIS_URL si channels_redis est installé)
 if _channels_enabled and _channels_available:
     _redis_url = os.environ.get('REDIS_URL', '').strip()
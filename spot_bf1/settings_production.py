@@ -40,6 +40,9 @@ else:
             'PORT': os.environ.get('DATABASE_PORT', '5432'),
         }
     }
+_replica = replica_database(DATABASES['default'])
+if _replica:
+    DATABASES['replica'] = _replica
 
 _force_https = os.environ.get('DJANGO_FORCE_HTTPS', '').strip().lower() in ('1', 'true', 'yes')
 _is_localhost = any(h in ('localhost', '127.0.0.1', '0.0.0.0', '[::1]') for h in ALLOWED_HOSTS)
@@ -153,6 +156,13 @@ if _channels_enabled and _channels_available:
             'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
         }
 
+# Relais du planning: processus dédié (`relay_planning_events`) par défaut.
+# Avec la couche mémoire, seul le processus web atteint ses WebSockets.
+PLANNING_RELAY_IN_PROCESS = os.environ.get(
+    'PLANNING_RELAY_IN_PROCESS',
+    '1' if _channels_enabled and not (_redis_url and _has_channels_redis) else '0',
+).strip().lower() in {'1', 'true', 'yes', 'on'}
+
 # Logging path helper
 def get_log_path(filename):
     log_dir = os.environ.get('LOG_DIR', str(BASE_DIR / 'logs'))